@@ -0,0 +1,266 @@
+import re
+import sys
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from pine_lint import BLOCK_KEYWORDS, Diagnostic, Token, lex, lint
+
+# Deterministic fixes for the mechanical mistakes the repair prompt keeps warning about:
+# braces, `return`, the `function` keyword, list literals, Python operators/literals/comments,
+# smart or double quotes, a missing `//@version=5` and a missing declaration.
+# Error classes are pine_lint's codes (plus a few compiler reasons it cannot see); each fix is
+# a source rewrite that keeps the script's meaning, and anything it is not sure about is left
+# for the LLM. A script fixed here is recompiled without spending a chat completion on it.
+
+MAX_PASSES = 50  # one fix per pass, relinting in between
+DEFAULT_TITLES = {"indicator": "Indicator", "library": "Library", "strategy": "Strategy"}
+SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+PYTHON_LITERALS = {"True": "true", "False": "false", "None": "na", "elif": "else if"}
+OPERATORS = {"&&": "and", "||": "or", "!": "not "}
+
+Fix = Callable[[List[str], Diagnostic], Optional[List[str]]]
+
+
+class AutoFix(NamedTuple):
+    source: str
+    fixes: List[str]  # codes of the fixes applied, in order
+    clean: bool  # pine_lint finds nothing left
+
+
+def autofix(source: str, reason: Optional[str] = None) -> AutoFix:
+    """Applies every safe fix it can, relinting after each one."""
+    fixes: List[str] = []
+    for pattern, code, fix in REASON_FIXES:
+        if reason and pattern.search(reason):
+            fixed = fix(source)
+            if fixed != source:
+                source = fixed
+                fixes.append(code)
+    for _ in range(MAX_PASSES):
+        diagnostics = lint(source)
+        if not diagnostics:
+            return AutoFix(source, fixes, True)
+        for diagnostic in diagnostics:
+            fix = FIXES.get(diagnostic.code)
+            lines = fix(source.split("\n"), diagnostic) if fix else None
+            if lines is not None and "\n".join(lines) != source:
+                source = "\n".join(lines)
+                fixes.append(diagnostic.code)
+                break
+        else:
+            break  # nothing left that can be fixed safely
+    return AutoFix(source, fixes, not lint(source))
+
+
+def fix_script(source: str, reason: Optional[str] = None) -> Optional[str]:
+    """The rewritten source, or None if no fix applied."""
+    result = autofix(source, reason)
+    return result.source if result.fixes else None
+
+
+# -- Fixes, by pine_lint code; each returns the edited lines or None to give up --
+
+
+def _fix_version(lines: List[str], diagnostic: Diagnostic) -> Optional[List[str]]:
+    if diagnostic.message.startswith("missing"):
+        return ["//@version=5"] + lines
+    number = diagnostic.line - 1
+    line = lines[number]
+    if "on a line by itself" in diagnostic.message:
+        rest = line[: diagnostic.column - 1].rstrip()
+        return ["//@version=5"] + lines[:number] + [rest] + lines[number + 1 :]
+    return lines[:number] + [re.sub(r"//\s*@version\s*=\s*\d+", "//@version=5", line)] + lines[number + 1 :]
+
+
+def _fix_declaration(lines: List[str], diagnostic: Diagnostic) -> Optional[List[str]]:
+    if not diagnostic.message.startswith("missing"):
+        return None  # which of several declarations is the real one is not ours to decide
+    for number, line in enumerate(lines):
+        if re.match(r"study\s*\(", line):  # the v4 name of `indicator`
+            return lines[:number] + ["indicator" + line[len("study") :]] + lines[number + 1 :]
+    source = "\n".join(lines)
+    kind = "indicator"
+    if re.search(r"^export\s", source, re.M):
+        kind = "library"
+    elif re.search(r"\bstrategy\.(entry|order|close|exit)\s*\(", source):
+        kind = "strategy"
+    after = next((n + 1 for n, line in enumerate(lines) if re.match(r"\s*//\s*@version", line)), 0)
+    return lines[:after] + [f"{kind}('{DEFAULT_TITLES[kind]}')"] + lines[after:]
+
+
+def _fix_braces(lines: List[str], diagnostic: Diagnostic) -> Optional[List[str]]:
+    number = diagnostic.line - 1
+    line = lines[number].rstrip()
+    position = diagnostic.column - 1
+    if line[position] == "}":
+        rest = line[position + 1 :].strip()
+        if line[:position].strip():
+            return None  # `}` closing something mid-line, e.g. a map literal
+        opener = _brace_opener(lines, diagnostic)
+        if opener is not None and _block_header(lines, opener) is None:
+            return None  # closes a `{` that was kept because it opens a literal
+        if not rest:
+            return lines[:number] + lines[number + 1 :]
+        return lines[:number] + [line[:position] + rest] + lines[number + 1 :]  # `} else {`
+    header = _block_header(lines, (diagnostic.line, diagnostic.column))
+    if header is None:
+        return None
+    return lines[:number] + [header] + lines[number + 1 :]
+
+
+def _block_header(lines: List[str], brace: Tuple[int, int]) -> Optional[str]:
+    """The line of the `{` at (line, column) without it, if that `{` opens a block; None for a literal."""
+    line = lines[brace[0] - 1].rstrip()
+    position = brace[1] - 1
+    if position != len(line) - 1:
+        return None  # `{` that does not open a block
+    header = line[:position].rstrip()
+    if _is_function_header(header):
+        return header + " =>"
+    if not re.match(r"\s*(?:else\b|(?:\w+\s*:?=\s*)?(?:if|for|while|switch)\b)", header):
+        return None  # `x = {`: a literal, not a block
+    return header
+
+
+def _brace_opener(lines: List[str], diagnostic: Diagnostic) -> Optional[Tuple[int, int]]:
+    """
+    Where the `{` closed by the `}` at the diagnostic is, or None if it has none left, i.e. it
+    closes a block whose `{` an earlier pass already removed.
+    """
+    open_braces: List[Tuple[int, int]] = []
+    for line in lex("\n".join(lines)):
+        for token in line.tokens:
+            if token.text == "{":
+                open_braces.append((token.line, token.column))
+            elif token.text == "}":
+                opener = open_braces.pop() if open_braces else None
+                if (token.line, token.column) == (diagnostic.line, diagnostic.column):
+                    return opener
+    return None
+
+
+def _fix_return(lines: List[str], diagnostic: Diagnostic) -> Optional[List[str]]:
+    number = diagnostic.line - 1
+    line = lines[number]
+    start = diagnostic.column - 1
+    rest = line[start + len("return") :].lstrip().rstrip(";")
+    if not rest.strip():
+        return lines[:number] + lines[number + 1 :]
+    return lines[:number] + [line[:start] + rest] + lines[number + 1 :]
+
+
+def _fix_function_keyword(lines: List[str], diagnostic: Diagnostic) -> Optional[List[str]]:
+    number = diagnostic.line - 1
+    line = lines[number]
+    start = diagnostic.column - 1
+    header = line[:start] + line[start + len("function") :].lstrip()
+    if header.rstrip().endswith(")"):
+        header = header.rstrip() + " =>"
+    return lines[:number] + [header] + lines[number + 1 :]
+
+
+def _fix_list(lines: List[str], diagnostic: Diagnostic) -> Optional[List[str]]:
+    tokens = [token for line in lex("\n".join(lines)) for token in line.tokens]
+    start = next((n for n, t in enumerate(tokens) if (t.line, t.column) == (diagnostic.line, diagnostic.column)), None)
+    if start is None or start + 1 >= len(tokens) or tokens[start + 1].text == "]":
+        return None  # an empty list has no element type to build an array from
+    depth = 0
+    for token in tokens[start:]:
+        if token.text == "[" and depth > 0 and token is not tokens[start]:
+            return None  # a list of lists has no array.from equivalent
+        depth += token.text in ("(", "[")
+        depth -= token.text in (")", "]")
+        if depth == 0:
+            if token.text != "]":
+                return None
+            # replace the closing bracket first, so the opening one's column stays valid
+            edited = _replace(lines, token, "]", ")")
+            return _replace(edited, tokens[start], "[", "array.from(")
+    return None
+
+
+def _fix_python(lines: List[str], diagnostic: Diagnostic) -> Optional[List[str]]:
+    number = diagnostic.line - 1
+    line = lines[number]
+    start = diagnostic.column - 1
+    word = re.match(r"&&|\|\||!|#|\w+|:", line[start:])
+    if word is None:
+        return None
+    text = word.group()
+    if text in OPERATORS:
+        replacement = OPERATORS[text]
+        if text == "!" and line[start + 1 : start + 2] == " ":
+            replacement = "not"
+    elif text in PYTHON_LITERALS:
+        replacement = PYTHON_LITERALS[text]
+    elif text == "#":
+        replacement = "//"
+    elif text == ":" and not line[start + 1 :].strip():
+        return lines[:number] + [line[:start].rstrip()] + lines[number + 1 :]
+    else:
+        return None  # `def`, `class`, `lambda` and imports need rewriting, not replacing
+    return lines[:number] + [line[:start] + replacement + line[start + len(text) :]] + lines[number + 1 :]
+
+
+def _fix_character(lines: List[str], diagnostic: Diagnostic) -> Optional[List[str]]:
+    number = diagnostic.line - 1
+    line = lines[number]
+    fixed = line.translate(SMART_QUOTES)
+    if fixed == line:
+        return None
+    return lines[:number] + [fixed] + lines[number + 1 :]
+
+
+# -- Fixes keyed on compiler reasons pine_lint does not produce --
+
+
+def _single_quotes(source: str) -> str:
+    """Smart quotes made plain, and double-quoted strings without `'` in them single-quoted."""
+    source = source.translate(SMART_QUOTES)
+    edits = [
+        token
+        for line in lex(source)
+        for token in line.tokens
+        if token.kind == "string" and token.text.startswith('"') and "'" not in token.text and "\n" not in token.text
+    ]
+    lines = source.split("\n")
+    for token in reversed(edits):
+        lines = _replace(lines, token, token.text, "'" + token.text[1:-1] + "'")
+    return "\n".join(lines)
+
+
+def _replace(lines: List[str], token: Token, old: str, new: str) -> List[str]:
+    number = token.line - 1
+    line = lines[number]
+    start = token.column - 1
+    assert line[start : start + len(old)] == old
+    return lines[:number] + [line[:start] + new + line[start + len(old) :]] + lines[number + 1 :]
+
+
+def _is_function_header(header: str) -> bool:
+    """`name(params)` on its own, as opposed to `if (cond)` or a call."""
+    match = re.match(r"\s*(?:export\s+|method\s+)?([A-Za-z_][\w.]*)\s*\(.*\)$", header)
+    return bool(match) and match[1] not in BLOCK_KEYWORDS
+
+
+FIXES: Dict[str, Fix] = {
+    "P001": _fix_version,
+    "P002": _fix_declaration,
+    "P003": _fix_braces,
+    "P004": _fix_return,
+    "P005": _fix_function_keyword,
+    "P006": _fix_list,
+    "P007": _fix_python,
+    "P010": _fix_character,
+}
+REASON_FIXES = [
+    (re.compile(r"""no viable alternative at character '["“”‘’]'"""), "quotes", _single_quotes),
+]
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        with open(path, "r", encoding="utf-8") as f:
+            result = autofix(f.read())
+        print(f"{path}: {', '.join(result.fixes) or 'no fixes'}{'' if result.clean else ' (still failing)'}")
+        if result.fixes:
+            print(result.source)
@@ -0,0 +1,52 @@
+import random
+import string
+import time
+from collections import Counter
+from typing import Callable
+
+from nonsense_generator import Generator
+
+# Time per Generator.script() with the block-drawn TextSource against the old per-character
+# `random.choice` words, plus a check that words still come out uniform over letters and lengths.
+
+SCRIPTS = 2_000
+WORDS = 200_000
+SEED = 1
+
+
+class CharacterGenerator(Generator):
+    """The Generator as it was: one `random.choice` per letter."""
+
+    def random_word(self) -> str:
+        return "".join(random.choice(string.ascii_lowercase) for _ in range(random.randint(3, 7)))
+
+    def random_sentence(self, min_words: int = 3, max_words: int = 7) -> str:
+        return " ".join(self.random_word() for _ in range(random.randint(min_words, max_words)))
+
+
+def per_script(make: Callable[[], Generator]) -> float:
+    """Milliseconds per script."""
+    random.seed(SEED)
+    started = time.perf_counter()
+    for _ in range(SCRIPTS):
+        make().script()
+    return (time.perf_counter() - started) / SCRIPTS * 1e3
+
+
+def distribution():
+    random.seed(SEED)
+    generator = Generator()
+    words = [generator.random_word() for _ in range(WORDS)]
+    lengths = Counter(len(word) for word in words)
+    letters = Counter("".join(words))
+    total = sum(letters.values())
+    print("word lengths:", " ".join(f"{length}:{lengths[length] / WORDS:.3f}" for length in sorted(lengths)))
+    print(f"letter frequency: min {min(letters.values()) / total:.4f}, max {max(letters.values()) / total:.4f} (uniform {1 / 26:.4f})")
+
+
+if __name__ == "__main__":
+    old = per_script(CharacterGenerator)
+    new = per_script(Generator)
+    print(f"{'per-character':<14} {old:8.3f} ms/script")
+    print(f"{'TextSource':<14} {new:8.3f} ms/script  ({old / new:.2f}x)")
+    distribution()
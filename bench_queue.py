@@ -0,0 +1,77 @@
+import os
+import random
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from storage import InstructionQueue, Store
+
+# Queue maintenance cost per item as the PINE queue grows, for:
+# - the old db.json model (rebuild the list without the item: `[n for n in PINE if ...]`)
+# - InstructionQueue (in-memory, hash keyed)
+# - Store (SQLite, keyed and indexed)
+# The old model is only measured up to LIST_LIMIT items, past that it takes minutes per size.
+
+SIZES = [1_000, 10_000, 100_000, 500_000]
+OPERATIONS = 1_000
+LIST_LIMIT = 10_000
+
+
+def make_items(count: int) -> List[Dict[str, str]]:
+    return [{"instruction": f"instruction {n}", "completion": f"//@version=5\nindicator('{n}')"} for n in range(count)]
+
+
+def per_op(run: Callable[[], None], operations: int) -> float:
+    """Microseconds per operation."""
+    started = time.perf_counter()
+    run()
+    return (time.perf_counter() - started) / operations * 1e6
+
+
+def bench_list(items: List[Dict[str, str]], targets: List[str]) -> float:
+    pine = list(items)
+
+    def run():
+        nonlocal pine
+        for instruction in targets:
+            pine = [n for n in pine if n["instruction"] != instruction]
+
+    return per_op(run, len(targets))
+
+
+def bench_queue(items: List[Dict[str, str]], targets: List[str]) -> float:
+    queue = InstructionQueue(items)
+
+    def run():
+        for instruction in targets:
+            if instruction in queue:
+                queue.discard(instruction)
+            if queue:
+                queue.push(queue.popleft())
+
+    return per_op(run, len(targets))
+
+
+def bench_store(items: List[Dict[str, str]], targets: List[str]) -> float:
+    with tempfile.TemporaryDirectory() as directory:
+        store = Store(os.path.join(directory, "bench.sqlite"))
+        store.add_pending(items)
+
+        def run():
+            for instruction in targets:
+                store.mark_failed({"instruction": instruction, "completion": "", "error": "x", "trycount": 0})
+                store.mark_successful(instruction, "")
+
+        result = per_op(run, len(targets))
+        store.close()
+    return result
+
+
+if __name__ == "__main__":
+    random.seed(0)
+    print(f"{'items':>8} {'list (us/op)':>14} {'queue (us/op)':>14} {'store (us/op)':>14}")
+    for size in SIZES:
+        items = make_items(size)
+        targets = [item["instruction"] for item in random.sample(items, min(OPERATIONS, size))]
+        listed = f"{bench_list(items, targets):14.1f}" if size <= LIST_LIMIT else f"{'-':>14}"
+        print(f"{size:>8} {listed} {bench_queue(items, targets):14.2f} {bench_store(items, targets):14.1f}")
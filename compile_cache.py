@@ -0,0 +1,128 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# Disk-backed cache of pine-facade compile results, keyed by a hash of the normalized source,
+# so code that was already checked (give or take whitespace and comments) is never sent again.
+
+# Configuration
+CACHE_FILE = "compile_cache.sqlite"
+CACHE_SIZE = 200_000  # entries kept before the least recently used are evicted
+MAX_AGE_DAYS = 30  # results older than this are re-checked, the compiler moves on
+COMPILER_TAG = "pine-facade/v5"  # bump to invalidate every stored result at once
+
+STRING_OR_COMMENT = re.compile(r"""'(?:\\.|[^'\\\n])*'|"(?:\\.|[^"\\\n])*"|//.*""")
+
+
+def _drop_comment(match: "re.Match[str]") -> str:
+    text = match.group(0)
+    if text.startswith("//") and not text.startswith("//@version"):
+        return ""
+    return text
+
+
+def normalize_source(source: str) -> str:
+    """
+    Strips comments (but not the `//@version` annotation), trailing whitespace and blank lines.
+    Leading indentation is kept: it is part of Pine's block structure.
+    """
+    lines = (STRING_OR_COMMENT.sub(_drop_comment, line).rstrip() for line in source.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def source_key(source: str) -> str:
+    """Content address of a script: sha256 of its normalized source and the compiler tag."""
+    normalized = normalize_source(source)
+    return hashlib.sha256(f"{COMPILER_TAG}\n{normalized}".encode("utf-8")).hexdigest()
+
+
+class CompileCache:
+    """LRU-bounded map of normalized-source hash -> (success, reason, compiler, checked_at)."""
+
+    def __init__(self, path: str = CACHE_FILE, max_entries: int = CACHE_SIZE, max_age_days: float = MAX_AGE_DAYS):
+        """Opens (or creates) the cache database.
+
+        :param path: The SQLite file to keep results in.
+        :param max_entries: How many results to keep before evicting the least recently used.
+        :param max_age_days: Results older than this are treated as missing.
+        """
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                success INTEGER NOT NULL,
+                reason TEXT,
+                compiler TEXT NOT NULL,
+                checked_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self._db.commit()
+        (self._count,) = self._db.execute("SELECT COUNT(*) FROM results").fetchone()
+
+    def get(self, source: str) -> Optional[Dict[str, Any]]:
+        """Returns the cached compile response for `source`, or None if it has to be checked."""
+        key = source_key(source)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT success, reason, compiler, checked_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[3] > self.max_age:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE results SET last_used = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+        success, reason, compiler, checked_at = row
+        return {
+            "success": bool(success),
+            "reason": reason,
+            "compiler": compiler,
+            "checked_at": checked_at,
+            "cached": True,
+        }
+
+    def put(self, source: str, response: Dict[str, Any]):
+        """Stores a compiler response; anything without a `success` verdict is not cached."""
+        if "success" not in response:
+            return
+        reason = response.get("reason")
+        reason = None if reason is None else str(reason)
+        now = time.time()
+        row = (int(bool(response["success"])), reason, COMPILER_TAG, now, now, source_key(source))
+        with self._lock:
+            updated = self._db.execute(
+                "UPDATE results SET success = ?, reason = ?, compiler = ?, checked_at = ?, last_used = ? WHERE key = ?",
+                row,
+            ).rowcount
+            if not updated:
+                self._db.execute(
+                    "INSERT INTO results (success, reason, compiler, checked_at, last_used, key) VALUES (?, ?, ?, ?, ?, ?)",
+                    row,
+                )
+                self._count += 1
+                self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        if self._count > self.max_entries:
+            excess = self._count - self.max_entries
+            self._db.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_used LIMIT ?)", (excess,)
+            )
+            self._count -= excess
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -1,28 +1,330 @@
-
-#  pu the successful entrties here, and this will convver them to jsonl that can be used tto fine tune a model,..
+#  turns the Successful entries into jsonl that can be used tto fine tune a model,..
 # the point of this is if you can create synthetic data en masse, with tons of different instructions and completions that might exist...
 # you caqn use this tool to repair any synthetic data to ensure it compiles, hen use 100% compiling coode o fine une, or create beer snthettic data.
+#
+# entries are streamed straight out of the dataset store (db.sqlite, imported from db.json on first use)
+# and written one line at a time, rotating to a new shard by size or line count, optionally gzipped,
+# so memory stays flat however big the dataset gets.
+# records are sized with the local token estimate: ones over MAX_TOKENS are dropped (or split),
+# and with --bucket each length band goes to its own file, so a batch drawn from one file pads
+# to similar lengths. a length histogram is written next to the output either way.
 
-data = [   ]
-
+import argparse
+import bisect
+import gzip
 import json
-def convert_to_jsonl(data):
-    jsonl_data = ""
+import os
+import re
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from storage import DB_FILE, LEGACY_DB_FILE, open_store
+from tokens import estimate_message_tokens
+
+# Configuration
+OUTPUT = "pine.jsonl"  # single file, or the shard name pattern base: pine-00000.jsonl, pine-00001.jsonl, ...
+SHARD_BYTES = 0  # rotate once a shard holds this many (uncompressed) bytes, 0 for no limit
+SHARD_LINES = 0  # rotate once a shard holds this many lines, 0 for no limit
+SYSTEM_PROMPT = "You are a Pine Script coder."
+MAX_TOKENS = 4096  # the fine-tuning context; longer records are dropped or split
+LENGTH_BANDS = (256, 512, 1024, 2048, 4096)  # upper token bounds of the length buckets
+OVERSIZE = "drop"  # what to do with records over MAX_TOKENS: drop, split or keep
+HEADER = re.compile(r"^(?:indicator|library|strategy)\s*\(")
+
+
+def to_messages(item: Dict[str, Any]) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": item["instruction"]},
+        {"role": "assistant", "content": item["completion"]}
+    ]
+
+
+def to_record(item: Dict[str, Any]) -> str:
+    """One fine-tuning line for an instruction/completion pair."""
+    return json.dumps({"messages": to_messages(item)}) + "\n"
+
+
+def record_tokens(item: Dict[str, Any]) -> int:
+    """Approximate tokens of the record, as the fine-tuning job will count them."""
+    return estimate_message_tokens(to_messages(item))
+
+
+def split_item(item: Dict[str, Any], max_tokens: int = MAX_TOKENS) -> List[Dict[str, Any]]:
+    """
+    Splits an oversized completion at top-level statements into parts that each fit `max_tokens`.
+    Every part repeats the script's header (`//@version=5` up to the declaration), so each one
+    still reads as a script, but parts need not compile on their own. Empty if a single
+    top-level statement is already too long.
+    """
+    lines = item["completion"].splitlines()
+    end = next((n + 1 for n, line in enumerate(lines) if HEADER.match(line)), 0)
+    header, body = lines[:end], lines[end:]
+    statements: List[List[str]] = []
+    for line in body:
+        if not statements or (line[:1].strip() and not line.startswith("//")):
+            statements.append([])
+        statements[-1].append(line)
+
+    parts: List[List[str]] = []
+    for statement in statements:
+        if parts and _fits(item, header + parts[-1] + statement, len(parts) + 1, max_tokens):
+            parts[-1].extend(statement)
+        elif _fits(item, header + statement, len(parts) + 2, max_tokens):
+            parts.append(list(statement))
+        else:
+            return []
+    return [
+        dict(item, instruction=_part_instruction(item, number, len(parts)), completion="\n".join(header + part))
+        for number, part in enumerate(parts, 1)
+    ]
+
+
+def _part_instruction(item: Dict[str, Any], number: int, count: int) -> str:
+    return f"{item['instruction']}\n\n(part {number} of {count})"
+
+
+def _fits(item: Dict[str, Any], lines: List[str], count: int, max_tokens: int) -> bool:
+    part = dict(item, instruction=_part_instruction(item, count, count), completion="\n".join(lines))
+    return record_tokens(part) <= max_tokens
+
+
+def convert_to_jsonl(data: Iterable[Dict[str, Any]]) -> str:
+    """the whole jsonl as one string, for small in-memory lists"""
+    return "".join(to_record(item) for item in data)
+
+
+class ShardWriter:
+    """
+    Writes lines to `path`, or to numbered shards of it once `max_bytes` / `max_lines` is set.
+    Each shard is written to a `.tmp` file and renamed into place when it is complete.
+    """
+
+    def __init__(self, path: str = OUTPUT, max_bytes: int = SHARD_BYTES, max_lines: int = SHARD_LINES, compress: bool = False):
+        """Sets up the writer; nothing is created until the first line.
+
+        :param path: The output file, e.g. `pine.jsonl`; shards are named `pine-00000.jsonl` and so on.
+        :param max_bytes: Uncompressed bytes per shard, 0 for no limit.
+        :param max_lines: Lines per shard, 0 for no limit.
+        :param compress: gzip each file and add `.gz` to its name.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_lines = max_lines
+        self.compress = compress
+        self.sharded = bool(max_bytes or max_lines)
+        self.files: List[str] = []
+        self.lines = 0
+        self._file: Optional[IO[bytes]] = None
+        self._name = ""
+        self._bytes = 0
+        self._lines = 0
+
+    def _shard_name(self) -> str:
+        name = self.path
+        if self.sharded:
+            stem, extension = os.path.splitext(self.path)
+            name = f"{stem}-{len(self.files):05d}{extension}"
+        return f"{name}.gz" if self.compress else name
+
+    def _open(self):
+        self._name = self._shard_name()
+        tmp = f"{self._name}.tmp"
+        self._file = gzip.open(tmp, "wb") if self.compress else open(tmp, "wb")
+        self._bytes = self._lines = 0
+
+    def _finish(self):
+        if self._file is None:
+            return
+        self._file.close()
+        os.replace(f"{self._name}.tmp", self._name)
+        self.files.append(self._name)
+        self._file = None
+
+    def write(self, line: str):
+        data = line.encode("utf-8")
+        full = (self.max_bytes and self._bytes + len(data) > self.max_bytes) or (self.max_lines and self._lines >= self.max_lines)
+        if self._file is not None and self._lines and full:
+            self._finish()
+        if self._file is None:
+            self._open()
+        self._file.write(data)
+        self._bytes += len(data)
+        self._lines += 1
+        self.lines += 1
+
+    def close(self) -> List[str]:
+        """Completes the last shard and returns every file written."""
+        if not self.files and self._file is None:
+            self._open()  # an empty dataset still produces an (empty) output file
+        self._finish()
+        return self.files
+
+    def __enter__(self) -> "ShardWriter":
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        if kind is None:
+            self.close()
+        elif self._file is not None:
+            # leave no half-written shard behind under a final name
+            self._file.close()
+            os.remove(f"{self._name}.tmp")
+
+
+class LengthHistogram:
+    """Record counts and token totals per length band, and how much padding bucketing saves."""
+
+    def __init__(self, bands: Iterable[int] = LENGTH_BANDS):
+        self.bands = sorted(bands)
+        size = len(self.bands) + 1  # the last band is everything longer
+        self.counts = [0] * size
+        self.tokens = [0] * size
+        self.longest = [0] * size
+        self.dropped = 0
+        self.split = 0
+
+    def band(self, tokens: int) -> int:
+        return bisect.bisect_left(self.bands, tokens)
+
+    def add(self, tokens: int) -> int:
+        band = self.band(tokens)
+        self.counts[band] += 1
+        self.tokens[band] += tokens
+        self.longest[band] = max(self.longest[band], tokens)
+        return band
+
+    def label(self, band: int) -> str:
+        return f"<={self.bands[band]}" if band < len(self.bands) else f">{self.bands[-1]}"
+
+    def padding(self) -> Dict[str, int]:
+        """Pad tokens if every batch is padded to the longest record overall, vs. to its band's longest."""
+        count, tokens = sum(self.counts), sum(self.tokens)
+        mixed = count * max(self.longest) - tokens
+        banded = sum(c * longest for c, longest in zip(self.counts, self.longest)) - tokens
+        return {"unbucketed": mixed, "bucketed": banded}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "bands": {
+                self.label(band): {"records": self.counts[band], "tokens": self.tokens[band], "longest": self.longest[band]}
+                for band in range(len(self.counts))
+            },
+            "records": sum(self.counts),
+            "tokens": sum(self.tokens),
+            "dropped": self.dropped,
+            "split": self.split,
+            "padding": self.padding(),
+        }
+
+    def __str__(self) -> str:
+        widest = max(self.counts) or 1
+        lines = [
+            f"{self.label(band):>8} {count:>8} {'#' * round(40 * count / widest)}"
+            for band, count in enumerate(self.counts)
+        ]
+        padding = self.padding()
+        lines.append(
+            f"{sum(self.counts)} records, {sum(self.tokens)} tokens, {self.dropped} dropped, {self.split} split; "
+            f"padding {padding['unbucketed']} tokens unbucketed, {padding['bucketed']} bucketed"
+        )
+        return "\n".join(lines)
+
+
+def sized(
+    items: Iterable[Dict[str, Any]], histogram: LengthHistogram, max_tokens: int = MAX_TOKENS, oversize: str = OVERSIZE
+) -> Iterator[Tuple[Dict[str, Any], int]]:
+    """Yields (item, tokens) within `max_tokens`, dropping or splitting the rest, and fills `histogram`."""
+    for item in items:
+        tokens = record_tokens(item)
+        if tokens <= max_tokens or oversize == "keep":
+            yield item, tokens
+            continue
+        parts = split_item(item, max_tokens) if oversize == "split" else []
+        if not parts:
+            histogram.dropped += 1
+            continue
+        histogram.split += 1
+        for part in parts:
+            yield part, record_tokens(part)
+
+
+def export(
+    items: Iterable[Dict[str, Any]],
+    writer: ShardWriter,
+    max_tokens: int = MAX_TOKENS,
+    oversize: str = OVERSIZE,
+    histogram: Optional[LengthHistogram] = None,
+) -> List[str]:
+    """Streams `items` through `writer`, in their stored order, returning the files written."""
+    histogram = histogram if histogram is not None else LengthHistogram()
+    with writer:
+        for item, tokens in sized(items, histogram, max_tokens, oversize):
+            histogram.add(tokens)
+            writer.write(to_record(item))
+    return writer.files
+
 
-    for item in data:
-        instruction = item["instruction"]
-        completion = item["completion"]
+def export_bucketed(
+    items: Iterable[Dict[str, Any]],
+    path: str = OUTPUT,
+    max_bytes: int = SHARD_BYTES,
+    max_lines: int = SHARD_LINES,
+    compress: bool = False,
+    max_tokens: int = MAX_TOKENS,
+    oversize: str = OVERSIZE,
+    histogram: Optional[LengthHistogram] = None,
+) -> List[str]:
+    """
+    Like `export`, but each length band goes to its own writer (`pine-le0512.jsonl`, ...),
+    so batches drawn from one file need little padding. Still one pass, constant memory.
+    """
+    histogram = histogram if histogram is not None else LengthHistogram()
+    stem, extension = os.path.splitext(path)
+    writers: Dict[int, ShardWriter] = {}
+    try:
+        for item, tokens in sized(items, histogram, max_tokens, oversize):
+            band = histogram.add(tokens)
+            if band not in writers:
+                name = f"le{histogram.bands[band]:04d}" if band < len(histogram.bands) else "longer"
+                writers[band] = ShardWriter(f"{stem}-{name}{extension}", max_bytes, max_lines, compress)
+            writers[band].write(to_record(item))
+    except BaseException as error:
+        for writer in writers.values():
+            writer.__exit__(type(error), error, None)
+        raise
+    return [file for band in sorted(writers) for file in writers[band].close()]
 
-        jsonl_data += json.dumps({"messages": [
-            {"role": "system", "content": "You are a Pine Script coder."},
-            {"role": "user", "content": instruction},
-            {"role": "assistant", "content": completion}
-        ]}) + "\n"
 
-    return jsonl_data
+def write_histogram(histogram: LengthHistogram, path: str = OUTPUT) -> str:
+    """Writes the histogram as `<output stem>.lengths.json` and returns its path."""
+    histogram_path = f"{os.path.splitext(path)[0]}.lengths.json"
+    with open(histogram_path, "w") as f:
+        json.dump(histogram.to_dict(), f, indent=2)
+    return histogram_path
 
 
-with open("pine.jsonl", "w") as f:
-    f.write(convert_to_jsonl(data))
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the Successful entries as fine-tuning jsonl.")
+    parser.add_argument("--db", default=DB_FILE, help="SQLite store (created from db.json if missing)")
+    parser.add_argument("--json", default=LEGACY_DB_FILE, help="legacy db.json to import on first use")
+    parser.add_argument("--out", default=OUTPUT, help="output file, or the base name of the shards")
+    parser.add_argument("--max-bytes", type=int, default=SHARD_BYTES, help="bytes per shard, 0 for no limit")
+    parser.add_argument("--max-lines", type=int, default=SHARD_LINES, help="lines per shard, 0 for no limit")
+    parser.add_argument("--gzip", action="store_true", help="gzip the output")
+    parser.add_argument("--max-tokens", type=int, default=MAX_TOKENS, help="approximate tokens per record")
+    parser.add_argument("--oversize", choices=["drop", "split", "keep"], default=OVERSIZE, help="records over --max-tokens")
+    parser.add_argument("--bucket", action="store_true", help="write each length band to its own file")
+    args = parser.parse_args()
 
-print("Json file created!")
+    store = open_store(args.db, args.json)
+    histogram = LengthHistogram()
+    if args.bucket:
+        files = export_bucketed(
+            store.rows("successful"), args.out, args.max_bytes, args.max_lines, args.gzip, args.max_tokens, args.oversize, histogram
+        )
+    else:
+        writer = ShardWriter(args.out, args.max_bytes, args.max_lines, args.gzip)
+        files = export(store.rows("successful"), writer, args.max_tokens, args.oversize, histogram)
+    store.close()
+    print(histogram)
+    print(f"Json file created! {', '.join(files)} (lengths in {write_histogram(histogram, args.out)})")
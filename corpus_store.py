@@ -0,0 +1,255 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+# Packed store for the downloaded script corpus: one append-only pack file holding every
+# source and metadata document back to back, and an SQLite index of where each one lives.
+# Reads go through a memory map, so iterating or looking up scripts touches no per-script
+# files and no directory scans. `import_tree` packs an existing scripts/<sector>/<kind>/ mirror.
+
+# Configuration
+PACK_FILE = "scripts.pack"  # the index is PACK_FILE + ".idx"
+TREE_ROOT = "scripts"
+MANIFEST_FILE = "scripts/manifest.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scripts (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    sector TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    source_offset INTEGER NOT NULL,
+    source_length INTEGER NOT NULL,
+    metadata_offset INTEGER NOT NULL,
+    metadata_length INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+"""
+COLUMNS = "key, name, sector, kind, source_offset, source_length, metadata_offset, metadata_length"
+
+
+class Script(NamedTuple):
+    key: str  # scriptIdPart@version, or the tree path for scripts packed without a manifest
+    name: str
+    sector: str
+    kind: str
+    source: str
+    metadata: str
+
+
+def content_hash(source: str, metadata: str) -> str:
+    return hashlib.sha256(f"{source}\0{metadata}".encode("utf-8")).hexdigest()
+
+
+class CorpusStore:
+    """
+    An append-only pack of scripts with an offset index; safe to share across threads.
+    Re-adding a key with different content appends the new version and points the index at it,
+    and adding `scriptIdPart@version` drops the script's other versions from the index;
+    `compact` drops the bytes nothing points at any more.
+    """
+
+    def __init__(self, path: str = PACK_FILE):
+        """Opens (or creates) the pack and its index.
+
+        :param path: The pack file; the index lives next to it as `<path>.idx`.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._pack = open(path, "ab+")
+        self._db = sqlite3.connect(f"{path}.idx", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._map: Optional[mmap.mmap] = None
+        self._mapped = 0
+        self._truncate_to_index()
+
+    def _truncate_to_index(self):
+        """Drops bytes a crash left past the last indexed script, so the pack and index agree."""
+        end = self._db.execute("SELECT MAX(metadata_offset + metadata_length) FROM scripts").fetchone()[0] or 0
+        self._pack.seek(0, os.SEEK_END)
+        if self._pack.tell() > end:
+            self._pack.truncate(end)
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+            self._pack.close()
+            self._db.close()
+
+    # -- Writing --
+
+    def put(self, key: str, name: str, sector: str, kind: str, source: str, metadata: str) -> bool:
+        """
+        Stores a script, replacing any other version of it; returns False if the same content
+        was already stored under `key`.
+        """
+        digest = content_hash(source, metadata)
+        source_bytes = source.encode("utf-8")
+        metadata_bytes = metadata.encode("utf-8")
+        with self._lock:
+            row = self._db.execute("SELECT sha256 FROM scripts WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[0] == digest:
+                return False
+            self._pack.seek(0, os.SEEK_END)
+            source_offset = self._pack.tell()
+            self._pack.write(source_bytes)
+            self._pack.write(metadata_bytes)
+            self._pack.flush()  # bytes reach the pack before the index points at them
+            with self._db:
+                self._db.execute("DELETE FROM scripts WHERE key = ?", (key,))
+                if "@" in key:  # scriptIdPart@version: older versions of the script are superseded
+                    prefix = key.rsplit("@", 1)[0] + "@"
+                    self._db.execute(
+                        "DELETE FROM scripts WHERE substr(key, 1, ?) = ? AND instr(substr(key, ?), '@') = 0",
+                        (len(prefix), prefix, len(prefix) + 1),
+                    )
+                self._db.execute(
+                    f"INSERT INTO scripts ({COLUMNS}, sha256) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        key,
+                        name,
+                        sector,
+                        kind,
+                        source_offset,
+                        len(source_bytes),
+                        source_offset + len(source_bytes),
+                        len(metadata_bytes),
+                        digest,
+                    ),
+                )
+        return True
+
+    # -- Reading --
+
+    def _query(self, sql: str, parameters: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._db.execute(sql, parameters).fetchall()
+
+    def _script(self, row: tuple) -> Script:
+        key, name, sector, kind, source_offset, source_length, metadata_offset, metadata_length = row
+        end = metadata_offset + metadata_length
+        with self._lock:
+            if end > self._mapped:  # the pack has grown past the map
+                if self._map is not None:
+                    self._map.close()
+                size = os.path.getsize(self.path)
+                self._map = mmap.mmap(self._pack.fileno(), size, access=mmap.ACCESS_READ) if size else None
+                self._mapped = size
+            view = self._map
+            source = view[source_offset : source_offset + source_length] if view else b""
+            metadata = view[metadata_offset:end] if view else b""
+        return Script(key, name, sector, kind, source.decode("utf-8"), metadata.decode("utf-8"))
+
+    def get(self, key: str) -> Optional[Script]:
+        rows = self._query(f"SELECT {COLUMNS} FROM scripts WHERE key = ?", (key,))
+        return self._script(rows[0]) if rows else None
+
+    def __contains__(self, key: str) -> bool:
+        return bool(self._query("SELECT 1 FROM scripts WHERE key = ?", (key,)))
+
+    def __len__(self) -> int:
+        return self._query("SELECT COUNT(*) FROM scripts")[0][0]
+
+    def keys(self) -> List[str]:
+        return [row[0] for row in self._query("SELECT key FROM scripts ORDER BY seq")]
+
+    def __iter__(self) -> Iterator[Script]:
+        """Every script, in pack order, so the map is read front to back."""
+        for row in self._query(f"SELECT {COLUMNS} FROM scripts ORDER BY source_offset"):
+            yield self._script(row)
+
+    def iter_kind(self, kind: str) -> Iterator[Script]:
+        for row in self._query(f"SELECT {COLUMNS} FROM scripts WHERE kind = ? ORDER BY source_offset", (kind,)):
+            yield self._script(row)
+
+    def stats(self) -> Dict[str, int]:
+        live = self._query("SELECT COALESCE(SUM(source_length + metadata_length), 0) FROM scripts")[0][0]
+        size = os.path.getsize(self.path)
+        return {"scripts": len(self), "pack_bytes": size, "live_bytes": live, "garbage_bytes": size - live}
+
+    # -- Maintenance --
+
+    def compact(self):
+        """
+        Rewrites the pack with only the current version of each script; scripts are put back in
+        pack order, so of several versions left by an older pack the last one written is kept.
+        """
+        tmp = CorpusStore(f"{self.path}.compact")
+        for script in self:
+            tmp.put(*script)
+        tmp.close()
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map, self._mapped = None, 0
+            self._pack.close()
+            self._db.close()
+            os.replace(f"{self.path}.compact.idx", f"{self.path}.idx")
+            os.replace(f"{self.path}.compact", self.path)
+            for suffix in ("-wal", "-shm"):
+                for stale in (f"{self.path}.idx{suffix}", f"{self.path}.compact.idx{suffix}"):
+                    if os.path.exists(stale):
+                        os.remove(stale)
+        self.__init__(self.path)
+
+
+def import_tree(store: CorpusStore, root: str = TREE_ROOT, manifest_path: str = MANIFEST_FILE) -> int:
+    """
+    Packs a scripts/<sector>/<kind>/<name>.pine (+ .json) mirror, returning how many scripts were added.
+    Scripts listed in the sync manifest are keyed scriptIdPart@version, the rest by their path.
+    """
+    keys: Dict[str, str] = {}
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            keys = {os.path.normpath(entry["path"]): key for key, entry in json.load(f).items() if "path" in entry}
+    added = 0
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories[:] = sorted(d for d in subdirectories if not d.startswith("."))  # skips .listings
+        parts = os.path.relpath(directory, root).split(os.sep)
+        sector = parts[0] if parts[0] != "." else ""
+        kind = parts[1] if len(parts) > 1 else ""
+        for filename in sorted(files):
+            if not filename.endswith(".pine"):
+                continue
+            path = os.path.join(directory, filename)
+            with open(path, encoding="utf-8") as f:
+                source = f.read()
+            metadata_path = path[: -len(".pine")] + ".json"
+            metadata = ""
+            if os.path.isfile(metadata_path):
+                with open(metadata_path, encoding="utf-8") as f:
+                    metadata = f.read()
+            key = keys.get(os.path.normpath(path), os.path.relpath(path, root))
+            added += store.put(key, filename[: -len(".pine")], sector, kind, source, metadata)
+    return added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack the downloaded script corpus into one file, and read it back.")
+    parser.add_argument("command", choices=["import", "stats", "cat", "list", "compact"])
+    parser.add_argument("key", nargs="?", help="script to print with `cat`")
+    parser.add_argument("--pack", default=PACK_FILE)
+    parser.add_argument("--root", default=TREE_ROOT, help="directory tree to import")
+    args = parser.parse_args()
+
+    store = CorpusStore(args.pack)
+    if args.command == "import":
+        print(f"{import_tree(store, args.root)} scripts added")
+    elif args.command == "cat":
+        script = store.get(args.key)
+        print(script.source if script else f"no script {args.key}")
+    elif args.command == "list":
+        for key in store.keys():
+            print(key)
+    elif args.command == "compact":
+        store.compact()
+    print(store.stats())
+    store.close()
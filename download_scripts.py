@@ -1,32 +1,173 @@
+import codecs
+import hashlib
 import json
 import os
+import threading
 import time
-import requests
 import unidecode
 import browser_cookie3
 import urllib
 from alive_progress import alive_bar
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
+from urllib.parse import urlparse
+
+from corpus_store import PACK_FILE, CorpusStore
+from symbol_index import SymbolIndex
+from transport import TRANSPORT, RateLimiter
 
 # Configuration
 OVERWRITE = False
 BROWSER = "chrome"  # Change if using a different browser
+DOWNLOAD_WORKERS = 8  # scripts downloaded at once
+HOST_RATE = 8.0  # starting requests/second per host, adapts to 429 / 5xx replies
+MANIFEST_FILE = "scripts/manifest.json"  # what is mirrored: scriptIdPart@version -> files and hashes
+MANIFEST_SAVE_EVERY = 200  # downloads between manifest saves, so an interrupted sync keeps its progress
+PACK = False  # store scripts in one pack file (corpus_store.py) instead of a .pine/.json pair each
+INDEX_SYMBOLS = True  # bring symbol_index.py's index up to date with new downloads after each sync
+LISTING_CACHE_DIR = "scripts/.listings"  # one JSON-lines file per listing filter
+LISTING_TTL = 6 * 3600  # seconds a cached listing is used before it is fetched again
+LISTING_CHUNK = 64 * 1024  # bytes read at a time while parsing a listing
 
 # Constants for script categories
 SCRIPT_CATEGORIES = ["library", "strategy", "study"]
 
-# Base URL for API endpoints
-API_BASE_URL = "https://pine-facade.tradingview.com/pine-facade/"
+# Base URL for API endpoints (point PINE_FACADE_URL at mock_pine_facade.py to run offline)
+API_BASE_URL = os.environ.get("PINE_FACADE_URL", "https://pine-facade.tradingview.com/pine-facade/")
+
+# one limiter per host, shared by every worker talking to it
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def limiter_for(url: str) -> RateLimiter:
+    """Returns the rate limiter for the URL's host."""
+    host = urlparse(url).netloc
+    with _limiters_lock:
+        if host not in _limiters:
+            _limiters[host] = RateLimiter(HOST_RATE)
+        return _limiters[host]
+
+_corpus: Optional[CorpusStore] = None
+_corpus_lock = threading.Lock()
+
+def corpus() -> CorpusStore:
+    """The pack scripts are saved to when PACK is on, opened on first use."""
+    global _corpus
+    with _corpus_lock:
+        if _corpus is None:
+            _corpus = CorpusStore(PACK_FILE)
+        return _corpus
 
 # -- Data Acquisition and Processing --
 
-def fetch_script_data(filter_type: str, cj: Any) -> List[Dict[str, Any]]:
-    """Fetches script metadata from the TradingView API."""
+class JsonArrayStream:
+    """
+    Parses a JSON array element by element as text chunks arrive, so a listing is never held
+    as one big string. A document that is not an array (an error reply) is parsed whole
+    and left in `value` instead; `is_array` tells which it was.
+    """
+
+    def __init__(self, chunks: Iterable[str]):
+        self.chunks = chunks
+        self.is_array: Optional[bool] = None
+        self.value: Any = None
+
+    def __iter__(self) -> Iterator[Any]:
+        decoder = json.JSONDecoder()
+        buffer, position = "", 0
+        for chunk in self.chunks:
+            buffer = buffer[position:] + chunk
+            position = 0
+            if self.is_array is False:
+                continue
+            while True:
+                while position < len(buffer) and buffer[position] in " \t\r\n,":
+                    position += 1
+                if position == len(buffer):
+                    break
+                if self.is_array is None:
+                    self.is_array = buffer[position] == "["
+                    if not self.is_array:
+                        break
+                    position += 1
+                    continue
+                if buffer[position] == "]":
+                    return
+                try:
+                    element, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    break  # the element runs on into the next chunk
+                if isinstance(element, (int, float)) and (end == len(buffer) or buffer[end] in ".eE+-0123456789"):
+                    break  # a number might have more digits to come
+                position = end
+                yield element
+        if self.is_array is False:
+            self.value = json.loads(buffer[position:])
+        elif self.is_array is None:
+            raise ValueError("empty listing response")
+        else:
+            raise ValueError("listing response ends inside the array")
+
+def trim_listing_entry(script: Dict[str, Any]) -> Dict[str, Any]:
+    """Keeps only what the sync uses, so a large listing stays small in memory."""
+    return {
+        "scriptIdPart": script["scriptIdPart"],
+        "version": script["version"],
+        "scriptName": script["scriptName"],
+        "extra": {"kind": (script.get("extra") or {}).get("kind")},
+    }
+
+def listing_cache_path(filter_type: str) -> str:
+    return os.path.join(LISTING_CACHE_DIR, f"{sanitize_filename(filter_type)}.jsonl")
+
+def read_cached_listing(filter_type: str) -> Optional[List[Dict[str, Any]]]:
+    """The cached listing for a filter, or None if there is none younger than LISTING_TTL."""
+    path = listing_cache_path(filter_type)
+    try:
+        if time.time() - os.path.getmtime(path) > LISTING_TTL:
+            return None
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+    except (OSError, ValueError):
+        return None
+
+def fetch_script_data(filter_type: str, cj: Any) -> Any:
+    """
+    Fetches script metadata from the TradingView API, or from the on-disk cache if it is fresh.
+    The listing is parsed as it streams in and cached at the same time, so the response is
+    never held whole; the returned list still holds every (trimmed) entry, since the sync
+    groups them by kind. An error reply is returned as parsed, and not cached.
+    """
+    cached = read_cached_listing(filter_type)
+    if cached is not None:
+        return cached
+
     url = f"{API_BASE_URL}list?filter={filter_type}"
     if filter_type != "published":
         url += "&last?no_4xx=true"
-    response = requests.get(url, cookies=cj)
-    return json.loads(response.text)
+    response = TRANSPORT.get(url, cookies=cj, limiter=limiter_for(url), stream=True)
+    path = listing_cache_path(filter_type)
+    tmp_path = f"{path}.tmp"
+    os.makedirs(LISTING_CACHE_DIR, exist_ok=True)
+    text = codecs.getincrementaldecoder(response.encoding or "utf-8")()
+    stream = JsonArrayStream(text.decode(chunk) for chunk in response.iter_content(LISTING_CHUNK))
+    scripts: List[Dict[str, Any]] = []
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as cache:
+            for script in stream:
+                script = trim_listing_entry(script)
+                cache.write(json.dumps(script) + "\n")
+                scripts.append(script)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    finally:
+        response.close()
+    if stream.is_array and response.status_code == 200:
+        os.replace(tmp_path, path)
+        return scripts
+    os.remove(tmp_path)
+    return scripts if stream.is_array else stream.value
 
 def categorize_scripts(data: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
     """Categorizes scripts based on their 'kind' attribute."""
@@ -51,45 +192,127 @@ def sanitize_filename(filename: str) -> str:
     invalid_chars = '<>:"/\\|?* '
     return "".join(char for char in filename if char not in invalid_chars)
 
+def script_paths(script_name: str, sector_name: str, kind: str) -> Tuple[str, str]:
+    """Where a script's source and metadata are saved."""
+    directory = f"scripts/{sector_name}/{kind}/"
+    script_name = sanitize_filename(script_name)
+    return f"{directory}{script_name}.pine", f"{directory}{script_name}.json"
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
 def download_script(
-    script_id_part: str, version: str, script_name: str, sector_name: str, kind: str, cj: Any
-) -> bool:
-    """Downloads a script and its metadata, returning True if successful."""
+    script_id_part: str, version: str, script_name: str, sector_name: str, kind: str, cj: Any, adopt: bool = False
+) -> Optional[Dict[str, Any]]:
+    """
+    Downloads a script and its metadata, returning its manifest entry if successful (None if not).
+    With `adopt`, files already at the script's paths are taken as this version instead; only
+    for scripts the manifest has never seen, since the paths do not depend on the version.
+    Safe to run from several threads.
+    """
     url = f"{API_BASE_URL}get/{script_id_part}/{version}"
     url2 = f"{API_BASE_URL}translate/{script_id_part}/{version}"
 
-    script_name = sanitize_filename(script_name)
+    script_filepath, metadata_filepath = script_paths(script_name, sector_name, kind)
+    directory = os.path.dirname(script_filepath)
 
-    r = requests.get(url, cookies=cj)
-    r2 = requests.get(url2, cookies=cj)
+    # already mirrored before the manifest existed: hash the local files, skip both requests
+    if adopt and not PACK and os.path.isfile(script_filepath) and os.path.isfile(metadata_filepath) and not OVERWRITE:
+        with open(script_filepath, encoding="utf-8") as f:
+            script_source = f.read()
+        with open(metadata_filepath, encoding="utf-8") as f:
+            metadata = f.read()
+        return manifest_entry(script_filepath, script_source, metadata)
 
+    r = TRANSPORT.get(url, cookies=cj, limiter=limiter_for(url))
     if r.status_code != 200:
-        return False
+        return None
 
     script_data = json.loads(r.text)
+    if not isinstance(script_data, dict) or "source" not in script_data:
+        return None
+
+    r2 = TRANSPORT.get(url2, cookies=cj, limiter=limiter_for(url2))
     metadata = r2.text.encode("utf-8").decode()
+    script_source = script_data["source"].encode("utf-8").decode()
 
-    if "source" not in script_data:
-        return False
+    if PACK:
+        key = Manifest.key(script_id_part, version)
+        corpus().put(key, sanitize_filename(script_name), sector_name, kind, script_source, metadata)
+        return manifest_entry(PACK_FILE, script_source, metadata)
 
-    script_source = script_data["source"].encode("utf-8").decode()
+    os.makedirs(directory, exist_ok=True)
+    _write(script_filepath, script_source)
+    _write(metadata_filepath, metadata)
 
-    directory = f"scripts/{sector_name}/{kind}/"
-    if not os.path.exists(directory):
-        os.makedirs(directory)
+    return manifest_entry(script_filepath, script_source, metadata)
 
-    script_filepath = f"{directory}{script_name}.pine"
-    metadata_filepath = f"{directory}{script_name}.json"
+def manifest_entry(path: str, script_source: str, metadata: str) -> Dict[str, Any]:
+    """What the manifest keeps for a script: where it is saved (its .pine file, or the pack) and hashes."""
+    return {
+        "path": path,
+        "sha256": content_hash(script_source),
+        "metadata_sha256": content_hash(metadata),
+        "synced": int(time.time()),
+    }
+
+def _write(path: str, text: str):
+    """Writes through a per-thread temp file, so two workers saving the same name never interleave."""
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+# -- Sync Manifest --
+
+class Manifest:
+    """
+    The mirrored scripts, keyed `scriptIdPart@version`, with their files and content hashes.
+    A listing entry whose version is already here (and whose file still exists) needs no request at all.
+    Only the main thread touches it; saving swaps a complete new file in.
+    """
+
+    def __init__(self, path: str = MANIFEST_FILE):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.versions: Dict[str, str] = {}  # scriptIdPart -> key of its mirrored version
+        self.unsaved = 0
+        if os.path.isfile(path):
+            with open(path, encoding="utf-8") as f:
+                for key, entry in json.load(f).items():
+                    self._add(key, entry)
+
+    @staticmethod
+    def key(script_id_part: str, version: str) -> str:
+        return f"{script_id_part}@{version}"
 
-    if os.path.isfile(script_filepath) and not OVERWRITE:
-        return True
+    def _add(self, key: str, entry: Dict[str, Any]):
+        script_id_part = key.rsplit("@", 1)[0]
+        previous = self.versions.get(script_id_part)
+        if previous is not None and previous != key:
+            del self.entries[previous]  # a newer version replaces the old one
+        self.versions[script_id_part] = key
+        self.entries[key] = entry
 
-    with open(script_filepath, "w", encoding="utf-8") as f:
-        f.write(script_source)
-    with open(metadata_filepath, "w", encoding="utf-8") as f:
-        f.write(metadata)
+    def is_current(self, script_id_part: str, version: str) -> bool:
+        entry = self.entries.get(self.key(script_id_part, version))
+        return entry is not None and os.path.isfile(entry["path"])
 
-    return True
+    def record(self, script_id_part: str, version: str, entry: Dict[str, Any]):
+        self._add(self.key(script_id_part, version), entry)
+        self.unsaved += 1
+        if self.unsaved >= MANIFEST_SAVE_EVERY:
+            self.save()
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self.unsaved = 0
 
 # -- Main Execution Logic --
 
@@ -101,50 +324,96 @@ def main():
 
     filters = ["published", "saved", "standard"]
     
+    listings = (fetch_script_data(filter_type, cj) for filter_type in filters)
     script_metadata = [
-        fetch_script_data(filter_type, cj)
-        for filter_type in filters
-        if "Error: cannot compile script"
-        not in fetch_script_data(filter_type, cj)
+        data for data in listings if "Error: cannot compile script" not in data
     ]
 
     categorized_scripts = categorize_scripts(script_metadata)
+    manifest = Manifest(MANIFEST_FILE)
+    unchanged = 0
 
     # -- Script Downloading with Progress Tracking --
-    
-    for category, scripts in categorized_scripts.items():
-        with alive_bar(
-            len(scripts), calibrate=5, dual_line=True, theme="smooth"
-        ) as bar:
-            bar.title(f"\n\nChecking {category} scripts")
-            for script in scripts:
-                time.sleep(0.01)
-                script_id_part = script["scriptIdPart"]
-                version = script["version"]
-                sector_name = script_id_part.split(";")[0]
-                
-                # -- Filter Script Types --
-                
-                is_valid_sector = sector_name in ["STD", "USER", "PUB"]
-                if not is_valid_sector:
-                    bar()
-                    continue
+    # workers only download; the bar is only touched from this thread, once per finished script,
+    # in whatever order they finish
+
+    try:
+        for category, scripts in categorized_scripts.items():
+            unchanged += sync_category(category, scripts, manifest, cj)
+    finally:
+        manifest.save()
+
+    print(f"{unchanged} scripts unchanged since the last sync")
 
-                bar.text(f"Checking {script['scriptName']}")
-                success = download_script(
-                    script_id_part,
-                    version,
-                    script["scriptName"],
-                    sector_name,
-                    category,
-                    cj,
-                )
-                
-                # -- Conditional Logging for Errors --
-                
-                if not success:
-                    bar.text(f"Error downloading {script['scriptName']}")
+    # -- Symbol Index --
+
+    if INDEX_SYMBOLS:
+        index = SymbolIndex()
+        if PACK:
+            print(f"symbol index: {index.index_scripts((script.key, script.source) for script in corpus())}")
+        else:
+            print(f"symbol index: {index.index_tree('scripts')}")
+        index.close()
+    print(f"transport: {TRANSPORT.stats()}")
+
+def sync_category(category: str, scripts: List[Dict[str, Any]], manifest: Manifest, cj: Any) -> int:
+    """Downloads a category's new and changed scripts, returning how many were already current."""
+    unchanged = 0
+    with alive_bar(
+        len(scripts), calibrate=5, dual_line=True, theme="smooth"
+    ) as bar, ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+        bar.title(f"\n\nChecking {category} scripts")
+        downloads = {}
+        for script in scripts:
+            script_id_part = script["scriptIdPart"]
+            version = script["version"]
+            sector_name = script_id_part.split(";")[0]
+            
+            # -- Filter Script Types --
+            
+            is_valid_sector = sector_name in ["STD", "USER", "PUB"]
+            if not is_valid_sector:
+                bar()
+                continue
+
+            # -- Skip Versions Already Mirrored --
+
+            if not OVERWRITE and manifest.is_current(script_id_part, version):
+                unchanged += 1
                 bar()
+                continue
+
+            future = pool.submit(
+                download_script,
+                script_id_part,
+                version,
+                script["scriptName"],
+                sector_name,
+                category,
+                cj,
+                adopt=script_id_part not in manifest.versions,
+            )
+            downloads[future] = script
+
+        for future in as_completed(downloads):
+            script = downloads[future]
+            try:
+                entry = future.result()
+            except OSError:  # network failure after the transport's retries
+                entry = None
+            except (ValueError, KeyError):  # a reply that is not the JSON expected
+                entry = None
+
+            # -- Conditional Logging for Errors --
+
+            if entry:
+                manifest.record(script["scriptIdPart"], script["version"], entry)
+                bar.text(f"Checked {script['scriptName']}")
+            else:
+                bar.text(f"Error downloading {script['scriptName']}")
+            bar()
+
+    return unchanged
 
 if __name__ == "__main__":
     main()
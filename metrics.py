@@ -0,0 +1,210 @@
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Counters, gauges and latency histograms for the pipeline stages, written as a JSON snapshot
+# and a Prometheus text file every METRICS_INTERVAL seconds and summarised at exit.
+# Recording is a dict update under a lock, cheap enough to leave on for whole runs.
+
+# Configuration
+METRICS_JSON = "metrics.json"
+METRICS_PROM = "metrics.prom"  # point node_exporter's textfile collector at it
+METRICS_INTERVAL = 15.0  # seconds between snapshots
+PREFIX = "pine_"
+# seconds; compile checks sit around 0.5-2 s, LLM calls 5-60 s
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+Key = Tuple[str, Labels]
+
+
+def _key(name: str, labels: Dict[str, Any]) -> Key:
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def _format(key: Key, extra: Labels = ()) -> str:
+    name, labels = key
+    labels = labels + extra
+    if not labels:
+        return PREFIX + name
+    text = ",".join(f'{label}="{value}"' for label, value in labels)
+    return f"{PREFIX}{name}{{{text}}}"
+
+
+class Histogram:
+    """Bucketed observations, Prometheus-style: counts per upper bound plus a running sum."""
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # the last bucket is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank and count:
+                return bound
+        return 0.0
+
+
+class Metrics:
+    """Thread-safe registry of counters, gauges and histograms, plus collectors read at snapshot time."""
+
+    def __init__(self):
+        self.counters: Dict[Key, float] = {}
+        self.gauges: Dict[Key, float] = {}
+        self.histograms: Dict[Key, Histogram] = {}
+        self.collectors: Dict[str, Callable[[], Dict[str, float]]] = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._reporter: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def count(self, name: str, amount: float = 1, **labels: Any):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def gauge(self, name: str, value: float, **labels: Any):
+        key = _key(name, labels)
+        with self._lock:
+            self.gauges[key] = value
+
+    def observe(self, name: str, seconds: float, **labels: Any):
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """Observes how long the `with` block took."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - started, **labels)
+
+    def collect(self, name: str, read: Callable[[], Dict[str, float]]):
+        """Reports `read()`'s values as `<name>_<key>` gauges in every snapshot (e.g. TRANSPORT.stats)."""
+        self.collectors[name] = read
+
+    def _collected(self) -> Dict[Key, float]:
+        values: Dict[Key, float] = {}
+        for prefix, read in list(self.collectors.items()):
+            for name, value in read().items():
+                values[(f"{prefix}_{name}", ())] = value
+        return values
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Everything recorded so far, as plain JSON-able data."""
+        collected = self._collected()
+        with self._lock:
+            return {
+                "time": time.time(),
+                "uptime": time.time() - self.started,
+                "counters": {_format(key): value for key, value in self.counters.items()},
+                "gauges": {_format(key): value for key, value in {**self.gauges, **collected}.items()},
+                "histograms": {
+                    _format(key): {
+                        "count": h.count,
+                        "sum": h.total,
+                        "p50": h.quantile(0.5),
+                        "p90": h.quantile(0.9),
+                        "p99": h.quantile(0.99),
+                    }
+                    for key, h in self.histograms.items()
+                },
+            }
+
+    def prometheus(self) -> str:
+        """The Prometheus text exposition format."""
+        collected = self._collected()
+        lines: List[str] = []
+        typed = set()
+
+        def family(name: str, kind: str):
+            # one TYPE line per metric, before its first sample; sorted keys keep a family together
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        with self._lock:
+            for key, value in sorted(self.counters.items()):
+                family(key[0], "counter")
+                lines.append(f"{_format(key)} {value}")
+            for key, value in sorted({**self.gauges, **collected}.items()):
+                family(key[0], "gauge")
+                lines.append(f"{_format(key)} {value}")
+            for key, h in sorted(self.histograms.items()):
+                family(key[0], "histogram")
+                seen = 0
+                for bound, count in zip(BUCKETS + (float("inf"),), h.counts):
+                    seen += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{_format((key[0] + '_bucket', key[1]), (('le', le),))} {seen}")
+                lines.append(f"{_format((key[0] + '_sum', key[1]))} {h.total}")
+                lines.append(f"{_format((key[0] + '_count', key[1]))} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_path: str = METRICS_JSON, prom_path: str = METRICS_PROM):
+        """Writes both files atomically, so a scraper never reads half of one."""
+        for path, text in ((json_path, json.dumps(self.snapshot(), indent=2)), (prom_path, self.prometheus())):
+            tmp = f"{path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, path)
+
+    def summary(self) -> str:
+        """A few human-readable lines: totals, and latency percentiles per histogram."""
+        snapshot = self.snapshot()
+        lines = [f"metrics after {snapshot['uptime']:.0f}s:"]
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"  {name} = {value:g}")
+        for name, value in sorted(snapshot["gauges"].items()):
+            lines.append(f"  {name} = {value:g}")
+        for name, h in sorted(snapshot["histograms"].items()):
+            mean = h["sum"] / h["count"] if h["count"] else 0.0
+            lines.append(
+                f"  {name}: n={h['count']} mean={mean:.2f}s p50<={h['p50']:g}s p90<={h['p90']:g}s p99<={h['p99']:g}s"
+            )
+        return "\n".join(lines)
+
+    def start(self, interval: float = METRICS_INTERVAL, json_path: str = METRICS_JSON, prom_path: str = METRICS_PROM):
+        """Writes snapshots every `interval` seconds on a daemon thread, and a last one plus a summary at exit."""
+        if self._reporter is not None:
+            return
+
+        def report():
+            while not self._stop.wait(interval):
+                self.write(json_path, prom_path)
+
+        def finish():
+            self._stop.set()
+            self.write(json_path, prom_path)
+            print(self.summary())
+
+        self._reporter = threading.Thread(target=report, name="metrics", daemon=True)
+        self._reporter.start()
+        atexit.register(finish)
+
+
+# the one registry every stage records into
+METRICS = Metrics()
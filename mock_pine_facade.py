@@ -0,0 +1,275 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from pine_lint import preflight
+
+# Local stand-in for the TradingView endpoints the tools use, for offline load testing:
+#   GET  /tvcoins/details/                 session check
+#   POST /accounts/signin/                 login, sets a sessionid cookie
+#   POST /pine-facade/save/new_draft/      compile check
+#   GET  /pine-facade/list?filter=...      script listing
+#   GET  /pine-facade/get/<id>/<version>   script source
+#   GET  /pine-facade/translate/<id>/<version>  script metadata
+#   POST /v1/chat/completions              fake OpenAI chat completion for the repair loop
+#
+# Point the tools at it with:
+#   TV_BASE_URL=http://127.0.0.1:8765 PINE_FACADE_URL=http://127.0.0.1:8765/pine-facade/
+#   OPENAI_API_BASE=http://127.0.0.1:8765/v1
+
+CANNED_ERRORS = [
+    "line 3: Mismatched input '{' expecting 'end of line without line continuation'.",
+    "line 5: Undeclared identifier 'return'",
+    "line 2: Could not find function or function reference 'function'",
+    "line 7: Syntax error at input '['",
+    "line 1: no viable alternative at character '\"'",
+]
+REPAIRED_SCRIPT = "//@version=5\nindicator('repaired')\nplot(close)\n"
+CODE_BLOCK = re.compile(r"```\n(.*?)\n```", re.S)
+SCRIPT_KINDS = ["study", "strategy", "library"]
+SECTORS = ["PUB", "USER", "STD"]
+
+
+class Latency:
+    """A latency distribution from a spec: `fixed:S`, `uniform:LO,HI` or `lognormal:MEDIAN,SIGMA` (seconds)."""
+
+    def __init__(self, spec: str):
+        kind, _, args = spec.partition(":")
+        self.kind = kind
+        self.args = [float(a) for a in args.split(",") if a]
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            return rng.uniform(*self.args)
+        if self.kind == "lognormal":
+            median, sigma = self.args
+            return rng.lognormvariate(0, sigma) * median
+        return self.args[0] if self.args else 0.0
+
+
+class MockState:
+    """Configuration, throttling and request counters shared by all handler threads."""
+
+    def __init__(
+        self,
+        latency: Latency,
+        error_rate: float = 0.0,
+        rate_limit: float = 0.0,
+        compiler: str = "lint",
+        success_rate: float = 0.5,
+        scripts: int = 200,
+        seed: int = 0,
+        llm_latency: Optional[Latency] = None,
+        llm_success_rate: float = 0.6,
+    ):
+        """Sets up the mock.
+
+        :param latency: How long each reply is delayed.
+        :param error_rate: Fraction of requests answered with a random 5xx.
+        :param rate_limit: Requests per second allowed before replying 429 (0 disables throttling).
+        :param compiler: `lint` decides compile results with pine_lint, `random` from the source hash.
+        :param success_rate: Fraction of scripts that compile in `random` mode.
+        :param scripts: How many scripts each listing returns.
+        :param seed: Seed for latency and error draws.
+        :param llm_latency: How long fake chat completions take (defaults to `latency`).
+        :param llm_success_rate: Fraction of fake completions that return a compiling script.
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.compiler = compiler
+        self.success_rate = success_rate
+        self.scripts = scripts
+        self.llm_latency = llm_latency or latency
+        self.llm_success_rate = llm_success_rate
+        self.counters: Counter = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = rate_limit
+        self._refilled = time.monotonic()
+
+    def draw(self) -> Tuple[float, bool, bool]:
+        """Latency, whether to fail with a 5xx and whether to throttle, for one request."""
+        with self._lock:
+            delay = self.latency.sample(self._rng)
+            failed = self._rng.random() < self.error_rate
+            throttled = False
+            if self.rate_limit:
+                now = time.monotonic()
+                self._tokens = min(self.rate_limit, self._tokens + (now - self._refilled) * self.rate_limit)
+                self._refilled = now
+                throttled = self._tokens < 1
+                if not throttled:
+                    self._tokens -= 1
+            return delay, failed, throttled
+
+    def count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def compile(self, source: str) -> Dict[str, Any]:
+        """A canned compiler verdict; the same source always gets the same answer."""
+        if self.compiler == "lint":
+            reason = preflight(source)
+        else:
+            digest = int(hashlib.sha256(source.encode("utf-8")).hexdigest()[:8], 16)
+            passes = digest / 0xFFFFFFFF < self.success_rate
+            reason = None if passes else CANNED_ERRORS[digest % len(CANNED_ERRORS)]
+        if reason is None:
+            return {"success": True, "result": {"IL": "", "ilTemplate": "", "metaInfo": {}}}
+        return {"success": False, "reason": reason}
+
+    def chat_completion(self, request: Dict[str, Any]) -> Tuple[float, Dict[str, Any]]:
+        """A fake completion: either a compiling script or the prompt's code handed back unchanged."""
+        prompt = request["messages"][-1]["content"]
+        with self._lock:
+            delay = self.llm_latency.sample(self._rng)
+            fixed = self._rng.random() < self.llm_success_rate
+        blocks = CODE_BLOCK.findall(prompt)
+        code = REPAIRED_SCRIPT if fixed or not blocks else blocks[-1]
+        content = f"//BEGINCOMPLETION\n{code}\n//ENDCOMPLETION"
+        prompt_tokens = sum(len(m["content"]) for m in request["messages"]) // 4
+        completion_tokens = len(content) // 4
+        return delay, {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def listing(self, filter_type: str) -> list:
+        return [
+            {
+                "scriptIdPart": f"{SECTORS[n % len(SECTORS)]};{filter_type}{n:06d}",
+                "version": str(1 + n % 3),
+                "scriptName": f"{filter_type} script {n}",
+                "extra": {"kind": SCRIPT_KINDS[n % len(SCRIPT_KINDS)]},
+            }
+            for n in range(self.scripts)
+        ]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection pooling shows up in measurements
+    state: MockState
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+    def _reply(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None):
+        payload = body.encode("utf-8") if isinstance(body, str) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json" if not isinstance(body, str) else "text/plain")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_body(self) -> str:
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length).decode("utf-8")
+
+    def _handle(self, method: str):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        endpoint = "/".join(parts[:3] if parts[1:2] == ["save"] else parts[:2])
+        body = self._read_body() if method == "POST" else ""
+        self.state.count(endpoint)
+
+        if endpoint == "v1/chat":
+            delay, completion = self.state.chat_completion(json.loads(body))
+            time.sleep(delay)
+            return self._reply(200, completion)
+
+        delay, failed, throttled = self.state.draw()
+        time.sleep(delay)
+        if throttled:
+            self.state.count("429")
+            return self._reply(429, {"error": "too many requests"}, {"Retry-After": "1"})
+        if failed:
+            self.state.count("5xx")
+            return self._reply(503, {"error": "service unavailable"})
+
+        if endpoint == "tvcoins/details":
+            return self._reply(200, "{}")
+        if endpoint == "accounts/signin":
+            return self._reply(200, {"user": {"username": "mock"}}, {"Set-Cookie": "sessionid=mock-session; Path=/"})
+        if endpoint == "pine-facade/save/new_draft":
+            form = {key: values[0] for key, values in parse_qs(body).items()}
+            return self._reply(200, self.state.compile(form.get("source", "")))
+        if endpoint == "pine-facade/list":
+            filter_type = parse_qs(url.query).get("filter", ["published"])[0]
+            return self._reply(200, self.state.listing(filter_type))
+        if endpoint == "pine-facade/get" and len(parts) >= 3:
+            name = parts[2].split(";")[-1]
+            return self._reply(200, {"source": f"//@version=5\nindicator('{name}')\nplot(close)\n"})
+        if endpoint == "pine-facade/translate" and len(parts) >= 3:
+            return self._reply(200, {"scriptIdPart": parts[2], "version": parts[3] if len(parts) > 3 else "1"})
+        return self._reply(404, {"error": f"unknown endpoint {url.path}"})
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+def serve(state: MockState, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    """Starts the mock on a background thread and returns the server (call `shutdown()` to stop it)."""
+    handler = type("BoundHandler", (Handler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the pine-facade / TradingView endpoints.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="lognormal:0.3,0.5", help="fixed:S, uniform:LO,HI or lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--error-rate", type=float, default=0.01, help="fraction of requests answered with a 503")
+    parser.add_argument("--rate-limit", type=float, default=20.0, help="requests/second before 429s, 0 to disable")
+    parser.add_argument("--compiler", choices=["lint", "random"], default="lint")
+    parser.add_argument("--success-rate", type=float, default=0.5, help="compile success rate in random mode")
+    parser.add_argument("--scripts", type=int, default=200, help="scripts per listing")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-latency", default="lognormal:2.0,0.4", help="latency of fake chat completions")
+    parser.add_argument("--llm-success-rate", type=float, default=0.6, help="fake completions that compile")
+    args = parser.parse_args()
+
+    state = MockState(
+        Latency(args.latency),
+        args.error_rate,
+        args.rate_limit,
+        args.compiler,
+        args.success_rate,
+        args.scripts,
+        args.seed,
+        Latency(args.llm_latency),
+        args.llm_success_rate,
+    )
+    server = serve(state, args.host, args.port)
+    base = f"http://{args.host}:{args.port}"
+    print(f"mock pine-facade on {base}")
+    print(f"  export TV_BASE_URL={base} PINE_FACADE_URL={base}/pine-facade/ OPENAI_API_BASE={base}/v1")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(dict(state.counters))
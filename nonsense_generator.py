@@ -1,9 +1,17 @@
+import abc
+import argparse
+import io
+import json
+import os
 import random
 import string
-from typing import List, Optional, Union, Dict
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, List, Optional, Set, Union, Dict, Tuple
 
 # Generate some randome Nonsense pine(ish), someewhat done..
-# does not match types to values quite yet..
+# does not match types to values, unless asked to: Generator(typed=True) / --typed
 # Example output (mildly formatted):
 
 """
@@ -94,12 +102,151 @@ KEYWORDS = ["if", "else", "for", "while", "switch"]
 OPERATORS = ["+", "-", "*", "/", "%", "=", "+=", "-=", "*=", "/=", "%=", ":="]
 BUILT_IN_FUNCTIONS = ["ta.sma", "ta.ema", "ta.rsi", "ta.macd"]
 CONTROL_STRUCTURES = ["if", "for", "while", "switch"]
+
+# Random text is drawn in blocks: one `random.randbytes` call yields thousands of letters and word
+# lengths, instead of a `random.choice` per character. Bytes are mapped onto the alphabet and onto
+# the lengths 3-7 evenly, dropping the few that would bias them, so the distribution is unchanged.
+TEXT_BLOCK = 1 << 14  # random bytes per refill
+LETTER_TABLE = bytes(ord(string.ascii_lowercase[b % 26]) if b < 234 else 0 for b in range(256))
+LETTER_DROP = bytes(range(234, 256))  # 234 = 9 * 26
+LENGTH_TABLE = bytes(3 + b % 5 if b < 255 else 0 for b in range(256))
+LENGTH_DROP = bytes([255])  # 255 = 51 * 5
+
+BASE_TYPES = ["bool", "int", "float", "color", "string"]
+MODIFIERS = [None, "array", "matrix"]
 INDENTATION = "    "  # 4 spaces for indentation
 
+# Typed mode: names Pine already uses (3-7 letters, the length of a random word) are never generated
+RESERVED = {
+    "and", "not", "else", "for", "while", "switch", "var", "varip", "import", "export", "method", "type",
+    "true", "false", "continue", "break", "series", "simple", "const", "input", "int", "float", "bool",
+    "color", "string", "array", "matrix", "map", "line", "label", "box", "table", "close", "open", "high",
+    "low", "volume", "time", "hl2", "hlc3", "ohlc4", "str", "math", "plot", "hline", "fill", "request",
+    "syminfo", "chart", "session", "ticker", "display", "shape", "size", "text", "xloc", "yloc", "extend",
+    "alert", "format", "order", "year", "month", "hour", "minute", "second", "nz", "fixnan", "log",
+    "runtime", "bgcolor", "polyline", "strategy", "library", "indicator", "barstate", "timenow", "location",
+    "position", "scale", "dividends", "earnings", "splits", "currency",
+    "def", "class", "elif", "lambda", "return",  # not Pine, but pine_lint rejects them as Python
+}
+COLORS = ["color.red", "color.green", "color.blue", "color.orange", "color.gray", "color.purple", "color.teal"]
+SERIES = {"float": ["close", "open", "high", "low", "hl2", "volume"], "int": ["bar_index"]}
+ARITHMETIC = {"int": ["+", "-", "*"], "float": ["+", "-", "*"], "string": ["+"]}
+COMPARISONS = ["<", ">", "<=", ">=", "==", "!="]
+MOVING_AVERAGES = ["ta.sma", "ta.ema", "ta.rma", "ta.wma", "ta.rsi"]  # (series float, simple int) -> float
+TYPED_DEPTH = 2  # how deeply expressions nest
+
+
+class Emitter:
+    """
+    Renders nodes into one buffer in a single pass, tracking indentation, so nested structures
+    are written where they stand instead of being rendered to strings and re-indented.
+    """
+
+    __slots__ = ("buffer", "write", "indent")
+
+    def __init__(self):
+        """Initializes an empty Emitter at the top level."""
+        self.buffer: io.StringIO = io.StringIO()
+        self.write = self.buffer.write
+        self.indent: str = ""
+
+    def line(self, text: str = ""):
+        """Writes one line at the current indentation.
+
+        :param text: The line, without indentation or newline.
+        """
+        self.write(f"{self.indent}{text}\n")
+
+    def statement(self, statement: "Statement"):
+        """Writes a body line: plain code, or a node that writes its own lines.
+
+        :param statement: A code line or a Variable, Loop or Conditional.
+        """
+        if isinstance(statement, str):
+            self.write(f"{self.indent}{statement}\n")
+        else:
+            statement.emit(self)
+
+    def block(self, statements: List["Statement"]):
+        """Writes statements one level deeper.
+
+        :param statements: The body to write.
+        """
+        outer = self.indent
+        indent = self.indent = outer + INDENTATION
+        write = self.write
+        for statement in statements:
+            if statement.__class__ is str:
+                write(f"{indent}{statement}\n")
+            else:
+                statement.emit(self)
+        self.indent = outer
+
+    def text(self) -> str:
+        """Returns everything written so far.
+
+        :return: The rendered text.
+        """
+        return self.buffer.getvalue()
+
+
+class Node(abc.ABC):
+    """Base for the script nodes: `str()` renders a node through an Emitter."""
+
+    __slots__ = ()
+
+    @abc.abstractmethod
+    def emit(self, out: Emitter):
+        """Writes the node's lines.
+
+        :param out: The Emitter to write to.
+        """
+
+    def __str__(self) -> str:
+        """Returns the node as a string, without a newline after its last line.
+
+        :return: The rendered node.
+        """
+        out = Emitter()
+        self.emit(out)
+        return out.text()[:-1]
+
+
+class TextSource:
+    """Random lowercase words, cut from blocks of random bytes; seeded by the module-level `random`."""
 
-class Import:
+    __slots__ = ("letters", "lengths", "letter_position", "length_position")
+
+    def __init__(self):
+        """Initializes an empty TextSource; the first word draws the first block."""
+        self.letters: str = ""
+        self.lengths: bytes = b""
+        self.letter_position: int = 0
+        self.length_position: int = 0
+
+    def word(self) -> str:
+        """Returns a word of 3 to 7 random lowercase letters.
+
+        :return: A random word.
+        """
+        if self.length_position >= len(self.lengths):
+            self.lengths = random.randbytes(TEXT_BLOCK // 4).translate(LENGTH_TABLE, LENGTH_DROP)
+            self.length_position = 0
+        length = self.lengths[self.length_position]
+        self.length_position += 1
+        start = self.letter_position
+        if start + length > len(self.letters):
+            self.letters = random.randbytes(TEXT_BLOCK).translate(LETTER_TABLE, LETTER_DROP).decode("ascii")
+            start = 0
+        self.letter_position = start + length
+        return self.letters[start : start + length]
+
+
+class Import(Node):
     """Represents an import statement with user, script, version, and optional alias."""
 
+    __slots__ = ("user", "script", "version", "alias")
+
     def __init__(self, user: str, script: str, version: int, alias: Optional[str] = None):
         """Initializes an Import object.
 
@@ -121,12 +268,17 @@ class Import:
         base_import = f"import {self.user}/{self.script}/{self.version}"
         return f"{base_import} as {self.alias}" if self.alias else base_import
 
+    def emit(self, out: Emitter):
+        out.write(f"{out.indent}{self}\n")
+
 
 class StorageType:
     """
     Defines a storage type with a base type and optional modifiers like array or matrix.
     """
 
+    __slots__ = ("base_type", "modifier")
+
     def __init__(self, base_type: str, modifier: Optional[str] = None):
         """Initializes a StorageType object.
 
@@ -151,14 +303,22 @@ class StorageType:
 
         :return: A randomly generated StorageType.
         """
-        base_type = random.choice(["bool", "int", "float", "color", "string"])
-        modifier = random.choice([None, "array", "matrix"])
-        return StorageType(base_type, modifier)
+        base_type = random.choice(BASE_TYPES)
+        modifier = random.choice(MODIFIERS)
+        return STORAGE_TYPES[base_type, modifier]
 
 
-class Annotation:
+# StorageTypes are never modified, so every node shares one instance per type
+STORAGE_TYPES: Dict[Tuple[str, Optional[str]], StorageType] = {
+    (base_type, modifier): StorageType(base_type, modifier) for base_type in BASE_TYPES for modifier in MODIFIERS
+}
+
+
+class Annotation(Node):
     """Represents an annotation with a tag and description."""
 
+    __slots__ = ("tag", "description")
+
     def __init__(self, tag: str, description: str):
         """Initializes an Annotation object.
 
@@ -175,10 +335,15 @@ class Annotation:
         """
         return f"// @{self.tag} {self.description}"
 
+    def emit(self, out: Emitter):
+        out.write(f"{out.indent}{self}\n")
 
-class Field:
+
+class Field(Node):
     """Represents a field within a User-Defined Type (UDT)."""
 
+    __slots__ = ("name", "storage_type", "default_value", "description")
+
     def __init__(
         self,
         name: str,
@@ -205,12 +370,17 @@ class Field:
         """
         default_str = f" = {self.default_value}" if self.default_value else ""
         desc_str = f" // @field {self.description}" if self.description else ""
-        return f"  {self.storage_type} {self.name}{default_str}{desc_str}"
+        return f"{self.storage_type} {self.name}{default_str}{desc_str}"
+
+    def emit(self, out: Emitter):
+        out.write(f"{out.indent}{self}\n")
 
 
 class Parameter:
     """Represents a function parameter."""
 
+    __slots__ = ("name", "storage_type", "default_value", "description", "annotation")
+
     def __init__(
         self,
         name: str,
@@ -244,39 +414,53 @@ class Parameter:
         return f"{self.name}"
 
 
-class UDT:
+class UDT(Node):
     """Represents a User-Defined Type (UDT)."""
 
+    __slots__ = ("name", "fields", "description", "annotation", "field_indent")
+
     def __init__(
         self,
         name: str,
         fields: List[Field],
         description: Optional[str] = None,
+        field_indent: str = "  ",
     ):
         """Initializes a UDT object.
 
         :param name: The name of the UDT.
         :param fields: The list of Fields that make up the UDT.
         :param description: The description of the UDT, if any.
+        :param field_indent: The indentation of the field lines; Pine itself wants INDENTATION.
         """
         self.name: str = name
         self.fields: List[Field] = fields
         self.description: Optional[str] = description
+        self.field_indent: str = field_indent
         self.annotation: Optional[Annotation] = Annotation("type", description) if description else None
 
-    def __str__(self) -> str:
-        """Returns the UDT definition as a string.
+    def emit(self, out: Emitter):
+        """Writes the UDT definition: its description, the `type` line and one line per field.
 
-        :return: The formatted UDT definition.
+        :param out: The Emitter to write to.
         """
-        type_desc = f"// @type {self.description}\n" if self.description else ""
-        field_str = "\n".join(str(f) for f in self.fields)
-        return f"{type_desc}type {self.name} \n{field_str}"
+        if self.description:
+            out.line(f"// @type {self.description}")
+        out.line(f"type {self.name} ")
+        outer = out.indent
+        out.indent = outer + self.field_indent
+        for field in self.fields:
+            field.emit(out)
+        out.indent = outer
+        if not self.fields:
+            out.line()
 
 
 class ReturnValue:
     """Represents a function's return value."""
 
+    __slots__ = ("storage_type", "description")
+
     def __init__(
         self,
         storage_type: Optional[StorageType] = None,
@@ -298,15 +482,17 @@ class ReturnValue:
         return str(self.storage_type) if self.storage_type else ""
 
 
-class Function:
+class Function(Node):
     """Represents a function definition."""
 
+    __slots__ = ("name", "parameters", "return_value", "body", "description", "annotations")
+
     def __init__(
         self,
         name: str,
         parameters: List[Parameter],
         return_value: ReturnValue,
-        body: Optional[List[str]] = None,
+        body: Optional[List["Statement"]] = None,
         description: Optional[str] = None,
     ):
         """Initializes a Function object.
@@ -314,33 +500,34 @@ class Function:
         :param name: The name of the function.
         :param parameters: The list of Parameters for the function.
         :param return_value: The ReturnValue of the function.
-        :param body: The body of the function, a list of code lines.
+        :param body: The body of the function, a list of code lines and nodes.
         :param description: The description of the function, if any.
         """
         self.name: str = name
         self.parameters: List[Parameter] = parameters
         self.return_value: ReturnValue = return_value
-        self.body: Optional[List[str]] = body
+        self.body: Optional[List[Statement]] = body
         self.description: Optional[str] = description
         self.annotations: List[Annotation] = [p.annotation for p in parameters if p.annotation]
 
-    def __str__(self) -> str:
-        """Returns the function definition as a string.
+    def emit(self, out: Emitter):
+        """Writes the function header and its indented body, followed by a blank line.
 
-        :return: The formatted function definition.
+        :param out: The Emitter to write to.
         """
         param_str = ", ".join(str(p) for p in self.parameters)
-        body_str = ""
+        return_str = str(self.return_value)
+        out.line(f"{self.name}({param_str}) => {return_str}" if return_str else f"{self.name}({param_str}) =>")
         if self.body:
-            indented_body = [f"{INDENTATION}{line}" for line in self.body]  # Indent each line
-            body_str = "\n" + "\n".join(indented_body) + "\n"
-
-        return f"{self.name}({param_str}) => {self.return_value}{body_str}"
+            out.block(self.body)
+            out.line()
 
 
-class Variable:
+class Variable(Node):
     """Represents a variable declaration."""
 
+    __slots__ = ("name", "storage_type", "value", "is_var", "is_varip", "description")
+
     def __init__(
         self,
         name: str,
@@ -380,79 +567,101 @@ class Variable:
         desc_str = f" // {self.description}" if self.description else ""
         return f"{var_prefix}{self.storage_type} {self.name}{value_str}{desc_str}"
 
+    def emit(self, out: Emitter):
+        out.write(f"{out.indent}{self}\n")
+
 
-class Loop:
+class Loop(Node):
     """Represents a loop (for or while) structure."""
 
+    __slots__ = ("loop_type", "condition", "body")
+
     def __init__(
         self,
         loop_type: str,
         condition: Optional[str] = None,
-        body: Optional[List[str]] = None,
+        body: Optional[List["Statement"]] = None,
     ):
         """Initializes a Loop object.
 
         :param loop_type: The type of loop ("for" or "while").
         :param condition: The loop condition (for while loops).
-        :param body: The body of the loop, a list of code lines.
+        :param body: The body of the loop, a list of code lines and nodes.
         """
         self.loop_type: str = loop_type
         self.condition: Optional[str] = condition
-        self.body: Optional[List[str]] = body
+        self.body: Optional[List[Statement]] = body
 
-    def __str__(self) -> str:
-        """Returns the loop structure as a string.
+    def emit(self, out: Emitter):
+        """Writes the loop header and its indented body, followed by a blank line.
 
-        :return: The formatted loop structure.
+        :param out: The Emitter to write to.
         """
-        body_str = ""
+        if self.loop_type not in ("for", "while"):
+            out.line()
+            return
+        out.line(f"{self.loop_type} {self.condition}")
         if self.body:
-            indented_body = [f"{INDENTATION}{line}" for line in self.body]
-            body_str = "\n" + "\n".join(indented_body) + "\n"
-
-        if self.loop_type == "for":
-            return f"for {self.condition}{body_str}"
-        elif self.loop_type == "while":
-            return f"while {self.condition}{body_str}"
-        else:
-            return ""
+            out.block(self.body)
+            out.line()
 
 
-class Conditional:
+class Conditional(Node):
     """Represents an if-else statement."""
 
+    __slots__ = ("condition", "if_body", "else_body")
+
     def __init__(
         self,
         condition: str,
-        if_body: List[str],
-        else_body: Optional[List[str]] = None,
+        if_body: List["Statement"],
+        else_body: Optional[List["Statement"]] = None,
     ):
         """Initializes a Conditional object.
 
         :param condition: The condition for the if statement.
-        :param if_body: The body of the if block, a list of code lines.
-        :param else_body: The body of the else block, if any, a list of code lines.
+        :param if_body: The body of the if block, a list of code lines and nodes.
+        :param else_body: The body of the else block, if any, a list of code lines and nodes.
         """
         self.condition: str = condition
-        self.if_body: List[str] = if_body
-        self.else_body: Optional[List[str]] = else_body
+        self.if_body: List[Statement] = if_body
+        self.else_body: Optional[List[Statement]] = else_body
 
-    def __str__(self) -> str:
-        """Returns the if-else statement as a string.
+    def emit(self, out: Emitter):
+        """Writes the if statement, its indented body, and the else block if there is one.
 
-        :return: The formatted if-else statement.
+        :param out: The Emitter to write to.
         """
-        if_body_str = "\n".join([f"{INDENTATION}{line}" for line in self.if_body])
-        else_body_str = ""
+        out.line(f"if {self.condition}")
+        if self.if_body:
+            out.block(self.if_body)
+        else:
+            out.line()
         if self.else_body:
-            else_body_str = "\n".join([f"{INDENTATION}{line}" for line in self.else_body])
-            return f"if {self.condition}\n{if_body_str}\nelse\n{else_body_str}"
-        return f"if {self.condition}\n{if_body_str}"
+            out.line("else")
+            out.block(self.else_body)
+
+
+# A line in a body: plain code (a call, a value) or a node that renders its own lines
+Statement = Union[str, Variable, Loop, Conditional]
 
 
-class Script:
+class Script(Node):
     """Represents a complete script."""
 
+    __slots__ = (
+        "name",
+        "imports",
+        "udts",
+        "functions",
+        "variables",
+        "body",
+        "description",
+        "annotation",
+        "version",
+        "declaration",
+    )
+
     def __init__(
         self,
         name: str,
@@ -460,8 +669,10 @@ class Script:
         udts: List[UDT],
         functions: List[Function],
         variables: List[Variable],
-        body: List[str],
+        body: List[Statement],
         description: Optional[str] = None,
+        version: Optional[int] = None,
+        declaration: Optional[str] = None,
     ):
         """Initializes a Script object.
 
@@ -469,54 +680,343 @@ class Script:
         :param imports: The list of Imports used in the script.
         :param udts: The list of UDTs defined in the script.
         :param functions: The list of Functions defined in the script.
-        :param body: The main body of the script, a list of code lines.
+        :param body: The main body of the script, a list of code lines and nodes.
         :param description: The description of the script, if any.
+        :param version: The Pine version for a `//@version=` line, if any.
+        :param declaration: The declaration statement, e.g. `indicator("name")`, if any.
         """
         self.name: str = name
         self.imports: List[Import] = imports
         self.udts: List[UDT] = udts
         self.functions: List[Function] = functions
         self.variables: List[Variable] = variables
-        self.body: List[str] = body
+        self.body: List[Statement] = body
         self.description: Optional[str] = description
         self.annotation: Optional[Annotation] = Annotation("description", description) if description else None
+        self.version: Optional[int] = version
+        self.declaration: Optional[str] = declaration
+
+    def emit(self, out: Emitter):
+        """Writes the script: version, annotation, declaration, imports, UDTs, variables, functions
+        and body, one section after another, with an empty line for each empty section.
+
+        :param out: The Emitter to write to.
+        """
+        if self.version is not None:
+            out.line(f"//@version={self.version}")
+        if self.annotation:
+            self.annotation.emit(out)
+        else:
+            out.line()
+        if self.declaration:
+            out.line(self.declaration)
+        for section in (self.imports, self.udts, self.variables, self.functions, self.body):
+            for statement in section:
+                out.statement(statement)
+            if not section:
+                out.line()
 
-    def __str__(self):
+    def __str__(self) -> str:
         """
         for testing, not a part of the script exactly, but could be to export it.
         """
-        script_code_content = ""
-        script_code_content += str(self.annotation) if self.annotation else ""
-        script_code_content += "\n"
-        script_code_content += "\n".join([str(imp) for imp in self.imports])
-        script_code_content += "\n"
-        script_code_content += "\n".join([str(udt) for udt in self.udts])
-        script_code_content += "\n"
-        script_code_content += "\n".join([str(variable) for variable in self.variables])
-        script_code_content += "\n"
-        script_code_content += "\n".join([str(func) for func in self.functions])
-        script_code_content += "\n"
-        script_code_content += "\n".join(self.body)
-        script_code_content += "\n"
-        return script_code_content
+        out = Emitter()
+        self.emit(out)
+        return out.text()
+
+
+class Scope:
+    """The variables visible in one block of a typed script, and through `parent` the blocks around it."""
+
+    __slots__ = ("parent", "symbols")
+
+    def __init__(self, parent: Optional["Scope"] = None):
+        """Initializes an empty Scope.
+
+        :param parent: The enclosing block's Scope, None for the script's global scope.
+        """
+        self.parent: Optional[Scope] = parent
+        self.symbols: Dict[str, StorageType] = {}
+
+    def declare(self, name: str, storage_type: StorageType):
+        """Makes a variable visible in this block from here on.
+
+        :param name: The variable name.
+        :param storage_type: Its declared StorageType.
+        """
+        self.symbols[name] = storage_type
+
+    def names(self, storage_type: StorageType) -> List[str]:
+        """Returns the visible variables of a type, innermost block first.
+
+        :param storage_type: The StorageType to look for.
+        :return: The variable names.
+        """
+        found: List[str] = []
+        scope: Optional[Scope] = self
+        while scope is not None:
+            found.extend(name for name, declared in scope.symbols.items() if declared is storage_type)
+            scope = scope.parent
+        return found
+
+
+# A grammar production, `site:option`, or an (enclosing constructs, production) pair
+Production = Union[str, Tuple[str, str]]
+
+
+def _encode(key: Production) -> Union[str, List[str]]:
+    return list(key) if isinstance(key, tuple) else key
+
+
+def _decode(key: Union[str, List[str]]) -> Production:
+    return tuple(key) if isinstance(key, list) else key
+
+
+def random_state() -> List[Any]:
+    """The module-level random state as JSON-able data."""
+    version, internal, gauss_next = random.getstate()
+    return [version, list(internal), gauss_next]
+
+
+def set_random_state(state: List[Any]):
+    version, internal, gauss_next = state
+    random.setstate((version, tuple(internal), gauss_next))
+
+
+class Coverage:
+    """
+    Grammar coverage of generated scripts: how often each production (an option chosen at a
+    choice site, e.g. `modifier:matrix`) and each pairing of a production with the constructs
+    it is nested in (e.g. `script>function>if` + `declaration:varip`) has been generated. A Generator given a Coverage picks
+    options weighted toward the rarely generated ones instead of uniformly.
+    """
+
+    __slots__ = ("counts", "known", "first_seen", "samples")
+
+    def __init__(self):
+        """Initializes an empty Coverage."""
+        self.counts: Counter = Counter()
+        self.known: Set[Production] = set()  # every production and pair that was on offer
+        self.first_seen: Dict[Production, int] = {}  # the sample that first generated it
+        self.samples: int = 0
+
+    def choose(self, site: str, options: List[Any], context: str) -> Any:
+        """Picks an option, each weighted by how rarely it and its pairing with `context` were generated.
+
+        :param site: The name of the choice, e.g. "modifier".
+        :param options: The options on offer.
+        :param context: The constructs the choice is made in, e.g. "script>function>if".
+        :return: The chosen option.
+        """
+        weights = []
+        for option in options:
+            production = f"{site}:{option}"
+            pair = (context, production)
+            self.known.add(production)
+            self.known.add(pair)
+            weights.append(1.0 / (1 + self.counts[production]) + 1.0 / (1 + self.counts[pair]))
+        option = random.choices(options, weights)[0]
+        self.record(f"{site}:{option}", context)
+        return option
+
+    def record(self, production: str, context: str):
+        """Counts one generated production and its pair.
+
+        :param production: The production, `site:option`.
+        :param context: The constructs it was generated in.
+        """
+        for key in (production, (context, production)):
+            self.counts[key] += 1
+            self.first_seen.setdefault(key, self.samples + 1)
+
+    def getstate(self) -> Dict[str, Any]:
+        """Returns the counts as JSON-able data, for checkpoints.
+
+        :return: The state, for `setstate`.
+        """
+        return {
+            "counts": [[_encode(key), count] for key, count in self.counts.items()],
+            "known": [_encode(key) for key in self.known],
+            "first_seen": [[_encode(key), sample] for key, sample in self.first_seen.items()],
+            "samples": self.samples,
+        }
+
+    def setstate(self, state: Dict[str, Any]):
+        """Restores counts saved by `getstate`.
+
+        :param state: The saved state.
+        """
+        self.counts = Counter({_decode(key): count for key, count in state["counts"]})
+        self.known = {_decode(key) for key in state["known"]}
+        self.first_seen = {_decode(key): sample for key, sample in state["first_seen"]}
+        self.samples = state["samples"]
+
+    def covered(self, universe: Set[Production], samples: int) -> Tuple[int, int]:
+        """Counts what the first `samples` scripts covered of a set of productions and pairs.
+
+        :param universe: The productions and pairs to count against.
+        :param samples: The number of scripts.
+        :return: Covered productions, covered pairs.
+        """
+        seen = [key for key in universe if self.first_seen.get(key, samples + 1) <= samples]
+        pairs = sum(1 for key in seen if isinstance(key, tuple))
+        return len(seen) - pairs, pairs
+
+
+def coverage_report(count: int, typed: bool = False, seed: int = 0) -> str:
+    """Generates `count` scripts uniformly and `count` coverage-guided, and tabulates the coverage
+    of both against the number of scripts, out of every production and pair either run offered.
+
+    :param count: Scripts per run.
+    :param typed: Generate typed scripts.
+    :param seed: The seed both runs start from.
+    :return: The table.
+    """
+    runs: Dict[str, Coverage] = {}
+    for label, guided in (("uniform", False), ("guided", True)):
+        random.seed(seed)
+        tracking = Coverage()
+        for _ in range(count):
+            Generator(typed, tracking, guided).script()
+        runs[label] = tracking
+    universe = runs["uniform"].known | runs["guided"].known
+    productions = sum(1 for key in universe if isinstance(key, str))
+    pairs = len(universe) - productions
+    lines = [f"{'scripts':>8}  {'uniform':>19}  {'guided':>19}   (of {productions} productions, {pairs} pairs)"]
+    checkpoints = sorted({n for n in (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10_000) if n < count} | {count})
+    for n in checkpoints:
+        columns = []
+        for label in ("uniform", "guided"):
+            covered_productions, covered_pairs = runs[label].covered(universe, n)
+            columns.append(f"{covered_productions:>4} + {covered_pairs:>4} pairs")
+        lines.append(f"{n:>8}  {columns[0]:>19}  {columns[1]:>19}")
+    return "\n".join(lines)
+
+
+INT = STORAGE_TYPES["int", None]
+FLOAT = STORAGE_TYPES["float", None]
+BOOL = STORAGE_TYPES["bool", None]
 
 
 class Generator:
     """Generates random script components for testing."""
 
-    def __init__(self):
-        """Initializes the Generator with empty lists for tracking generated components."""
+    def __init__(self, typed: bool = False, coverage: Optional[Coverage] = None, guided: bool = True):
+        """Initializes the Generator with empty lists for tracking generated components.
+
+        :param typed: Generate type-consistent scripts with scoped names (see `typed_script`),
+            instead of the untyped nonsense `script` produces by default.
+        :param coverage: Record the grammar productions generated into this Coverage, which can be
+            shared by the Generators of many scripts.
+        :param guided: With a Coverage, weight choices toward rarely generated productions;
+            otherwise choices stay uniform and the Coverage only counts.
+        """
         self.generated_udt_names: List[str] = []
         self.generated_function_names: List[str] = []
         self.generated_variable_names: List[str] = []
+        self.text: TextSource = TextSource()
+        self.typed: bool = typed
+        self.used_names: Set[str] = set()
+        self.signatures: Dict[str, Tuple[List[StorageType], StorageType]] = {}
+        self.coverage: Optional[Coverage] = coverage
+        self.guided: bool = guided and coverage is not None
+        self.context: List[str] = ["script"]  # the constructs being generated, innermost last
+
+    def getstate(self) -> Dict[str, Any]:
+        """Returns everything needed to carry on generating exactly where this Generator stands, as
+        JSON-able data: the module-level random state it draws from, its text buffer, the names and
+        signatures generated so far and the construct it is in. A Coverage, which may be shared
+        between Generators, is saved with its own `getstate`.
+
+        :return: The state, for `setstate`.
+        """
+        return {
+            "random": random_state(),
+            "text": [self.text.letters, self.text.lengths.hex(), self.text.letter_position, self.text.length_position],
+            "generated_udt_names": list(self.generated_udt_names),
+            "generated_function_names": list(self.generated_function_names),
+            "generated_variable_names": list(self.generated_variable_names),
+            "used_names": sorted(self.used_names),
+            "signatures": {
+                name: [[[p.base_type, p.modifier] for p in parameters], [returns.base_type, returns.modifier]]
+                for name, (parameters, returns) in self.signatures.items()
+            },
+            "typed": self.typed,
+            "guided": self.guided,
+            "context": list(self.context),
+        }
+
+    def setstate(self, state: Dict[str, Any]):
+        """Restores a state saved by `getstate`, including the module-level random state.
+
+        :param state: The saved state.
+        """
+        set_random_state(state["random"])
+        letters, lengths, letter_position, length_position = state["text"]
+        self.text.letters = letters
+        self.text.lengths = bytes.fromhex(lengths)
+        self.text.letter_position = letter_position
+        self.text.length_position = length_position
+        self.generated_udt_names = list(state["generated_udt_names"])
+        self.generated_function_names = list(state["generated_function_names"])
+        self.generated_variable_names = list(state["generated_variable_names"])
+        self.used_names = set(state["used_names"])
+        self.signatures = {
+            name: ([STORAGE_TYPES[tuple(p)] for p in parameters], STORAGE_TYPES[tuple(returns)])
+            for name, (parameters, returns) in state["signatures"].items()
+        }
+        self.typed = state["typed"]
+        self.guided = state["guided"] and self.coverage is not None
+        self.context = list(state["context"])
+
+    def choose(self, site: str, options: List[Any]) -> Any:
+        """Picks one of the options for a grammar choice: uniformly, or guided by the Coverage.
+
+        :param site: The name of the choice, e.g. "modifier".
+        :param options: The options.
+        :return: The chosen option.
+        """
+        if self.guided:
+            return self.coverage.choose(site, options, ">".join(self.context))
+        option = random.choice(options)
+        if self.coverage is not None:
+            self.track(site, options, option)
+        return option
+
+    def track(self, site: str, options: List[Any], option: Any):
+        """Records an unguided choice in the Coverage.
+
+        :param site: The name of the choice.
+        :param options: The options there were.
+        :param option: The one chosen.
+        """
+        context = ">".join(self.context)
+        self.coverage.known.update(f"{site}:{other}" for other in options)
+        self.coverage.known.update((context, f"{site}:{other}") for other in options)
+        self.coverage.record(f"{site}:{option}", context)
 
-    @staticmethod
-    def random_word() -> str:
+    def declaration(self, allow_varip: bool = True) -> Tuple[bool, bool]:
+        """Chooses how a variable is declared.
+
+        :param allow_varip: Whether `varip` is an option.
+        :return: is_var, is_varip.
+        """
+        options = ["var", "varip", "plain"] if allow_varip else ["var", "plain"]
+        if self.guided:
+            kind = self.choose("declaration", options)
+            return kind == "var", kind == "varip"
+        is_var = random.choice([True, False])
+        is_varip = False if is_var or not allow_varip else random.choice([True, False])
+        if self.coverage is not None:
+            self.track("declaration", options, "var" if is_var else "varip" if is_varip else "plain")
+        return is_var, is_varip
+
+    def random_word(self) -> str:
         """Generates a random word.
 
         :return: A random word.
         """
-        return "".join(random.choice(string.ascii_lowercase) for _ in range(random.randint(3, 7)))
+        return self.text.word()
 
     def random_sentence(self, min_words: int = 3, max_words: int = 7) -> str:
         """Generates a random sentence.
@@ -525,7 +1025,8 @@ class Generator:
         :param max_words: The maximum number of words in the sentence.
         :return: A random sentence.
         """
-        return " ".join(self.random_word() for _ in range(random.randint(min_words, max_words)))
+        word = self.text.word
+        return " ".join([word() for _ in range(random.randint(min_words, max_words))])
 
     def random_name(self, prefix: Optional[str] = None) -> str:
         """Generates a random name, optionally with a prefix.
@@ -541,14 +1042,14 @@ class Generator:
 
         :return: A randomly generated StorageType.
         """
-        return StorageType.random()
+        return STORAGE_TYPES[self.choose("type", BASE_TYPES), self.choose("modifier", MODIFIERS)]
 
     def default_value(self) -> str:
         """Generates a random default value.
 
         :return: A random default value as a string.
         """
-        value_type = random.choice(["INT", "FLOAT", "BOOL", "STRING", "NA"])
+        value_type = self.choose("value", ["INT", "FLOAT", "BOOL", "STRING", "NA"])
         if value_type == "INT":
             return str(random.randint(0, 100))
         if value_type == "FLOAT":
@@ -583,8 +1084,10 @@ class Generator:
         """
         name = self.random_name()
         self.generated_udt_names.append(name)
+        self.context.append("udt")
         num_fields = random.randint(1, 5)
         fields = [self.udt_field(name, i) for i in range(1, num_fields + 1)]
+        self.context.pop()
         description = self.random_sentence()
         return UDT(name, fields, description)
 
@@ -594,8 +1097,10 @@ class Generator:
         :return: A randomly generated Parameter.
         """
         name = self.random_name()
+        self.context.append("parameter")
         storage_type = self.storage_type()
         default_value = self.default_value() if storage_type.modifier is None else None
+        self.context.pop()
         description = self.random_sentence()
         return Parameter(name, storage_type, default_value, description)
 
@@ -608,22 +1113,22 @@ class Generator:
         description = self.random_sentence()
         return ReturnValue(storage_type, description)
 
-    def generate_function_body(self, return_storage_type: Optional[StorageType]) -> List[str]:
+    def generate_function_body(self, return_storage_type: Optional[StorageType]) -> List[Statement]:
         """Generates a random function body.
 
         :param return_storage_type: The StorageType of the function's return value.
-        :return: A list of code lines representing the function body.
+        :return: A list of code lines and nodes representing the function body.
         """
-        body: List[str] = []
+        body: List[Statement] = []
         num_lines = random.randint(1, 10)
 
         for _ in range(num_lines):
-            line_type = random.choice(["variable", "control_structure", "function_call", "return"])
+            line_type = self.choose("statement", ["variable", "control_structure", "function_call", "return"])
 
             if line_type == "variable":
-                body.append(str(self.variable()))
+                body.append(self.variable())
             elif line_type == "control_structure":
-                body.extend(str(self.control_structure()).split("\n"))  # Split into lines
+                body.append(self.control_structure())
             elif line_type == "function_call":
                 body.append(self.generate_function_call())
             elif line_type == "return" and return_storage_type:
@@ -633,7 +1138,7 @@ class Generator:
                     body.append(f"{self.default_value()}")
 
         # Ensure the function returns a value if it's supposed to
-        if return_storage_type and not any(line.startswith("return") for line in body):
+        if return_storage_type and not any(isinstance(line, str) and line.startswith("return") for line in body):
             if return_storage_type.modifier in ["array", "matrix"]:
                 body.append(f"{self.generate_empty_structure(return_storage_type)}")
             else:
@@ -663,12 +1168,14 @@ class Generator:
         """
         name = self.random_name()
         self.generated_function_names.append(name)
+        self.context.append("function")
 
         num_params = random.randint(0, 5)
         parameters = [self.parameter() for _ in range(num_params)]
 
         return_value = self.return_value()
         body = self.generate_function_body(return_value.storage_type)
+        self.context.pop()
 
         description = self.random_sentence()
         return Function(name, parameters, return_value, body, description)
@@ -694,8 +1201,7 @@ class Generator:
         self.generated_variable_names.append(name)
 
         storage_type = self.storage_type()
-        is_var = random.choice([True, False])
-        is_varip = False if is_var else random.choice([True, False])
+        is_var, is_varip = self.declaration()
         value = self.default_value() if not is_varip else None
         description = self.random_sentence()
         return Variable(name, storage_type, value, is_var, is_varip, description)
@@ -710,6 +1216,15 @@ class Generator:
         right_operand = random.choice(self.generated_variable_names + [self.default_value()])
         return f"{left_operand} {operator} {right_operand}"
 
+    def simple_statement(self) -> Statement:
+        """Generates a line of a loop or if body: a variable or a function call.
+
+        :return: A Variable or a function call string.
+        """
+        if self.choose("statement", ["variable", "function_call"]) == "variable":
+            return self.variable()
+        return self.generate_function_call()
+
     def generate_for_loop(self) -> Loop:
         """Generates a random for loop.
 
@@ -719,7 +1234,9 @@ class Generator:
         start_value = random.randint(0, 5)
         end_value = random.randint(start_value + 1, 10)
         condition = f"{counter_variable} = {start_value} to {end_value}"
-        body = [str(self.variable()) if random.choice([True, False]) else self.generate_function_call() for _ in range(random.randint(1, 3))]  # Simple body for the loop
+        self.context.append("for")
+        body = [self.simple_statement() for _ in range(random.randint(1, 3))]  # Simple body for the loop
+        self.context.pop()
         return Loop("for", condition, body)
 
     def generate_while_loop(self) -> Loop:
@@ -727,8 +1244,10 @@ class Generator:
 
         :return: A Loop object representing a while loop.
         """
+        self.context.append("while")
         condition = self.generate_condition()
-        body = [str(self.variable()) if random.choice([True, False]) else self.generate_function_call() for _ in range(random.randint(1, 3))]  # Simple body for the loop
+        body = [self.simple_statement() for _ in range(random.randint(1, 3))]  # Simple body for the loop
+        self.context.pop()
         return Loop("while", condition, body)
 
     def generate_if_statement(self) -> Conditional:
@@ -736,9 +1255,14 @@ class Generator:
 
         :return: A Conditional object representing an if-else statement.
         """
+        self.context.append("if")
         condition = self.generate_condition()
-        if_body = [str(self.variable()) if random.choice([True, False]) else self.generate_function_call() for _ in range(random.randint(1, 3))]  # Simple body for the if block
-        else_body = [str(self.variable()) if random.choice([True, False]) else self.generate_function_call() for _ in range(random.randint(1, 3))] if random.choice([True, False]) else None  # Optional else block
+        if_body = [self.simple_statement() for _ in range(random.randint(1, 3))]  # Simple body for the if block
+        else_body = None
+        if self.choose("else", [True, False]):  # Optional else block
+            self.context[-1] = "else"
+            else_body = [self.simple_statement() for _ in range(random.randint(1, 3))]
+        self.context.pop()
         return Conditional(condition, if_body, else_body)
 
     def control_structure(self) -> Union[Loop, Conditional]:
@@ -746,7 +1270,7 @@ class Generator:
 
         :return: A Loop or Conditional object.
         """
-        structure_type = random.choice(CONTROL_STRUCTURES)
+        structure_type = self.choose("control", CONTROL_STRUCTURES)
 
         if structure_type == "for":
             return self.generate_for_loop()
@@ -773,6 +1297,8 @@ class Generator:
 
         :return: A randomly generated Script.
         """
+        if self.typed:
+            return self.typed_script()
         name = self.random_name()
 
         # Generate imports
@@ -792,23 +1318,504 @@ class Generator:
         functions = [self.function() for _ in range(num_functions)]
 
         # Generate the main body of the script
-        body: List[str] = []
+        body: List[Statement] = []
         num_body_lines = random.randint(0, 20)
         for _ in range(num_body_lines):
-            line_type = random.choice(["variable", "control_structure", "function_call"])
+            line_type = self.choose("statement", ["variable", "control_structure", "function_call"])
             if line_type == "variable":
-                body.append(str(self.variable()))
+                body.append(self.variable())
             elif line_type == "control_structure":
-                body.extend(str(self.control_structure()).split("\n"))
+                body.append(self.control_structure())
             elif line_type == "function_call":
                 body.append(self.generate_function_call())
 
         description = self.random_sentence()
+        if self.coverage is not None:
+            self.coverage.samples += 1
         return Script(name, imports, udts, functions, variables, body, description)
 
+    # -- Typed generation --
+    # Scripts a compiler could accept: a version and a declaration line, no imports of libraries that
+    # do not exist, values and expressions of the declared type, variables used only where they are
+    # in scope and after they are declared, and calls matching the callee's parameters. Each block
+    # has its own Scope; functions only call functions defined before them.
+
+    def unique_name(self) -> str:
+        """Generates a name used nowhere else in the script and not taken by Pine.
+
+        :return: A new name.
+        """
+        while True:
+            name = self.random_word()
+            if name not in self.used_names and name not in RESERVED:
+                self.used_names.add(name)
+                return name
+
+    def typed_value(self, storage_type: StorageType) -> str:
+        """Generates a literal (or an empty collection) of the given type.
+
+        :param storage_type: The StorageType of the value.
+        :return: The value as a string.
+        """
+        base_type = storage_type.base_type
+        if storage_type.modifier == "array":
+            return f"array.new_{base_type}()"
+        if storage_type.modifier == "matrix":
+            return f"matrix.new<{base_type}>({random.randint(1, 5)}, {random.randint(1, 5)})"
+        if base_type == "int":
+            return str(random.randint(0, 100))
+        if base_type == "float":
+            return str(round(random.uniform(0, 100), 4))
+        if base_type == "bool":
+            return random.choice(["true", "false"])
+        if base_type == "color":
+            return random.choice(COLORS)
+        return f'"{self.random_sentence()}"'
+
+    def typed_expression(self, storage_type: StorageType, scope: Scope, depth: int = 0) -> str:
+        """Generates an expression of the given type from literals, variables in scope, builtin series,
+        operators and calls.
+
+        :param storage_type: The StorageType the expression must have.
+        :param scope: The Scope the expression is evaluated in.
+        :param depth: How deeply this expression is nested; at TYPED_DEPTH only leaves are generated.
+        :return: The expression as a string.
+        """
+        nested = depth < TYPED_DEPTH
+        names = scope.names(storage_type)
+        functions = [name for name, (_, returns) in self.signatures.items() if returns is storage_type] if nested else []
+        base_type = storage_type.base_type if storage_type.modifier is None else None
+        kinds = ["value"]
+        if names:
+            kinds.append("variable")
+        if functions:
+            kinds.append("function_call")
+        if base_type in SERIES:
+            kinds.append("series")
+        if nested and base_type in ARITHMETIC:
+            kinds.append("arithmetic")
+        if nested and base_type == "float":
+            kinds.append("moving_average")
+        if nested and base_type == "bool":
+            kinds.append("comparison")
+
+        kind = self.choose("expression", kinds)
+        if kind == "variable":
+            return random.choice(names)
+        if kind == "series":
+            return random.choice(SERIES[base_type])
+        if kind == "value":
+            return self.typed_value(storage_type)
+        self.context.append(kind)  # the operands are nested in this expression
+        if kind == "function_call":
+            expression = self.typed_call(random.choice(functions), scope, depth + 1)
+        elif kind == "arithmetic":
+            left = self.typed_expression(storage_type, scope, depth + 1)
+            right = self.typed_expression(storage_type, scope, depth + 1)
+            expression = f"{left} {random.choice(ARITHMETIC[base_type])} {right}"
+        elif kind == "moving_average":
+            source = self.typed_expression(FLOAT, scope, depth + 1)
+            expression = f"{random.choice(MOVING_AVERAGES)}({source}, {random.randint(2, 50)})"
+        else:
+            expression = self.typed_condition(scope, depth + 1)
+        self.context.pop()
+        return expression
+
+    def typed_condition(self, scope: Scope, depth: int = 0) -> str:
+        """Generates a bool condition: a bool variable in scope, or a comparison of two numbers.
+
+        :param scope: The Scope the condition is evaluated in.
+        :param depth: How deeply the condition is nested.
+        :return: The condition as a string.
+        """
+        bools = scope.names(BOOL)
+        if bools and random.choice([True, False]):
+            return random.choice(bools)
+        numeric = random.choice([INT, FLOAT])
+        left = self.typed_expression(numeric, scope, depth + 1)
+        right = self.typed_expression(numeric, scope, depth + 1)
+        return f"{left} {random.choice(COMPARISONS)} {right}"
+
+    def typed_call(self, name: str, scope: Scope, depth: int = 0) -> str:
+        """Generates a call to a user function, with an argument of the right type for each parameter.
+
+        :param name: The function, already in `signatures`.
+        :param scope: The Scope the call is made in.
+        :param depth: How deeply the call is nested.
+        :return: The call as a string.
+        """
+        parameter_types, _ = self.signatures[name]
+        arguments = [self.typed_expression(storage_type, scope, depth) for storage_type in parameter_types]
+        return f"{name}({', '.join(arguments)})"
+
+    def typed_function_call(self, scope: Scope) -> str:
+        """Generates a call statement: a user function defined so far, or a builtin moving average.
+
+        :param scope: The Scope the call is made in.
+        :return: The call as a string.
+        """
+        if self.signatures and random.choice([True, False]):
+            return self.typed_call(random.choice(list(self.signatures)), scope, 1)
+        source = self.typed_expression(FLOAT, scope, 1)
+        return f"{random.choice(MOVING_AVERAGES)}({source}, {random.randint(2, 50)})"
+
+    def typed_variable(self, scope: Scope) -> Variable:
+        """Generates a Variable initialized with a value of its type, and declares it in `scope`.
+
+        :param scope: The Scope of the block the variable is declared in.
+        :return: A randomly generated Variable.
+        """
+        storage_type = self.storage_type()
+        value = self.typed_expression(storage_type, scope)  # before the name exists, so it cannot refer to itself
+        name = self.unique_name()
+        self.generated_variable_names.append(name)
+        is_var, is_varip = self.declaration(allow_varip=storage_type.modifier is None)
+        description = self.random_sentence()
+        scope.declare(name, storage_type)
+        return Variable(name, storage_type, value, is_var, is_varip, description)
+
+    def typed_statement(self, scope: Scope, nested: bool = False) -> List[Statement]:
+        """Generates one statement of a block: a declaration, a call or (outside nested blocks) a control structure.
+
+        :param scope: The Scope of the block.
+        :param nested: True inside a loop or if block, where no further control structures are generated.
+        :return: The code line or node, preceded by the counter declaration a while loop needs.
+        """
+        line_types = ["variable", "function_call"] if nested else ["variable", "control_structure", "function_call"]
+        line_type = self.choose("statement", line_types)
+        if line_type == "variable":
+            return [self.typed_variable(scope)]
+        if line_type == "control_structure":
+            return self.typed_control_structure(scope)
+        return [self.typed_function_call(scope)]
+
+    def typed_block(self, scope: Scope) -> List[Statement]:
+        """Generates the body of a loop or if block, in a Scope of its own.
+
+        :param scope: The enclosing Scope.
+        :return: The statements of the body.
+        """
+        inner = Scope(scope)
+        return [line for _ in range(random.randint(1, 3)) for line in self.typed_statement(inner, nested=True)]
+
+    def typed_control_structure(self, scope: Scope) -> List[Statement]:
+        """Generates a for loop, while loop or if-else statement whose blocks have their own scopes.
+        A while loop counts its iterations, so it always ends.
+
+        :param scope: The Scope the structure appears in.
+        :return: A Loop or Conditional object, after the declaration of a while loop's counter.
+        """
+        lines: List[Statement] = []
+        structure_type = self.choose("control", ["if", "for", "while"])
+        self.context.append(structure_type)
+        if structure_type == "for":
+            counter_scope = Scope(scope)
+            counter_variable = self.unique_name()
+            counter_scope.declare(counter_variable, INT)
+            start_value = random.randint(0, 5)
+            end_value = random.randint(start_value + 1, 10)
+            structure = Loop("for", f"{counter_variable} = {start_value} to {end_value}", self.typed_block(counter_scope))
+        elif structure_type == "while":
+            condition = self.typed_condition(scope)
+            counter_variable = self.unique_name()
+            lines.append(Variable(counter_variable, INT, "0"))
+            scope.declare(counter_variable, INT)
+            body = self.typed_block(scope) + [f"{counter_variable} += 1"]
+            condition = f"{counter_variable} < {random.randint(1, 10)} and {condition}"
+            structure = Loop("while", condition, body)
+        else:
+            condition = self.typed_condition(scope)
+            if_body = self.typed_block(scope)
+            else_body = None
+            if self.choose("else", [True, False]):
+                self.context[-1] = "else"
+                else_body = self.typed_block(scope)
+            structure = Conditional(condition, if_body, else_body)
+        self.context.pop()
+        lines.append(structure)
+        return lines
+
+    def typed_function(self, scope: Scope) -> Function:
+        """Generates a Function whose last line is an expression of its return type, and records its signature.
+
+        :param scope: The global Scope; the function sees the globals declared before it.
+        :return: A randomly generated Function.
+        """
+        name = self.unique_name()
+        self.generated_function_names.append(name)
+        local = Scope(scope)
+        parameters: List[Parameter] = []
+        self.context.append("parameter")
+        for _ in range(random.randint(0, 5)):
+            parameter = Parameter(self.unique_name(), self.storage_type(), None, self.random_sentence())
+            local.declare(parameter.name, parameter.storage_type)
+            parameters.append(parameter)
+        # only trailing parameters can have defaults, and only scalar ones print them
+        for parameter in reversed(parameters):
+            if parameter.storage_type.modifier is not None or not self.choose("default", [True, False]):
+                break
+            parameter.default_value = self.typed_value(parameter.storage_type)
+
+        self.context[-1] = "function"
+        returns = self.storage_type()
+        body = [line for _ in range(random.randint(0, 4)) for line in self.typed_statement(local)]
+        body.append(self.typed_expression(returns, local))
+        self.context.pop()
+        self.signatures[name] = ([parameter.storage_type for parameter in parameters], returns)
+        # Pine infers the return type, so the header carries none
+        return Function(name, parameters, ReturnValue(None, self.random_sentence()), body, self.random_sentence())
+
+    def typed_udt(self) -> UDT:
+        """Generates a UDT whose field defaults match the field types.
+
+        :return: A randomly generated UDT.
+        """
+        name = self.unique_name()
+        self.generated_udt_names.append(name)
+        fields: List[Field] = []
+        self.context.append("udt")
+        for index in range(1, random.randint(1, 5) + 1):
+            storage_type = self.storage_type()
+            default_value = self.typed_value(storage_type) if storage_type.modifier is None else None
+            fields.append(Field(f"field{index}", storage_type, default_value, self.random_sentence()))
+        self.context.pop()
+        return UDT(name, fields, self.random_sentence(), INDENTATION)
+
+    def typed_script(self) -> Script:
+        """Generates a type-consistent Script: an indicator with UDTs, globals, functions and a body
+        ending in a `plot`.
+
+        :return: A randomly generated Script.
+        """
+        self.used_names = set()  # names and functions belong to one script
+        self.signatures = {}
+        name = self.unique_name()
+        scope = Scope()
+        udts = [self.typed_udt() for _ in range(random.randint(0, 3))]
+        variables = [self.typed_variable(scope) for _ in range(random.randint(0, 10))]
+        functions = [self.typed_function(scope) for _ in range(random.randint(1, 10))]
+        body = [line for _ in range(random.randint(0, 20)) for line in self.typed_statement(scope)]
+        body.append(f"plot({self.typed_expression(FLOAT, scope)})")  # an indicator needs an output
+        description = self.random_sentence()
+        if self.coverage is not None:
+            self.coverage.samples += 1
+        return Script(name, [], udts, functions, variables, body, description, 5, f'indicator("{name}")')
+
+
+# Bulk generation: the job is cut into shards of SCRIPTS_PER_SHARD scripts, each generated by one
+# worker process seeded from (seed, shard) and written to its own file, so the output of a given
+# seed is the same whatever the number of workers.
+# Jobs can be stopped and resumed: `<out>.job.json` records the job's settings and finished shards,
+# and each shard in progress checkpoints every CHECKPOINT_EVERY scripts (see generate_shard).
+
+# Configuration
+BULK_OUTPUT = "nonsense.jsonl"  # shards are named nonsense-00000.jsonl and so on
+SCRIPTS_PER_SHARD = 10_000
+BULK_WORKERS = os.cpu_count() or 1
+CHECKPOINT_EVERY = 1_000  # scripts
+FORMATS = ("jsonl", "txt")
+
+
+def shard_seed(seed: int, shard: int) -> str:
+    """The seed a shard is generated from; string seeds are hashed, so neighbouring shards do not correlate."""
+    return f"{seed}:{shard}"
+
+
+def shard_path(path: str, shard: int) -> str:
+    stem, extension = os.path.splitext(path)
+    return f"{stem}-{shard:05d}{extension}"
+
+
+def job_path(path: str) -> str:
+    return f"{os.path.splitext(path)[0]}.job.json"
+
+
+def render(script: Script, output_format: str, script_id: str) -> str:
+    """One script as a JSONL record, or as text under a `// ----` separator line."""
+    if output_format == "jsonl":
+        return json.dumps({"id": script_id, "code": str(script)}) + "\n"
+    return f"// ---- {script_id}\n{script}"
+
+
+def _write_json(path: str, data: Dict[str, Any]):
+    """Writes JSON atomically, so a job killed mid-write leaves the previous version."""
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())  # on disk before the rename, or a host crash can leave an empty file
+    os.replace(f"{path}.tmp", path)
+
+
+def generate_shard(
+    path: str,
+    shard: int,
+    count: int,
+    seed: int,
+    output_format: str,
+    typed: bool = False,
+    guided: bool = False,
+    checkpoint_every: int = CHECKPOINT_EVERY,
+) -> Tuple[int, int, str, int]:
+    """
+    Generates one shard in a worker process. Scripts are appended to `<shard>.partial`; every
+    `checkpoint_every` scripts the file is synced and `<shard>.partial.json` records the scripts
+    and bytes done and the random (and Coverage) state. A shard started again after being stopped
+    truncates the partial file to the checkpointed size and restores that state, so it carries on
+    byte for byte as if it had never stopped; a checkpoint that cannot be read or restored starts
+    the shard over. The finished file is renamed into place.
+
+    :return: The shard number, how many scripts it holds, its file name, and how many were generated now.
+    """
+    name = shard_path(path, shard)
+    partial = f"{name}.partial"
+    checkpoint = f"{partial}.json"
+    coverage = Coverage() if guided else None  # guidance follows what this shard has generated
+    start = 0
+    if os.path.exists(checkpoint) and os.path.exists(partial):
+        try:
+            with open(checkpoint, encoding="utf-8") as f:
+                state = json.load(f)
+            if state["offset"] > os.path.getsize(partial):
+                raise ValueError("partial file is shorter than its checkpoint")
+            set_random_state(state["random"])
+            if coverage is not None:
+                coverage.setstate(state["coverage"])
+            start = state["done"]
+        except (OSError, ValueError, KeyError, TypeError):
+            start = 0
+            coverage = Coverage() if guided else None
+        else:
+            with open(partial, "r+b") as f:
+                f.truncate(state["offset"])  # drop what was written after the checkpoint
+    if not start:
+        random.seed(shard_seed(seed, shard))
+    with open(partial, "ab" if start else "wb") as f:
+        for index in range(start, count):
+            f.write(render(Generator(typed, coverage).script(), output_format, f"{seed}-{shard}-{index}").encode("utf-8"))
+            done = index + 1
+            if done % checkpoint_every == 0 and done < count:
+                f.flush()
+                os.fsync(f.fileno())
+                state = {"done": done, "offset": f.tell(), "random": random_state()}
+                state["coverage"] = coverage.getstate() if coverage is not None else None
+                _write_json(checkpoint, state)
+    os.replace(partial, name)
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return shard, count, name, count - start
+
+
+def bulk(
+    count: int,
+    path: str = BULK_OUTPUT,
+    seed: int = 0,
+    workers: int = BULK_WORKERS,
+    per_shard: int = SCRIPTS_PER_SHARD,
+    output_format: Optional[str] = None,
+    typed: bool = False,
+    guided: bool = False,
+    checkpoint_every: int = CHECKPOINT_EVERY,
+) -> List[str]:
+    """Generates `count` scripts across a process pool, printing progress in scripts per second.
+    Running the same job again resumes it: finished shards are skipped and unfinished ones continue
+    from their last checkpoint.
+
+    :param count: How many scripts to generate.
+    :param path: The output name; shards get a `-NNNNN` suffix before the extension.
+    :param seed: The job seed; the same seed and `per_shard` give the same files.
+    :param workers: Worker processes.
+    :param per_shard: Scripts per shard file.
+    :param output_format: "jsonl" or "txt"; by default taken from the extension of `path`.
+    :param typed: Generate type-consistent scripts (Generator(typed=True)).
+    :param guided: Bias each shard's choices toward the productions it has generated least (see Coverage).
+    :param checkpoint_every: Scripts between checkpoints of a shard in progress.
+    :return: The shard files, in shard order.
+    """
+    output_format = output_format or ("jsonl" if path.endswith(".jsonl") else "txt")
+    settings = {
+        "count": count,
+        "seed": seed,
+        "per_shard": per_shard,
+        "format": output_format,
+        "typed": typed,
+        "guided": guided,
+    }
+    shards = [(shard, min(per_shard, count - start)) for shard, start in enumerate(range(0, count, per_shard))]
+    job = {"settings": settings, "shards": {}}
+    if os.path.exists(job_path(path)):
+        with open(job_path(path), encoding="utf-8") as f:
+            job = json.load(f)
+        if job["settings"] != settings:
+            raise ValueError(f"{job_path(path)} belongs to a job with other settings ({job['settings']}); use another --out")
+    else:
+        # a new job: checkpoints left by an older one under the same name are not ours
+        for shard, _ in shards:
+            for leftover in (f"{shard_path(path, shard)}.partial", f"{shard_path(path, shard)}.partial.json"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        _write_json(job_path(path), job)
+
+    files: Dict[int, str] = {}
+    done = generated = 0
+    for shard, size in shards:
+        finished = job["shards"].get(str(shard))
+        if finished and os.path.exists(finished["file"]):
+            files[shard] = finished["file"]
+            done += size
+    if done:
+        print(f"resuming: {len(files)}/{len(shards)} shards, {done}/{count} scripts already done", flush=True)
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(generate_shard, path, shard, size, seed, output_format, typed, guided, checkpoint_every)
+            for shard, size in shards
+            if shard not in files
+        ]
+        for future in as_completed(futures):
+            shard, size, name, new = future.result()
+            files[shard] = name
+            job["shards"][str(shard)] = {"file": name, "scripts": size, "bytes": os.path.getsize(name)}
+            _write_json(job_path(path), job)
+            done += size
+            generated += new
+            elapsed = time.perf_counter() - started
+            print(f"{done}/{count} scripts, {generated / elapsed:.0f} scripts/s ({name})", flush=True)
+    return [files[shard] for shard in sorted(files)]
+
 
 # Main execution
 if __name__ == "__main__":
-    generator = Generator()
-    generated_script = generator.script()
-    print(generated_script)
+    parser = argparse.ArgumentParser(description="Generate nonsense Pine(ish) scripts; one to stdout, or many in bulk.")
+    parser.add_argument("--count", type=int, help="generate this many scripts into sharded files")
+    parser.add_argument("--out", default=BULK_OUTPUT, help="output name, .jsonl or .txt")
+    parser.add_argument("--format", choices=FORMATS, help="defaults to the extension of --out")
+    parser.add_argument("--seed", type=int, help="make the output reproducible")
+    parser.add_argument("--workers", type=int, default=BULK_WORKERS)
+    parser.add_argument("--per-shard", type=int, default=SCRIPTS_PER_SHARD)
+    parser.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY, help="scripts between shard checkpoints")
+    parser.add_argument("--typed", action="store_true", help="type-consistent scripts, with a version and declaration")
+    parser.add_argument("--guided", action="store_true", help="bias choices toward rarely generated constructs")
+    parser.add_argument("--coverage-report", action="store_true", help="compare uniform and guided coverage over --count scripts")
+    args = parser.parse_args()
+
+    if args.coverage_report:
+        print(coverage_report(args.count or 1000, args.typed, args.seed or 0))
+    elif args.count is None:
+        if args.seed is not None:
+            random.seed(args.seed)
+        generator = Generator(args.typed, Coverage() if args.guided else None)
+        generated_script = generator.script()
+        print(generated_script)
+    else:
+        bulk(
+            args.count,
+            args.out,
+            args.seed or 0,
+            args.workers,
+            args.per_shard,
+            args.format,
+            args.typed,
+            args.guided,
+            args.checkpoint_every,
+        )
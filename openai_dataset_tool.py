@@ -1,12 +1,20 @@
 import json
 import os
 import openai
-import requests
 import platform
-import openai
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
 from urllib3 import encode_multipart_formdata
 
+from autofix import fix_script
+from compile_cache import CompileCache
+from metrics import METRICS
+from pine_lint import preflight
+from reference_index import retrieve_reference
+from repair_scheduler import RepairScheduler
+from storage import open_store
+from transport import TRANSPORT, RateLimiter
+
 
 # set these:
 
@@ -15,13 +23,39 @@ from urllib3 import encode_multipart_formdata
 # os.environ['TV_PASSWORD']    = ""
 
 
-openai.api_key = os.environ["OPENAI_API_KEY"]
+openai.api_key = os.environ.get("OPENAI_API_KEY")
+
+# point these at mock_pine_facade.py to run the pipeline offline
+TV_BASE_URL = os.environ.get("TV_BASE_URL", "https://www.tradingview.com")
+PINE_FACADE_URL = os.environ.get("PINE_FACADE_URL", "https://pine-facade.tradingview.com/pine-facade/")
 
 URLS = {
-    "tvcoins": "https://www.tradingview.com/tvcoins/details/",
-    "signin": "https://www.tradingview.com/accounts/signin/",
+    "tvcoins": f"{TV_BASE_URL}/tvcoins/details/",
+    "signin": f"{TV_BASE_URL}/accounts/signin/",
+    "check": f"{PINE_FACADE_URL}save/new_draft/?user_name={{username}}&allow_use_existing_draft=true",
 }
 
+# compile checks kept in flight by check_loop, 1 checks one script at a time
+CHECK_WORKERS = 8
+# starting pace towards pine-facade (requests/second), adapts to 429 / 5xx replies
+CHECK_RATE = 4.0
+# how often a throttled (429 / 5xx) compile check is retried before giving up on it
+CHECK_RETRIES = 4
+# reject obvious non-Pine code locally (pine_lint) instead of spending a compile request on it
+PREFLIGHT = True
+# apply autofix.py's deterministic rewrites (and recompile) before asking the LLM to repair a script
+AUTOFIX = True
+
+# LLM repairs kept in flight, and the account's limits they are scheduled under
+# (set OPENAI_API_BASE to mock_pine_facade.py's /v1 to run against the fake completion endpoint)
+REPAIR_MODEL = "gpt-3.5-turbo-16k"
+REPAIR_WORKERS = 4
+REPAIR_RPM = 60
+REPAIR_TPM = 90_000
+# reference tokens per repair prompt, picked by reference_index.py for the error and code at hand
+# (0 sends the whole PINE_REFERENCE instead)
+REFERENCE_TOKEN_BUDGET = 1500
+
 
 # this can be improved..
 
@@ -385,155 +419,27 @@ while (a < b)
 
 
 
-
-class TradingView:
-
-    def __init__(self):
-        """
-        thanks trendoscope =)
-        (borrowed somne code from trendoscope's tradingview access project:  https://github.com/trendoscope-algorithms/Tradingview-Access-Management )
-        """
-        DB = self.load_db()
-        print("Getting sessionid from db")
-        self.sessionid = DB.get("sessionid", "abcd")
-        headers = {"cookie": f"sessionid={self.sessionid}"}
-        test = requests.request("GET", URLS["tvcoins"], headers=headers)
-
-        print(test.text)
-        print(f"sessionid from db : {self.sessionid}")
-
-        if test.status_code != 200:
-            print("session id from db is invalid")
-            password = os.environ["TV_PASSWORD"]
-            username = os.environ["TV_USERNAME"]
-            payload = {"username": username, "password": password, "remember": "on"}
-            body, content_type = encode_multipart_formdata(payload)
-            user_agent = f"TWAPI/3.0 ({platform.system()}; {platform.version()}; {platform.release()})"
-            print(user_agent)
-            login_headers = {
-                "origin": "https://www.tradingview.com",
-                "User-Agent": user_agent,
-                "Content-Type": content_type,
-                "referer": "https://www.tradingview.com",
-            }
-            login = requests.post(URLS["signin"], data=body, headers=login_headers)
-            cookies = login.cookies.get_dict()
-            self.sessionid = cookies["sessionid"]
-            DB["sessionid"] = self.sessionid
-            self.update_db(DB)
-        self.to_fix = []
-
-    def get_sessionid(self):
-        DB = self.load_db()
-        return DB.get("sessionid", "abcd")
-
-    def load_db(self):
-        if os.path.isfile("db.json"):
-            with open("db.json", "r") as f:
-                return json.load(f)
-        return {}
-
-    def update_db(self, db):
-        with open("db.json", "w") as f:
-            json.dump(db, f)
-
-
-    def check_pine_server(self, source_code):
-        """
-        this is toal hax.
-        it uses your current chart that was las open
-        and does an `update` to the script, without saving it.
-        but it returns the information from the compiler if there was an error, or if the script checks out.
-        it does not save the script, only updaes i on the chart..
-        """
-        user_agent = f"TWAPI/3.0 ({platform.system()}; {platform.version()}; {platform.release()})"
-        url = "https://pine-facade.tradingview.com/pine-facade/save/new_draft/?user_name={username}&allow_use_existing_draft=true"
-        headers = {
-            "cookie": f"sessionid={self.sessionid}",
-            "origin": "https://www.tradingview.com",
-            "User-Agent": user_agent,
-            "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
-            "referer": "https://www.tradingview.com",
-        }
-        body = {"source": source_code}
-        response = requests.post(url, headers=headers, data=body)
-
-        if response.status_code == 200:
-            print("\nPOST request successful\n")
-        else:
-            print("\nPOST request failed\n")
-
-        return json.loads(response.text)
-    def check_loop(self):
-        DB = self.load_db()
-        to_check = DB.get("PINE", [])
-        successful_responses = DB.get("Successful", [])
-        unsuccessful_responses = DB.get("Failed", [])
-        new_unsuccessful_responses = []  # To store the remaining unsuccessful items
-        # do a qquick clearing of `PINEE` o removev an successful items from Successful` list
-        for i in successful_responses:
-            DB["PINE"] = [n for n in DB["PINE"] if n["instruction"] != i["instruction"]]
-        for i in to_check:
-            response = self.check_pine_server(i["completion"])
-            if not response:
-                continue
-            if response.get("success"):
-                successful_responses.append(
-                    {"instruction": i['instruction'], "completion": i['completion']}
-                )
-                DB["PINE"] = [n for n in DB["PINE"] if n["instruction"] != i["instruction"]]
-                continue
-
-            error_reason = response.get("reason")
-            to_repair = {
-                "instruction": i["instruction"],
-                "completion": i["completion"],
-                "error": error_reason,
-                "trycount": 0,
-            }
-            new_unsuccessful_responses.append(to_repair)  # Add unsuccessful item to the new list
-
-        DB["Failed"] = new_unsuccessful_responses  # Update the failed items with the cleaned list
-        DB["Successful"] = successful_responses
-
-        self.update_db(DB)
-
-        if new_unsuccessful_responses:
-            self.repair_gpt()
-
-        return successful_responses, unsuccessful_responses
-    def repair_gpt(self):
-        DB = self.load_db()
-
-        unsuccessful_responses = DB.get("Failed", [])
-
-        if "Unfixable" not in DB:
-            DB["Unfixable"] = []
-        if "Successful" not in DB:
-            DB["Successful"] = []
-
-        while len(unsuccessful_responses) > 0:
-            repairable  = DB["Failed"].pop(0)
-            instruction = repairable["instruction"]
-            code        = repairable["completion"]
-            error       = repairable["error"]
-            prompt = "\n".join([
-                " I am trying to produce a script using pinescript (Pine Script), version 5, and attempting to fulfil this instruction:",
-                "```text",
-                "the instruction i need my code to fulfill is:",
-                instruction,
-                "```",
-                "# Error note: there are more errors possible, but the compiler only reports the 1st found. This is the error can see from the compiler:",
-                f"error: {error}",
-                "# Here is the code, it has numerous errors and non-pinescript syntax in it, it requires a total fix, please look a the reference maerial prior o responding..",
-                "```",
-                code,
-                "```",
-            ])
-
-            messages = [
-                {"role": "system", "content": PINE_REFERENCE},
-                {"role": "system", "content": '''
+def repair_messages(instruction: str, code: str, error: str, reference_budget: Optional[int] = None) -> List[Dict[str, str]]:
+    """the chat messages asking the model to fix `code` so it fulfils `instruction`, given the compiler `error`"""
+    budget = REFERENCE_TOKEN_BUDGET if reference_budget is None else reference_budget
+    reference = retrieve_reference(error or "", code or "", budget) if budget else PINE_REFERENCE
+    prompt = "\n".join([
+        " I am trying to produce a script using pinescript (Pine Script), version 5, and attempting to fulfil this instruction:",
+        "```text",
+        "the instruction i need my code to fulfill is:",
+        instruction,
+        "```",
+        "# Error note: there are more errors possible, but the compiler only reports the 1st found. This is the error can see from the compiler:",
+        f"error: {error}",
+        "# Here is the code, it has numerous errors and non-pinescript syntax in it, it requires a total fix, please look a the reference maerial prior o responding..",
+        "```",
+        code,
+        "```",
+    ])
+
+    messages = [
+        {"role": "system", "content": reference},
+        {"role": "system", "content": '''
     Ensure:
         - `//@version=5` is on a line by itself in the first line of the code
         - One of these:  `library`, `indicator`, or `strategy` script declaration
@@ -616,59 +522,176 @@ if a string, or an array, use `label.new(bar_index, close, str.tostring(array_or
     //ENDCOMPLETION
     `
                 '''},
-                {"role": "user", "content": prompt}
-            ]
+        {"role": "user", "content": prompt}
+    ]
+    return messages
 
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo-16k", messages=messages, temperature=1.0
-            )
 
-            corrected = self.parse_response(response)
-            response  = self.check_pine_server(corrected)
+def chat_completion(messages: List[Dict[str, str]]):
+    return openai.ChatCompletion.create(model=REPAIR_MODEL, messages=messages, temperature=1.0)
 
-            if not response:
-                continue
 
-            success = response.get("success")
+class TradingView:
 
-            print("\n===================\n")
-            print(f"Compiled: {success}")
-            print("\n===================\n")
+    def __init__(self):
+        """
+        thanks trendoscope =)
+        (borrowed somne code from trendoscope's tradingview access project:  https://github.com/trendoscope-algorithms/Tradingview-Access-Management )
+        """
+        self.store = open_store()
+        print("Getting sessionid from db")
+        self.sessionid = self.store.get_session("sessionid", "abcd")
+        headers = {"cookie": f"sessionid={self.sessionid}"}
+        test = TRANSPORT.get(URLS["tvcoins"], headers=headers)
 
+        print(test.text)
+        print(f"sessionid from db : {self.sessionid}")
 
-            if success is True:
-                # removve the item from DB["PINE"] where i  has the same instruction
-                DB["PINE"] = [i for i in DB["PINE"] if i["instruction"] != instruction]
-                DB["Successful"].append(
-                    {"instruction": instruction, "completion": corrected}
-                )
-                self.update_db(DB)
-                continue
+        if test.status_code != 200:
+            print("session id from db is invalid")
+            password = os.environ["TV_PASSWORD"]
+            username = os.environ["TV_USERNAME"]
+            payload = {"username": username, "password": password, "remember": "on"}
+            body, content_type = encode_multipart_formdata(payload)
+            user_agent = f"TWAPI/3.0 ({platform.system()}; {platform.version()}; {platform.release()})"
+            print(user_agent)
+            login_headers = {
+                "origin": "https://www.tradingview.com",
+                "User-Agent": user_agent,
+                "Content-Type": content_type,
+                "referer": "https://www.tradingview.com",
+            }
+            login = TRANSPORT.post(URLS["signin"], data=body, headers=login_headers)
+            cookies = login.cookies.get_dict()
+            self.sessionid = cookies["sessionid"]
+            self.store.set_session("sessionid", self.sessionid)
+        self.to_fix = []
+        self.limiter = RateLimiter(CHECK_RATE)
+        self.cache = CompileCache()
+        METRICS.collect("compile_cache", lambda: {"hits": self.cache.hits, "misses": self.cache.misses})
 
-            error_reason = response.get("reason")
-            tries = repairable["trycount"]
+    def get_sessionid(self):
+        return self.store.get_session("sessionid", "abcd")
 
-            repairable["completion"] = corrected
-            repairable["error"]      = error_reason
-            repairable["trycount"]   = tries + 1
 
-            print(f"\nFAIL\n=====\nInstruction: {instruction}")
-            print(f"- Failed :\n {corrected}")
-            print(f"- Error :\n  {error_reason}")
-            print(f"- Tries :\n  {tries}")
-            print("=========\n")
+    def check_pine_server(self, source_code):
+        """
+        this is toal hax.
+        it uses your current chart that was las open
+        and does an `update` to the script, without saving it.
+        but it returns the information from the compiler if there was an error, or if the script checks out.
+        it does not save the script, only updaes i on the chart..
+        results are cached by normalized source, so a script is only ever sent once,
+        and scripts the offline pre-flight check rejects are never sent at all.
+        """
+        if PREFLIGHT and (reason := preflight(source_code)):
+            METRICS.count("compile_checks_total", result="offline")
+            return {"success": False, "reason": reason, "offline": True}
+
+        cached = self.cache.get(source_code)
+        if cached is not None:
+            METRICS.count("compile_checks_total", result="cached")
+            return cached
+
+        user_agent = f"TWAPI/3.0 ({platform.system()}; {platform.version()}; {platform.release()})"
+        url = URLS["check"]
+        headers = {
+            "cookie": f"sessionid={self.sessionid}",
+            "origin": "https://www.tradingview.com",
+            "User-Agent": user_agent,
+            "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+            "referer": "https://www.tradingview.com",
+        }
+        body = {"source": source_code}
+        try:
+            with METRICS.timer("compile_seconds"):
+                response = TRANSPORT.post(
+                    url, headers=headers, data=body, limiter=self.limiter, retries=CHECK_RETRIES
+                )
+        except OSError as error:
+            print(f"\nPOST request failed: {error}\n")
+            METRICS.count("compile_checks_total", result="error")
+            return {}
+
+        if response.status_code == 200:
+            print("\nPOST request successful\n")
+        else:
+            print("\nPOST request failed\n")
+            if response.status_code == 429 or response.status_code >= 500:
+                METRICS.count("compile_checks_total", result="throttled")
+                return {}
+
+        try:
+            result = json.loads(response.text)
+        except ValueError:
+            METRICS.count("compile_checks_total", result="error")
+            return {}
+        if response.status_code == 200:
+            self.cache.put(source_code, result)
+        METRICS.count("compile_checks_total", result="success" if result.get("success") else "failure")
+        return result
 
+    def check_many(self, sources: List[str]) -> Iterator[dict]:
+        """
+        compile-checks `sources` with up to CHECK_WORKERS requests in flight.
+        responses are yielded in the same order as `sources`, whatever order they finish in.
+        """
+        if CHECK_WORKERS <= 1:
+            for source in sources:
+                yield self.check_pine_server(source)
+            return
+        with ThreadPoolExecutor(max_workers=CHECK_WORKERS) as pool:
+            yield from pool.map(self.check_pine_server, sources)
 
-            if tries >= 2:
-                print("Too many tries")
-                DB["Unfixable"].append(repairable)
+    def check_loop(self):
+        # do a qquick clearing of `PINEE` o removev an successful items from Successful` list
+        self.store.prune_pending()
+        self.record_queue_depths()
+        to_check = self.store.pending()
+        responses = self.check_many([i["completion"] for i in to_check])
+        for response in responses:
+            i = to_check.popleft()  # responses come back in queue order
+            METRICS.gauge("check_queue", len(to_check))
+            if not response:
+                continue
+            if response.get("success"):
+                self.store.mark_successful(i["instruction"], i["completion"])
                 continue
 
-            unsuccessful_responses.append(repairable)
-            DB["Failed"] = unsuccessful_responses
-            self.update_db(DB)
+            error_reason = response.get("reason")
+            to_repair = {
+                "instruction": i["instruction"],
+                "completion": i["completion"],
+                "error": error_reason,
+                "trycount": 0,
+            }
+            self.store.mark_failed(to_repair)  # each item is committed on its own, a crash loses nothing
+
+        if self.store.count("failed"):
+            self.repair_gpt()
+
+        return self.record_queue_depths()
 
-        return
+    def record_queue_depths(self) -> Dict[str, int]:
+        counts = self.store.counts()
+        for table, count in counts.items():
+            METRICS.gauge("store_items", count, table=table)
+        return counts
+
+    def repair_gpt(self):
+        """repairs everything in Failed, REPAIR_WORKERS at a time, within the LLM rate and token limits"""
+        scheduler = RepairScheduler(
+            self.store,
+            complete=chat_completion,
+            build_messages=repair_messages,
+            parse=self.parse_response,
+            check=self.check_pine_server,
+            workers=REPAIR_WORKERS,
+            requests_per_minute=REPAIR_RPM,
+            tokens_per_minute=REPAIR_TPM,
+            autofix=fix_script if AUTOFIX else None,
+        )
+        return scheduler.run()
 
     @staticmethod
     def parse_response(response):
@@ -680,5 +703,10 @@ if a string, or an array, use `label.new(bar_index, close, str.tostring(array_or
         return responsetext.split("//BEGINCOMPLETION")[1].split("//ENDCOMPLETION")[0]
 
 
-TV = TradingView()
-TV.check_loop()
+if __name__ == "__main__":
+    METRICS.collect("transport", TRANSPORT.stats)
+    METRICS.start()
+    TV = TradingView()
+    TV.check_loop()
+    print(f"transport: {TRANSPORT.stats()}")
+    print(f"compile cache: {TV.cache.hits} hits, {TV.cache.misses} misses")
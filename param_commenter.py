@@ -1,5 +1,9 @@
-import sys
+import argparse
+import os
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 """
 the functions perform the following:
@@ -12,20 +16,35 @@ the functions perform the following:
         // @param param_name param_type
         ...
         // @returns
-        
+
 - if the line is a type, it creates a comment for it
     - the comment is in the form of:
         // @type type_name
         // @field field_name field_type
         ...
-        
+
 - writes the comments to the output file
 
+Files are streamed: only the type block being read is held in memory, and the output is
+written to a temporary file renamed into place, so it can even replace its input.
+Given a directory (e.g. the downloaded scripts/ corpus), every .pine file under it is
+annotated across a process pool, next to itself or into a mirror tree.
 """
 
+# Configuration
+SUFFIX = '.pine.commented'  # output next to each input when there is no mirror tree; not *.pine, so symbol_index/corpus_store skip it
+WORKERS = os.cpu_count() or 1
+CHUNKSIZE = 16  # files per task handed to a worker
+
+FUNCTION_LINE = re.compile(r'^(export\s+|method\s+)*\w+\s*\([^)]*\) *=>')
+FUNCTION_PARAMS = re.compile(r'^((export\s+|method\s+)*\w+)\s*\(([^)]*)\)\s*=>')
+TYPE_LINE = re.compile(r'^(export\s+)?type\s')
+FIELD_LINE = re.compile(r'(\w+)\s+(\w+)\s*(=\s*\w+)?')
+DOC_LINE = re.compile(r'//\s*(@function|@type)\b')
+
 def getParams(line):
     params = []
-    if m := re.match(r'^((export\s+|method\s+)*\w+)\s*\(([^)]*)\)\s*=>', line):
+    if m := FUNCTION_PARAMS.match(line):
         if param_string := m[3]:
             params = param_string.split(',')
             params = [p.split('=')[0].strip() if '=' in p else p for p in params]
@@ -43,42 +62,109 @@ def create_comment(line):
     comment += '// @returns\n'
     return comment
 
-def createComments(inputFile, outputFile):
-    with open(inputFile, 'r') as f:
-        lines = f.readlines()
-    comments = []
-    fields  = ''
+def annotate(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Yields the commented script piece by piece, reading `lines` once. Functions and types that
+    already have a `// @function` / `// @type` block right above them are left alone, so
+    annotating a file twice changes nothing.
+    """
+    fields = ''
     depth = 0
+    documented = None  # the tag of the doc comment block directly above the current line
     for line in lines:
-        if depth == 0:
-            if re.match(r'^(export +)?type',line):
+        if depth:
+            if line.startswith('    '):
                 fields += line
-                type_name = line.split('type')[1]
-                comments.append(f'\n\n// @type {type_name}')
-                depth += 1
-            if re.match(r'^(export\s+|method\s+)*\w+\s*\([^)]*\) *=>', line):
-                comment = create_comment(line)
-                comments.append(comment)
-            if depth == 0:
-                comments.append(line)
-        elif line.startswith('    '):
-            fields += line
-            line = line.strip()
-            if m := re.match(r'(\w+)\s+(\w+)\s*(=\s*\w+)?', line):
-                type_name, field_name, default = m.groups()
-                comments.append(f'// @field {field_name} ({type_name}) \n')
-        else:
+                if m := FIELD_LINE.match(line.strip()):
+                    type_name, field_name, default = m.groups()
+                    yield f'// @field {field_name} ({type_name}) \n'
+                continue
+            # the type block ends here; this line is read like any other below
             depth = 0
-            comments.append(fields)
+            yield fields
             fields = ''
-    with open(outputFile, 'w') as f:
-        f.writelines(comments)
+        if TYPE_LINE.match(line) and documented != '@type':
+            fields += line
+            type_name = line.split('type')[1]
+            yield f'\n\n// @type {type_name}'
+            depth += 1
+        if FUNCTION_LINE.match(line) and documented != '@function':
+            yield create_comment(line)
+        if depth == 0:
+            yield line
+        stripped = line.strip()
+        if m := DOC_LINE.match(stripped):
+            documented = m[1]
+        elif not stripped.startswith('//'):
+            documented = None
+    if depth:
+        yield fields  # a type block at the end of the file
+
+def createComments(inputFile, outputFile):
+    tmp = f'{outputFile}.{os.getpid()}.tmp'
+    try:
+        with open(inputFile, 'r', encoding='utf-8') as f, open(tmp, 'w', encoding='utf-8') as out:
+            out.writelines(annotate(f))
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    os.replace(tmp, outputFile)
+
+def output_path(path: str, root: str, mirror: Optional[str] = None, suffix: str = SUFFIX) -> str:
+    if mirror:
+        return os.path.join(mirror, os.path.relpath(path, root))
+    return os.path.splitext(path)[0] + suffix
+
+def comment_file(paths: Tuple[str, str]) -> str:
+    """
+    Annotates one file in a worker process: 'written', 'unchanged' if its (separate) output is
+    already newer than it, or 'failed' if it cannot be read or written, so one bad file does not
+    stop the batch.
+    """
+    inputFile, outputFile = paths
+    in_place = os.path.abspath(outputFile) == os.path.abspath(inputFile)
+    try:
+        if not in_place and os.path.exists(outputFile) and os.path.getmtime(outputFile) >= os.path.getmtime(inputFile):
+            return 'unchanged'
+        os.makedirs(os.path.dirname(outputFile) or '.', exist_ok=True)
+        createComments(inputFile, outputFile)
+    except (OSError, UnicodeDecodeError):
+        return 'failed'
+    return 'written'
+
+def commentTree(root: str, mirror: Optional[str] = None, workers: int = WORKERS, suffix: str = SUFFIX) -> dict:
+    """Annotates every .pine file under `root`, printing files per second at the end."""
+    jobs: List[Tuple[str, str]] = []
+    skip = os.path.abspath(mirror) if mirror else None  # a mirror inside the tree is not input
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories[:] = sorted(
+            d for d in subdirectories if not d.startswith('.') and os.path.abspath(os.path.join(directory, d)) != skip
+        )
+        for filename in sorted(files):
+            if filename.endswith('.pine') and not filename.endswith(suffix):
+                path = os.path.join(directory, filename)
+                jobs.append((path, output_path(path, root, mirror, suffix)))
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(comment_file, jobs, chunksize=CHUNKSIZE))
+    elapsed = time.perf_counter() - started
+    for (path, _), result in zip(jobs, results):
+        if result == 'failed':
+            print(f'failed: {path}')
+    stats = {'files': len(jobs), **{status: results.count(status) for status in ('written', 'unchanged', 'failed')}}
+    stats['seconds'] = round(elapsed, 2)
+    print(f"{stats} ({len(jobs) / elapsed if elapsed else 0:.0f} files/s)")
+    return stats
 
 if __name__ == '__main__':
-    inputFile = sys.argv[1]
-    outputFile = sys.argv[2]
-    if len(sys.argv) != 3:
-        print(f'Usage: python \\{sys.argv[0]} inputFile outputFile')
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description='Add @function/@param/@type/@field comment stubs to Pine scripts.')
+    parser.add_argument('input', help='a .pine file, or a directory to annotate every .pine file under')
+    parser.add_argument('output', nargs='?', help=f'output file, or mirror directory; by default next to each input as *{SUFFIX}')
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    args = parser.parse_args()
+
+    if os.path.isdir(args.input):
+        commentTree(args.input, args.output, args.workers)
     else:
-        createComments(inputFile, outputFile)
+        createComments(args.input, args.output or output_path(args.input, os.path.dirname(args.input)))
@@ -0,0 +1,232 @@
+import re
+import sys
+from typing import Iterator, List, NamedTuple, Optional
+
+# Offline pre-flight check for Pine Script v5.
+# A line lexer plus the structural rules from syntax.svg and reference/full_mini_reference.md:
+# it catches the non-Pine syntax the LLM and the nonsense generator keep producing
+# (braces, `return`, `function`, python lists and keywords, missing version or declaration)
+# before a script is spent on a pine-facade round-trip. It is not a full compiler, so it
+# only rejects what the real one certainly would.
+
+SCRIPT_DECLARATIONS = {"indicator", "library", "strategy"}
+BLOCK_KEYWORDS = {"if", "else", "for", "while", "switch", "type"}
+PYTHON_KEYWORDS = {
+    "def": "functions are declared as `name(params) =>`",
+    "elif": "use `else if`",
+    "True": "use `true`",
+    "False": "use `false`",
+    "None": "use `na`",
+    "class": "use `type` for user-defined types",
+    "lambda": "declare a function with `=>`",
+}
+# tokens after which a `[` starts a value, so it can only be a list literal
+VALUE_START = {"=", ":=", "+=", "-=", "*=", "/=", "%=", "+", "-", "*", "/", "%", "==", "!=", "<", ">", "<=", ">=", "?", ":", "and", "or", "not"}
+BRACKETS = {"(": ")", "[": "]"}
+
+TOKEN = re.compile(
+    r"""
+    (?P<comment>//[^\n]*)
+    |(?P<string>'(?:\\.|[^'\\])*'|"(?:\\.|[^"\\])*")
+    |(?P<unterminated>['"])
+    |(?P<color>\#[0-9a-fA-F]{8}\b|\#[0-9a-fA-F]{6}\b)
+    |(?P<hash>\#)
+    |(?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    |(?P<name>[A-Za-z_]\w*)
+    |(?P<op>:=|=>|==|!=|<=|>=|\+=|-=|\*=|/=|%=|&&|\|\||[-+*/%<>=?:!,.()\[\]{}])
+    |(?P<newline>\n)
+    |(?P<space>[ \t\r]+)
+    |(?P<error>.)
+    """,
+    re.VERBOSE,
+)
+VERSION = re.compile(r"//\s*@version\s*=\s*(\d+)")
+
+
+class Token(NamedTuple):
+    kind: str
+    text: str
+    line: int
+    column: int
+
+
+class Diagnostic(NamedTuple):
+    line: int
+    column: int
+    code: str
+    message: str
+
+    def __str__(self) -> str:
+        return f"line {self.line}:{self.column}: {self.message} [{self.code}]"
+
+
+class Line(NamedTuple):
+    number: int
+    indent: int
+    tokens: List[Token]  # without whitespace and comments
+    comments: List[Token]
+
+
+def lex(source: str) -> List[Line]:
+    """
+    Lexes a script into its non-blank lines. A string wrapped over several lines
+    belongs to the line it starts on, like the continuation lines it spans.
+    """
+    lines: List[Line] = []
+    current: Optional[Line] = None
+    number, line_start = 1, 0
+    for match in TOKEN.finditer(source):
+        kind, text = match.lastgroup, match.group()
+        if kind == "newline":
+            number, line_start, current = number + 1, match.end(), None
+            continue
+        if kind == "space":
+            continue
+        if current is None:
+            indent = len(source[line_start : match.start()].replace("\t", "    "))
+            current = Line(number, indent, [], [])
+            lines.append(current)
+        token = Token(kind, text, number, match.start() - line_start + 1)
+        (current.comments if kind == "comment" else current.tokens).append(token)
+        if "\n" in text:
+            number += text.count("\n")
+            line_start = match.start() + text.rindex("\n") + 1
+    return lines
+
+
+def lint(source: str) -> List[Diagnostic]:
+    """Returns every problem found, in source order; an empty list means the script may go to the compiler."""
+    lines = lex(source)
+    diagnostics: List[Diagnostic] = []
+    diagnostics.extend(_check_version(lines))
+    diagnostics.extend(_check_declaration(lines))
+    diagnostics.extend(_check_tokens(lines))
+    diagnostics.extend(_check_brackets(lines))
+    diagnostics.extend(_check_blocks(lines))
+    return sorted(diagnostics, key=lambda d: (d.line, d.column))
+
+
+def preflight(source: str) -> Optional[str]:
+    """The first problem as a compiler-style reason, or None if the script passes."""
+    diagnostics = lint(source)
+    return str(diagnostics[0]) if diagnostics else None
+
+
+# -- Rules --
+
+
+def _check_version(lines: List[Line]) -> Iterator[Diagnostic]:
+    for line in lines:
+        for comment in line.comments:
+            if match := VERSION.match(comment.text):
+                if line.tokens and line.tokens[0].column < comment.column:
+                    yield Diagnostic(line.number, comment.column, "P001", "`//@version=5` must be on a line by itself")
+                elif match[1] != "5":
+                    yield Diagnostic(line.number, comment.column, "P001", f"expected `//@version=5`, found version {match[1]}")
+                return
+        if line.tokens:
+            break
+    yield Diagnostic(1, 1, "P001", "missing `//@version=5` before the first statement")
+
+
+def _check_declaration(lines: List[Line]) -> Iterator[Diagnostic]:
+    declarations = [
+        line
+        for line in lines
+        if line.indent == 0
+        and len(line.tokens) > 1
+        and line.tokens[0].text in SCRIPT_DECLARATIONS
+        and line.tokens[1].text == "("
+    ]
+    if not declarations:
+        yield Diagnostic(1, 1, "P002", "missing `indicator(...)`, `library(...)` or `strategy(...)` declaration")
+    for extra in declarations[1:]:
+        yield Diagnostic(extra.number, 1, "P002", "a script can only have one declaration statement")
+
+
+def _check_tokens(lines: List[Line]) -> Iterator[Diagnostic]:
+    depth = 0  # bracket depth carries over wrapped lines
+    for line in lines:
+        previous: Optional[Token] = None
+        for position, token in enumerate(line.tokens):
+            text = token.text
+            depth += text in BRACKETS
+            depth -= text in (")", "]")
+            if text in ("{", "}"):
+                yield Diagnostic(token.line, token.column, "P003", f"`{text}` is not Pine syntax, blocks are indented")
+            elif token.kind == "name" and text == "return":
+                yield Diagnostic(token.line, token.column, "P004", "`return` is not Pine, a block's last expression is its value")
+            elif token.kind == "name" and text == "function" and position == 0 and len(line.tokens) > 1 and line.tokens[1].kind == "name":
+                yield Diagnostic(token.line, token.column, "P005", "the `function` keyword is not Pine, declare `name(params) =>`")
+            elif text == "[" and previous is not None and previous.text in VALUE_START and not (depth > 1 and previous.text == "="):
+                # `options = [...]` keyword arguments are the one place Pine takes a literal list
+                yield Diagnostic(token.line, token.column, "P006", "there are no lists in Pine, use `array.from(...)`")
+            elif token.kind == "name" and text in PYTHON_KEYWORDS:
+                yield Diagnostic(token.line, token.column, "P007", f"`{text}` is Python, {PYTHON_KEYWORDS[text]}")
+            elif text in ("&&", "||", "!"):
+                replacement = {"&&": "and", "||": "or", "!": "not"}[text]
+                yield Diagnostic(token.line, token.column, "P007", f"`{text}` is not Pine, use `{replacement}`")
+            elif token.kind == "hash":
+                yield Diagnostic(token.line, token.column, "P007", "`#` comments are Python, Pine comments start with `//`")
+            elif token.kind == "unterminated":
+                yield Diagnostic(token.line, token.column, "P009", "string is never closed")
+                break
+            elif token.kind == "error":
+                yield Diagnostic(token.line, token.column, "P010", f"unexpected character `{text}`")
+            previous = token
+
+        first = line.tokens[0] if line.tokens else None
+        if first and first.text in BLOCK_KEYWORDS | {"def", "elif", "class"} and line.tokens[-1].text == ":":
+            last = line.tokens[-1]
+            yield Diagnostic(last.line, last.column, "P007", "Python-style `:` after a block header, Pine blocks are only indented")
+        if first and first.text == "import" and len(line.tokens) > 2 and line.tokens[2].text != "/":
+            yield Diagnostic(first.line, first.column, "P007", "Pine imports are `import user/library/version`")
+
+
+def _check_brackets(lines: List[Line]) -> Iterator[Diagnostic]:
+    stack: List[Token] = []
+    for line in lines:
+        for token in line.tokens:
+            if token.text in BRACKETS:
+                stack.append(token)
+            elif token.text in (")", "]"):
+                if not stack or BRACKETS[stack[-1].text] != token.text:
+                    yield Diagnostic(token.line, token.column, "P008", f"unexpected `{token.text}`")
+                    return
+                stack.pop()
+    if stack:
+        opener = stack[-1]
+        yield Diagnostic(opener.line, opener.column, "P008", f"`{opener.text}` is never closed")
+
+
+def _check_blocks(lines: List[Line]) -> Iterator[Diagnostic]:
+    code = [line for line in lines if line.tokens]
+    for line, following in zip(code, code[1:] + [None]):
+        header = _block_header(line)
+        if header and (following is None or following.indent <= line.indent):
+            yield Diagnostic(line.number, line.tokens[-1].column, "P011", f"expected an indented block after `{header}`")
+
+
+def _block_header(line: Line) -> Optional[str]:
+    """The keyword (or `=>`) that makes this line open an indented block, if any."""
+    texts = [token.text for token in line.tokens]
+    if not texts:
+        return None
+    if texts[-1] == "=>":
+        return "=>"
+    if texts[0] == "export":
+        texts = texts[1:]
+    if texts[:1] == ["type"] and len(texts) == 2:
+        return "type"
+    for position, text in enumerate(texts):
+        # `if`, `for`, `while`, `switch` also open a block when their value is assigned: `x = if cond`
+        if text in BLOCK_KEYWORDS - {"type"} and (position == 0 or texts[position - 1] in ("=", ":=")):
+            return text
+    return None
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        with open(path, "r", encoding="utf-8") as f:
+            for diagnostic in lint(f.read()):
+                print(f"{path}:{diagnostic}")
@@ -0,0 +1,202 @@
+import argparse
+import glob
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, NamedTuple, Optional
+
+from tokens import estimate_tokens
+
+# BM25 index over reference/full_mini_reference.md and the `manual 2023 - 10` markdown, so a repair
+# prompt carries the sections relevant to the compiler error and the script at hand instead of the
+# whole PINE_REFERENCE every time.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SOURCES = [
+    os.path.join(ROOT, "reference", "full_mini_reference.md"),
+    os.path.join(ROOT, "manual 2023 - 10", "**", "*.md"),
+]
+SECTION_TOKENS = 400  # long sections are split into chunks of about this size
+K1 = 1.2
+B = 0.75
+
+HEADING = re.compile(r"^(#{1,6})\s+(.*)")
+TERM = re.compile(r"[a-z_][a-z0-9_]*(?:\.[a-z_][a-z0-9_]*)*")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "for", "from", "if", "in", "is", "it",
+    "line", "not", "of", "on", "or", "that", "the", "this", "to", "with", "you", "your", "we",
+}
+
+
+class Section(NamedTuple):
+    source: str
+    title: str
+    text: str
+    tokens: int
+
+
+def terms(text: str) -> List[str]:
+    """Lowercase words and dotted names; `ta.sma` also yields `ta` and `sma`."""
+    found: List[str] = []
+    for term in TERM.findall(text.lower()):
+        if term in STOPWORDS:
+            continue
+        found.append(term)
+        if "." in term:
+            found.extend(part for part in term.split(".") if part not in STOPWORDS)
+    return found
+
+
+def chunk_section(source: str, title: str, body: List[str]) -> List[Section]:
+    """Cuts a section's lines into chunks of about SECTION_TOKENS, only at blank lines outside code fences."""
+    chunks: List[Section] = []
+    lines: List[str] = []
+    size, in_code = 0, False
+    for number, line in enumerate(body, 1):
+        if line.startswith("```"):
+            in_code = not in_code
+        lines.append(line)
+        size += estimate_tokens(line) + 1
+        at_break = not in_code and not line.strip() and size >= SECTION_TOKENS
+        if at_break or number == len(body):
+            text = "\n".join(lines).strip()
+            if text:
+                chunks.append(Section(source, title, text, estimate_tokens(text)))
+            lines, size = [], 0
+    return chunks
+
+
+def split_sections(path: str) -> List[Section]:
+    """Splits a markdown file at its headings (outside code fences), chunking long sections."""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    source = os.path.relpath(path, ROOT)
+    sections: List[Section] = []
+    title, body, in_code = source, [], False
+    for line in lines:
+        if line.startswith("```"):
+            in_code = not in_code
+        match = HEADING.match(line) if not in_code else None
+        if match:
+            sections.extend(chunk_section(source, title, body))
+            title, body = match[2].strip().rstrip("¶").strip(), []
+        else:
+            body.append(line)
+    sections.extend(chunk_section(source, title, body))
+    return sections
+
+
+class ReferenceIndex:
+    """Okapi BM25 over reference sections."""
+
+    def __init__(self, sections: List[Section]):
+        self.sections = sections
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.lengths: List[int] = []
+        for number, section in enumerate(sections):
+            counts = Counter(terms(f"{section.title}\n{section.text}"))
+            self.lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                self.postings[term][number] = count
+        self.average_length = sum(self.lengths) / max(1, len(self.lengths))
+        total = len(sections)
+        self.idf = {
+            term: math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5)) for term, docs in self.postings.items()
+        }
+
+    @staticmethod
+    def build(patterns: Optional[List[str]] = None) -> "ReferenceIndex":
+        sections: List[Section] = []
+        for pattern in patterns or SOURCES:
+            for path in sorted(glob.glob(pattern, recursive=True)):
+                sections.extend(split_sections(path))
+        return ReferenceIndex(sections)
+
+    def search(self, query: Dict[str, float], limit: int = 20) -> List[int]:
+        """Section numbers by descending BM25 score for weighted query terms."""
+        scores: Dict[int, float] = defaultdict(float)
+        for term, weight in query.items():
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for number, count in self.postings[term].items():
+                norm = count + K1 * (1 - B + B * self.lengths[number] / self.average_length)
+                scores[number] += weight * idf * count * (K1 + 1) / norm
+        return sorted(scores, key=scores.__getitem__, reverse=True)[:limit]
+
+    def assemble(self, reason: str, code: str, budget: int) -> str:
+        """
+        Reference text for one repair: sections matching the compiler `reason` (weighted double)
+        and the names used in `code`, best first, until `budget` tokens are used.
+        """
+        query: Dict[str, float] = Counter()
+        for term in terms(code or ""):
+            query[term] = 1.0
+        for term in terms(reason or ""):
+            query[term] = 2.0
+        parts: List[str] = []
+        used = 0
+        for number in self.search(query):
+            section = self.sections[number]
+            if used + section.tokens > budget:
+                continue
+            parts.append(f"## {section.title} ({section.source})\n\n{section.text}")
+            used += section.tokens
+        return "\n\n".join(parts)
+
+
+_INDEX: Optional[ReferenceIndex] = None
+_INDEX_LOCK = threading.Lock()
+
+
+def default_index() -> ReferenceIndex:
+    """The index over SOURCES, built on first use; repair workers asking at once wait for one build."""
+    global _INDEX
+    with _INDEX_LOCK:
+        if _INDEX is None:
+            _INDEX = ReferenceIndex.build()
+        return _INDEX
+
+
+def retrieve_reference(reason: str, code: str, budget: int) -> str:
+    return default_index().assemble(reason, code, budget)
+
+
+def prompt_size_report(items: List[Dict[str, str]], budget: int) -> Dict[str, float]:
+    """Average repair prompt size with the full PINE_REFERENCE vs. retrieved sections, over failed items."""
+    from openai_dataset_tool import repair_messages
+    from tokens import estimate_message_tokens
+
+    full = retrieved = 0
+    for item in items:
+        args = (item["instruction"], item["completion"], item["error"])
+        full += estimate_message_tokens(repair_messages(*args, reference_budget=0))
+        retrieved += estimate_message_tokens(repair_messages(*args, reference_budget=budget))
+    count = max(1, len(items))
+    return {
+        "items": len(items),
+        "full_tokens": full / count,
+        "retrieved_tokens": retrieved / count,
+        "reduction": 1 - retrieved / full if full else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    from storage import Store
+
+    parser = argparse.ArgumentParser(description="Query the reference index, or report prompt-size savings.")
+    parser.add_argument("--reason", help="compiler error to retrieve reference sections for")
+    parser.add_argument("--code", default="", help="file with the failing script")
+    parser.add_argument("--budget", type=int, default=1500, help="reference tokens per prompt")
+    parser.add_argument("--report", metavar="DB", help="report average prompt sizes over a store's Failed/Unfixable items")
+    args = parser.parse_args()
+
+    if args.report:
+        store = Store(args.report)
+        items = list(store.rows("failed")) + list(store.rows("unfixable"))
+        print(prompt_size_report(items, args.budget))
+    else:
+        code = open(args.code, encoding="utf-8").read() if args.code else ""
+        print(retrieve_reference(args.reason or "", code, args.budget))
@@ -0,0 +1,234 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional
+
+from metrics import METRICS
+from storage import InstructionQueue, Store
+from tokens import estimate_message_tokens, estimate_tokens
+
+# Keeps N LLM repairs in flight under requests/minute and tokens/minute limits,
+# pipelining each completion straight into a compile check. Scripts the deterministic
+# fixes in autofix.py can repair are recompiled without an LLM call at all.
+# The LLM, the prompt and the compile check are passed in, so the scheduler runs the same
+# against OpenAI + pine-facade or against the fakes in mock_pine_facade.py.
+
+MAX_TRIES = 3  # repairs attempted per item before it goes to Unfixable
+REPORT_EVERY = 30.0  # seconds between progress lines
+
+
+class Budget:
+    """
+    Sliding one-minute window over requests and tokens.
+    `acquire` blocks until one more request of `tokens` fits under both limits.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, window: float = 60.0):
+        if requests_per_minute <= 0:
+            raise ValueError(f"requests_per_minute must be positive, not {requests_per_minute}")
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = window
+        self._spent: Deque[List[float]] = deque()  # [timestamp, tokens]
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        while self._spent and now - self._spent[0][0] >= self.window:
+            self._tokens -= self._spent.popleft()[1]
+
+    def acquire(self, tokens: int) -> List[float]:
+        """Waits for room and books `tokens`; returns the booking so `settle` can correct it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._expire(now)
+                fits_requests = len(self._spent) < self.requests_per_minute
+                # a request bigger than the whole budget still goes out, on an empty window
+                fits_tokens = self._tokens + tokens <= self.tokens_per_minute or not self._spent
+                if fits_requests and fits_tokens:
+                    booking = [now, float(tokens)]
+                    self._spent.append(booking)
+                    self._tokens += tokens
+                    return booking
+                delay = self.window - (now - self._spent[0][0])
+            time.sleep(max(0.01, delay))
+
+    def settle(self, booking: List[float], tokens: int):
+        """Replaces an estimate with the tokens the API actually reported."""
+        with self._lock:
+            if booking in self._spent:
+                self._tokens += tokens - booking[1]
+            booking[1] = float(tokens)
+
+
+class Outcome(NamedTuple):
+    item: Dict[str, Any]
+    corrected: Optional[str]
+    response: Dict[str, Any]  # compile response, empty if it could not be checked
+    tokens: int
+    error: Optional[str]  # a step that raised; the item stays in Failed
+    autofixed: bool = False  # repaired without the LLM
+    stage: str = "llm"  # which step `error` comes from: "llm", or "check" for autofix, parsing and compiling
+
+
+class RepairScheduler:
+    """Repairs the store's Failed queue with `workers` LLM calls in flight."""
+
+    def __init__(
+        self,
+        store: Store,
+        complete: Callable[[List[Dict[str, str]]], Any],
+        build_messages: Callable[[str, str, str], List[Dict[str, str]]],
+        parse: Callable[[Any], str],
+        check: Callable[[str], Dict[str, Any]],
+        workers: int = 4,
+        requests_per_minute: int = 60,
+        tokens_per_minute: int = 90_000,
+        autofix: Optional[Callable[[str, Optional[str]], Optional[str]]] = None,
+    ):
+        """Sets up the scheduler.
+
+        :param store: The dataset; only this scheduler's thread writes to it.
+        :param complete: Sends chat messages to the LLM and returns its response.
+        :param build_messages: Builds the repair prompt from instruction, code and compiler error.
+        :param parse: Extracts the corrected code from an LLM response.
+        :param check: Compile-checks a script, returning the compiler response ({} if it could not).
+        :param workers: Repairs kept in flight.
+        :param requests_per_minute: LLM request limit.
+        :param tokens_per_minute: LLM token limit, prompt and completion together.
+        :param autofix: Rewrites a script given its compiler error, None if it changed nothing;
+            tried (and compiled) before the LLM is asked.
+        """
+        self.store = store
+        self.complete = complete
+        self.build_messages = build_messages
+        self.parse = parse
+        self.check = check
+        self.autofix = autofix
+        self.workers = workers
+        self.budget = Budget(requests_per_minute, tokens_per_minute)
+        self.stats = {"fixed": 0, "autofixed": 0, "retried": 0, "unfixable": 0, "unchecked": 0, "llm_errors": 0, "check_errors": 0, "tokens": 0}
+        self._started = 0.0
+        self._reported = 0.0
+
+    def repair(self, item: Dict[str, Any]) -> Outcome:
+        """One repair, run on a worker: try the local fixes, else wait for budget, ask the LLM, compile its answer."""
+        code, error = item["completion"], item["error"]
+        if self.autofix is not None:
+            try:
+                fixed = self.autofix(code or "", error)
+                response = self.check(fixed) if fixed is not None else {}
+            except Exception as failure:  # compile endpoint down after the transport's retries
+                return Outcome(item, None, {}, 0, f"{type(failure).__name__}: {failure}", stage="check")
+            if fixed is not None:
+                if response.get("success") is True:
+                    return Outcome(item, fixed, response, 0, None, autofixed=True)
+                if response:  # the LLM starts from the partly fixed script and its new error
+                    code, error = fixed, response.get("reason")
+        messages = self.build_messages(item["instruction"], code, error)
+        expected = estimate_message_tokens(messages) + estimate_tokens(code or "")
+        booking = self.budget.acquire(expected)
+        try:
+            with METRICS.timer("llm_seconds"):
+                response = self.complete(messages)
+        except Exception as error:  # rate limits, timeouts, API errors: leave the item for the next run
+            METRICS.count("llm_requests_total", result="error")
+            return Outcome(item, None, {}, 0, f"{type(error).__name__}: {error}")
+        usage = response.get("usage") or {}
+        tokens = usage.get("total_tokens") or expected
+        METRICS.count("llm_requests_total", result="ok")
+        METRICS.count("llm_tokens_total", usage.get("prompt_tokens", 0), kind="prompt")
+        METRICS.count("llm_tokens_total", usage.get("completion_tokens", 0), kind="completion")
+        self.budget.settle(booking, tokens)
+        try:
+            corrected = self.parse(response)
+            checked = self.check(corrected)
+        except Exception as failure:  # a malformed completion, or the compile endpoint down
+            return Outcome(item, None, {}, tokens, f"{type(failure).__name__}: {failure}", stage="check")
+        return Outcome(item, corrected, checked, tokens, None)
+
+    def run(self) -> Dict[str, Any]:
+        """Works through Failed until every item is fixed, unfixable or could not be checked."""
+        queue = InstructionQueue(self.store.rows("failed"))
+        in_flight: Dict[Future, Dict[str, Any]] = {}
+        self._started = self._reported = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while queue or in_flight:
+                while queue and len(in_flight) < self.workers:
+                    item = queue.popleft()
+                    in_flight[pool.submit(self.repair, item)] = item
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del in_flight[future]
+                    retry = self.record(future.result())
+                    if retry is not None:
+                        queue.push(retry)
+                METRICS.gauge("repair_queue", len(queue))
+                METRICS.gauge("repair_in_flight", len(in_flight))
+                self.report(queue, in_flight)
+        self.report(queue, in_flight, final=True)
+        return self.stats
+
+    def record(self, outcome: Outcome) -> Optional[Dict[str, Any]]:
+        """Writes one outcome to the store; returns the item if it should be tried again."""
+        item = outcome.item
+        instruction = item["instruction"]
+        self.stats["tokens"] += outcome.tokens
+        if outcome.error:
+            self.stats[f"{outcome.stage}_errors"] += 1
+            print(f"\n{'LLM' if outcome.stage == 'llm' else 'Check'} error, left in Failed: {outcome.error}\n")
+            return None
+        if not outcome.response:
+            self.stats["unchecked"] += 1
+            METRICS.count("repair_attempts_total", trycount=item["trycount"], result="unchecked")
+            self.store.drop_failed(instruction)
+            return None
+
+        success = outcome.response.get("success")
+        print("\n===================\n")
+        print(f"Compiled: {success}")
+        print("\n===================\n")
+
+        tries = item["trycount"]
+        if success is True:
+            self.stats["fixed"] += 1
+            self.stats["autofixed"] += outcome.autofixed
+            METRICS.count("repair_attempts_total", trycount=tries, result="autofixed" if outcome.autofixed else "fixed")
+            self.store.mark_successful(instruction, outcome.corrected)
+            return None
+
+        retry = dict(item, completion=outcome.corrected, error=outcome.response.get("reason"), trycount=tries + 1)
+
+        print(f"\nFAIL\n=====\nInstruction: {instruction}")
+        print(f"- Failed :\n {outcome.corrected}")
+        print(f"- Error :\n  {retry['error']}")
+        print(f"- Tries :\n  {tries}")
+        print("=========\n")
+
+        if tries + 1 >= MAX_TRIES:
+            print("Too many tries")
+            self.stats["unfixable"] += 1
+            METRICS.count("repair_attempts_total", trycount=tries, result="unfixable")
+            self.store.mark_unfixable(retry)
+            return None
+        self.stats["retried"] += 1
+        METRICS.count("repair_attempts_total", trycount=tries, result="retried")
+        self.store.mark_failed(retry)  # back of the queue
+        return retry
+
+    def fixed_per_minute(self) -> float:
+        elapsed = max(1e-9, time.monotonic() - self._started)
+        return self.stats["fixed"] / elapsed * 60
+
+    def report(self, queue: InstructionQueue, in_flight: Dict[Future, Dict[str, Any]], final: bool = False):
+        now = time.monotonic()
+        if not final and now - self._reported < REPORT_EVERY:
+            return
+        self._reported = now
+        print(
+            f"repair: {self.stats['fixed']} fixed ({self.stats['autofixed']} locally), {self.stats['retried']} retried, "
+            f"{self.stats['unfixable']} unfixable, {len(queue)} queued, {len(in_flight)} in flight, "
+            f"{self.stats['tokens']} tokens, {self.fixed_per_minute():.1f} fixed/min"
+        )
@@ -0,0 +1,284 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# SQLite (WAL) home for the dataset that used to live in db.json.
+# Every state change is one small transaction on an indexed table, instead of a rewrite of the whole file.
+
+# Configuration
+DB_FILE = "db.sqlite"
+LEGACY_DB_FILE = "db.json"
+
+# db.json list name -> table name, and the columns each table carries
+TABLES = {
+    "PINE": "pine",
+    "Successful": "successful",
+    "Failed": "failed",
+    "Unfixable": "unfixable",
+}
+COLUMNS = {
+    "pine": ["instruction", "completion"],
+    "successful": ["instruction", "completion"],
+    "failed": ["instruction", "completion", "error", "trycount"],
+    "unfixable": ["instruction", "completion", "error", "trycount"],
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pine (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    instruction TEXT NOT NULL,
+    completion TEXT
+);
+CREATE TABLE IF NOT EXISTS successful (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    instruction TEXT NOT NULL,
+    completion TEXT
+);
+CREATE TABLE IF NOT EXISTS failed (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    instruction TEXT NOT NULL,
+    completion TEXT,
+    error TEXT,
+    trycount INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS unfixable (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    instruction TEXT NOT NULL,
+    completion TEXT,
+    error TEXT,
+    trycount INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS unfixable_key ON unfixable (key);
+CREATE TABLE IF NOT EXISTS session (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def instruction_key(instruction: str) -> str:
+    """Items are identified by their instruction, this is the fixed-size key stored for it."""
+    return hashlib.sha1(instruction.encode("utf-8")).hexdigest()
+
+
+class InstructionQueue:
+    """
+    Items in insertion order, keyed by instruction hash.
+    Push, popleft, membership tests and removals are O(1), whatever the queue size.
+    """
+
+    def __init__(self, items: Iterable[Dict[str, Any]] = ()):
+        self._items: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        for item in items:
+            self.push(item)
+
+    def push(self, item: Dict[str, Any]):
+        """Adds an item at the back; an item already queued for the same instruction is moved there."""
+        key = instruction_key(item["instruction"])
+        self._items.pop(key, None)
+        self._items[key] = item
+
+    def popleft(self) -> Dict[str, Any]:
+        return self._items.popitem(last=False)[1]
+
+    def discard(self, instruction: str):
+        self._items.pop(instruction_key(instruction), None)
+
+    def get(self, instruction: str) -> Optional[Dict[str, Any]]:
+        return self._items.get(instruction_key(instruction))
+
+    def __contains__(self, instruction: str) -> bool:
+        return instruction_key(instruction) in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(list(self._items.values()))
+
+
+class Store:
+    """
+    The dataset: PINE (to check), Successful, Failed (to repair), Unfixable, and session values.
+    Meant to be used from one thread; workers hand their results back to the thread that owns it.
+    """
+
+    def __init__(self, path: str = DB_FILE):
+        """Opens (or creates) the store.
+
+        :param path: The SQLite database file.
+        """
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    # -- Session values --
+
+    def get_session(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        row = self._db.execute("SELECT value FROM session WHERE name = ?", (name,)).fetchone()
+        return row["value"] if row else default
+
+    def set_session(self, name: str, value: str):
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO session (name, value) VALUES (?, ?)", (name, value))
+
+    # -- Queues --
+
+    def count(self, table: str) -> int:
+        return self._db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def counts(self) -> Dict[str, int]:
+        return {name: self.count(table) for name, table in TABLES.items()}
+
+    def rows(self, table: str) -> Iterator[Dict[str, Any]]:
+        """Streams a table's items in insertion order."""
+        columns = ", ".join(COLUMNS[table])
+        for row in self._db.execute(f"SELECT {columns} FROM {table} ORDER BY seq"):
+            yield dict(row)
+
+    def pending(self) -> InstructionQueue:
+        """The PINE items still waiting for a compile check."""
+        return InstructionQueue(self.rows("pine"))
+
+    def add_pending(self, items: List[Dict[str, Any]]):
+        with self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO pine (key, instruction, completion) VALUES (?, ?, ?)",
+                [(instruction_key(i["instruction"]), i["instruction"], i.get("completion")) for i in items],
+            )
+
+    def prune_pending(self) -> int:
+        """Drops PINE items that already have a Successful entry, returning how many went."""
+        with self._db:
+            return self._db.execute("DELETE FROM pine WHERE key IN (SELECT key FROM successful)").rowcount
+
+    def mark_successful(self, instruction: str, completion: str):
+        """Moves an item to Successful, out of PINE and Failed, in one transaction."""
+        key = instruction_key(instruction)
+        with self._db:
+            self._db.execute("DELETE FROM pine WHERE key = ?", (key,))
+            self._db.execute("DELETE FROM failed WHERE key = ?", (key,))
+            self._db.execute(
+                "INSERT OR REPLACE INTO successful (key, instruction, completion) VALUES (?, ?, ?)",
+                (key, instruction, completion),
+            )
+
+    def mark_failed(self, item: Dict[str, Any]):
+        """Puts an item at the back of the Failed queue, replacing an earlier entry for its instruction."""
+        key = instruction_key(item["instruction"])
+        with self._db:
+            self._db.execute("DELETE FROM failed WHERE key = ?", (key,))
+            self._db.execute(
+                "INSERT INTO failed (key, instruction, completion, error, trycount) VALUES (?, ?, ?, ?, ?)",
+                (key, item["instruction"], item.get("completion"), _text(item.get("error")), item.get("trycount", 0)),
+            )
+
+    def mark_unfixable(self, item: Dict[str, Any]):
+        """Moves an item from Failed to Unfixable."""
+        key = instruction_key(item["instruction"])
+        with self._db:
+            self._db.execute("DELETE FROM failed WHERE key = ?", (key,))
+            self._db.execute(
+                "INSERT INTO unfixable (key, instruction, completion, error, trycount) VALUES (?, ?, ?, ?, ?)",
+                (key, item["instruction"], item.get("completion"), _text(item.get("error")), item.get("trycount", 0)),
+            )
+
+    def drop_failed(self, instruction: str):
+        """Takes an item off the Failed queue; it stays in PINE, so the next check_loop picks it up again."""
+        with self._db:
+            self._db.execute("DELETE FROM failed WHERE key = ?", (instruction_key(instruction),))
+
+    def next_failed(self) -> Optional[Dict[str, Any]]:
+        """The item at the front of the Failed queue, left in place until it is marked or dropped."""
+        columns = ", ".join(COLUMNS["failed"])
+        row = self._db.execute(f"SELECT {columns} FROM failed ORDER BY seq LIMIT 1").fetchone()
+        return dict(row) if row else None
+
+    # -- db.json import / export --
+
+    def import_json(self, path: str = LEGACY_DB_FILE):
+        """Loads a db.json into the store in one transaction; items already present are kept."""
+        with open(path, "r") as f:
+            legacy = json.load(f)
+        with self._db:
+            for name, value in legacy.items():
+                table = TABLES.get(name)
+                if table is None:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO session (name, value) VALUES (?, ?)", (name, _text(value))
+                    )
+                    continue
+                columns = COLUMNS[table]
+                conflict = "" if table == "unfixable" else " OR IGNORE"
+                placeholders = ", ".join("?" * (len(columns) + 1))
+                self._db.executemany(
+                    f"INSERT{conflict} INTO {table} (key, {', '.join(columns)}) VALUES ({placeholders})",
+                    [[instruction_key(item["instruction"])] + [_column(item, c) for c in columns] for item in value],
+                )
+
+    def export_json(self, path: str = LEGACY_DB_FILE):
+        """Writes the store out in the db.json layout, one item at a time, then swaps the file in."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("{")
+            for index, (name, table) in enumerate(TABLES.items()):
+                f.write(f"{', ' if index else ''}{json.dumps(name)}: [")
+                for position, item in enumerate(self.rows(table)):
+                    f.write(f"{', ' if position else ''}{json.dumps(item)}")
+                f.write("]")
+            for row in self._db.execute("SELECT name, value FROM session ORDER BY name"):
+                f.write(f", {json.dumps(row['name'])}: {json.dumps(row['value'])}")
+            f.write("}")
+        os.replace(tmp_path, path)
+
+
+def _text(value: Any) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+def _column(item: Dict[str, Any], column: str) -> Any:
+    if column == "trycount":
+        return item.get(column, 0)
+    return _text(item.get(column))
+
+
+def open_store(path: str = DB_FILE, legacy_path: str = LEGACY_DB_FILE) -> Store:
+    """Opens the store, importing a legacy db.json the first time the database is created."""
+    is_new = not os.path.isfile(path)
+    store = Store(path)
+    if is_new and os.path.isfile(legacy_path):
+        print(f"Importing {legacy_path} into {path}")
+        store.import_json(legacy_path)
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move the dataset between db.json and the SQLite store.")
+    parser.add_argument("command", choices=["import", "export", "counts"])
+    parser.add_argument("--json", default=LEGACY_DB_FILE, help="db.json file to read or write")
+    parser.add_argument("--db", default=DB_FILE, help="SQLite store")
+    args = parser.parse_args()
+
+    store = Store(args.db)
+    if args.command == "import":
+        store.import_json(args.json)
+    elif args.command == "export":
+        store.export_json(args.json)
+    print(store.counts())
+    store.close()
@@ -0,0 +1,293 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from corpus_store import CorpusStore
+from pine_lint import Line, lex
+
+# Inverted index over the downloaded corpus: which scripts use which builtin calls, names,
+# keywords, declared types and declaration kinds. Each script is lexed once (pine_lint's lexer)
+# and re-lexed only when its content changes, so re-running after a sync only reads new downloads.
+# Terms are `<kind>:<text>`, e.g. `call:ta.macd`, `type:array<float>`, `declaration:library`.
+
+# Configuration
+INDEX_FILE = "symbols.sqlite"
+TREE_ROOT = "scripts"
+
+KEYWORDS = {
+    "if", "else", "for", "to", "by", "in", "while", "switch", "var", "varip", "type", "method", "export",
+    "import", "as", "and", "or", "not", "continue", "break", "true", "false", "na",
+}
+DECLARATIONS = {"indicator", "library", "strategy"}
+GENERIC_TYPES = {"array", "matrix", "map"}
+TERM_KINDS = ("call", "name", "keyword", "declaration", "type", "udt", "function", "import")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scripts (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    sha256 TEXT NOT NULL,
+    stamp TEXT NOT NULL DEFAULT ''  -- size and mtime of a tree file, so unchanged files are not even read
+);
+CREATE TABLE IF NOT EXISTS terms (
+    id INTEGER PRIMARY KEY,
+    term TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term INTEGER NOT NULL,
+    script INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (term, script)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_by_script ON postings (script);
+"""
+
+
+def extract_terms(source: str) -> Counter:
+    """Counts the index terms in one script."""
+    found: Counter = Counter()
+    for line in lex(source):
+        _line_terms(line, found)
+    return found
+
+
+def _line_terms(line: Line, found: Counter):
+    tokens = line.tokens
+    texts = [token.text for token in tokens]
+    if not texts:
+        return
+    position = 0
+    while position < len(tokens):
+        token = tokens[position]
+        if token.kind != "name":
+            position += 1
+            continue
+        # join dotted names: ta . macd -> ta.macd
+        end = position + 1
+        while end + 1 < len(tokens) and texts[end] == "." and tokens[end + 1].kind == "name":
+            end += 2
+        name = "".join(texts[position:end])
+        following = texts[end] if end < len(texts) else None
+        if name in KEYWORDS:
+            found[f"keyword:{name}"] += 1
+        elif following == "(":
+            found[f"call:{name}"] += 1
+        elif following == "<" and name in GENERIC_TYPES:
+            close = texts.index(">", end) if ">" in texts[end:] else None
+            if close is not None:
+                found[f"type:{''.join(texts[position:close + 1])}"] += 1
+        else:
+            found[f"name:{name}"] += 1
+        position = end
+
+    # statement shapes, from the start of the line
+    head = texts[1:] if texts[0] == "export" else texts
+    if line.indent == 0 and head and head[0] in DECLARATIONS and head[1:2] == ["("]:
+        found[f"declaration:{head[0]}"] += 1
+    elif head[:1] == ["type"] and len(head) == 2:
+        found[f"udt:{head[1]}"] += 1
+    elif head[:1] == ["import"] and len(head) >= 4:
+        found[f"import:{''.join(head[1:4])}"] += 1
+    elif line.indent == 0 and head[:1] == ["method"] and _is_definition(head[2:]):
+        found["function:method"] += 1
+    elif line.indent == 0 and _is_definition(head[1:]):
+        found["function:user"] += 1
+
+
+def _is_definition(rest: List[str]) -> bool:
+    """`( params ) =>` after a function name, whether the body follows on the same line or not."""
+    if rest[:1] != ["("]:
+        return False
+    depth = 0
+    for position, text in enumerate(rest):
+        depth += text in ("(", "[")
+        depth -= text in (")", "]")
+        if depth == 0:
+            return rest[position + 1 : position + 2] == ["=>"]
+    return False
+
+
+class SymbolIndex:
+    """Term -> scripts postings in SQLite; one thread at a time."""
+
+    def __init__(self, path: str = INDEX_FILE):
+        """Opens (or creates) the index.
+
+        :param path: The SQLite file.
+        """
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._term_ids: Dict[str, int] = dict(
+            (term, term_id) for term_id, term in self._db.execute("SELECT id, term FROM terms")
+        )
+
+    def close(self):
+        self._db.close()
+
+    # -- Updating --
+
+    def _term_id(self, term: str) -> int:
+        term_id = self._term_ids.get(term)
+        if term_id is None:
+            term_id = self._db.execute("INSERT INTO terms (term) VALUES (?)", (term,)).lastrowid
+            self._term_ids[term] = term_id
+        return term_id
+
+    def _known(self, key: str) -> Optional[Tuple[int, str, str]]:
+        return self._db.execute("SELECT id, sha256, stamp FROM scripts WHERE key = ?", (key,)).fetchone()
+
+    def add(self, key: str, source: str, stamp: str = "") -> bool:
+        """Indexes one script (replacing what was indexed under `key`); False if its content is unchanged."""
+        digest = hashlib.sha256(source.encode("utf-8")).hexdigest()
+        known = self._known(key)
+        if known is not None and known[1] == digest:
+            if known[2] != stamp:
+                self._db.execute("UPDATE scripts SET stamp = ? WHERE id = ?", (stamp, known[0]))
+            return False
+        if known is not None:
+            self._db.execute("DELETE FROM postings WHERE script = ?", (known[0],))
+            self._db.execute("UPDATE scripts SET sha256 = ?, stamp = ? WHERE id = ?", (digest, stamp, known[0]))
+            script_id = known[0]
+        else:
+            script_id = self._db.execute(
+                "INSERT INTO scripts (key, sha256, stamp) VALUES (?, ?, ?)", (key, digest, stamp)
+            ).lastrowid
+        self._db.executemany(
+            "INSERT INTO postings (term, script, count) VALUES (?, ?, ?)",
+            [(self._term_id(term), script_id, count) for term, count in extract_terms(source).items()],
+        )
+        return True
+
+    def remove(self, key: str):
+        known = self._known(key)
+        if known is not None:
+            self._db.execute("DELETE FROM postings WHERE script = ?", (known[0],))
+            self._db.execute("DELETE FROM scripts WHERE id = ?", (known[0],))
+
+    def index_tree(self, root: str = TREE_ROOT) -> Dict[str, int]:
+        """
+        Brings the index up to date with a scripts/ mirror: new and changed .pine files are lexed,
+        files whose size and mtime are unchanged are skipped unread, deleted files are dropped.
+        """
+        stats = {"indexed": 0, "unchanged": 0, "removed": 0}
+        seen = set()
+        with self._db:
+            stamps = dict(self._db.execute("SELECT key, stamp FROM scripts"))
+            for directory, subdirectories, files in os.walk(root):
+                subdirectories[:] = sorted(d for d in subdirectories if not d.startswith("."))
+                for filename in sorted(files):
+                    if not filename.endswith(".pine"):
+                        continue
+                    path = os.path.join(directory, filename)
+                    key = os.path.relpath(path, root)
+                    seen.add(key)
+                    status = os.stat(path)
+                    stamp = f"{status.st_size}:{status.st_mtime_ns}"
+                    if stamps.get(key) == stamp:
+                        stats["unchanged"] += 1
+                        continue
+                    with open(path, encoding="utf-8") as f:
+                        changed = self.add(key, f.read(), stamp)
+                    stats["indexed" if changed else "unchanged"] += 1
+            for key in set(stamps) - seen:
+                if stamps[key]:  # only keys that came from a tree
+                    self.remove(key)
+                    stats["removed"] += 1
+        return stats
+
+    def index_scripts(self, scripts: Iterable[Tuple[str, str]]) -> Dict[str, int]:
+        """
+        Brings the index up to date with every (key, source) pair of a corpus, e.g. a CorpusStore:
+        unchanged content is skipped, and keys the corpus no longer has (superseded versions) are dropped.
+        """
+        stats = {"indexed": 0, "unchanged": 0, "removed": 0}
+        seen = set()
+        with self._db:
+            stamps = dict(self._db.execute("SELECT key, stamp FROM scripts"))
+            for key, source in scripts:
+                seen.add(key)
+                stats["indexed" if self.add(key, source) else "unchanged"] += 1
+            for key in set(stamps) - seen:
+                if not stamps[key]:  # only keys that came from a corpus, not a tree
+                    self.remove(key)
+                    stats["removed"] += 1
+        return stats
+
+    # -- Queries --
+
+    def search(self, terms: List[str], limit: Optional[int] = None) -> List[str]:
+        """Keys of the scripts containing every term, most total uses first."""
+        term_ids = [self._term_ids.get(term) for term in terms]
+        if not term_ids or None in term_ids:
+            return []
+        placeholders = ", ".join("?" * len(term_ids))
+        rows = self._db.execute(
+            f"""SELECT s.key FROM postings p JOIN scripts s ON s.id = p.script
+                WHERE p.term IN ({placeholders})
+                GROUP BY p.script HAVING COUNT(*) = ?
+                ORDER BY SUM(p.count) DESC, s.key
+                LIMIT ?""",
+            (*term_ids, len(term_ids), -1 if limit is None else limit),
+        )
+        return [row[0] for row in rows]
+
+    def frequencies(self, kind: Optional[str] = None, limit: Optional[int] = None) -> List[Tuple[str, int, int]]:
+        """(term, scripts using it, total uses), most widely used first; e.g. weights for the generator."""
+        rows = self._db.execute(
+            """SELECT t.term, COUNT(*), SUM(p.count) FROM postings p JOIN terms t ON t.id = p.term
+               WHERE ? IS NULL OR t.term LIKE ? || ':%'
+               GROUP BY p.term ORDER BY COUNT(*) DESC, t.term LIMIT ?""",
+            (kind, kind, -1 if limit is None else limit),
+        )
+        return [tuple(row) for row in rows]
+
+    def terms_of(self, key: str) -> Dict[str, int]:
+        rows = self._db.execute(
+            """SELECT t.term, p.count FROM postings p JOIN terms t ON t.id = p.term
+               JOIN scripts s ON s.id = p.script WHERE s.key = ? ORDER BY t.term""",
+            (key,),
+        )
+        return dict(rows)
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM scripts").fetchone()[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index the downloaded Pine corpus by symbol, and query it.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    update = subcommands.add_parser("update", help="index new and changed scripts")
+    update.add_argument("--root", default=TREE_ROOT, help="scripts/ mirror to index")
+    update.add_argument("--pack", help="index a corpus_store.py pack instead")
+    find = subcommands.add_parser("find", help="scripts using every term, e.g. call:ta.macd keyword:type")
+    find.add_argument("terms", nargs="+")
+    find.add_argument("--limit", type=int, default=50)
+    top = subcommands.add_parser("top", help="most widely used terms")
+    top.add_argument("kind", nargs="?", choices=TERM_KINDS)
+    top.add_argument("--limit", type=int, default=30)
+    parser.add_argument("--index", default=INDEX_FILE)
+    args = parser.parse_args()
+
+    index = SymbolIndex(args.index)
+    started = time.perf_counter()
+    if args.command == "update":
+        if args.pack:
+            store = CorpusStore(args.pack)
+            print(index.index_scripts((script.key, script.source) for script in store))
+            store.close()
+        else:
+            print(index.index_tree(args.root))
+    elif args.command == "find":
+        for key in index.search(args.terms, args.limit):
+            print(key)
+    else:
+        for term, scripts, uses in index.frequencies(args.kind, args.limit):
+            print(f"{scripts:>8} {uses:>9}  {term}")
+    print(f"({len(index)} scripts indexed, {1000 * (time.perf_counter() - started):.1f} ms)")
+    index.close()
@@ -0,0 +1,35 @@
+import unittest
+
+from autofix import autofix
+
+HEADER = '//@version=5\nindicator("x")\n'
+
+
+class BraceTest(unittest.TestCase):
+    def test_block_braces_are_removed(self):
+        result = autofix(HEADER + "if close > open {\n    plot(close)\n}")
+        self.assertEqual(result.source, HEADER + "if close > open\n    plot(close)")
+        self.assertTrue(result.clean)
+
+    def test_brace_closing_a_literal_is_kept(self):
+        source = HEADER + 'm = {\n    "a": 1\n}\nif close > open {\n    plot(close)\n}'
+        result = autofix(source)
+        self.assertEqual(result.source, HEADER + 'm = {\n    "a": 1\n}\nif close > open\n    plot(close)')
+        self.assertFalse(result.clean)
+
+
+class ListTest(unittest.TestCase):
+    def test_list_becomes_array_from(self):
+        result = autofix(HEADER + "x = [1, 2]\nplot(close)")
+        self.assertEqual(result.source, HEADER + "x = array.from(1, 2)\nplot(close)")
+        self.assertTrue(result.clean)
+
+    def test_nested_list_is_left_for_the_llm(self):
+        source = HEADER + "x = [1, [2, 3]]\nplot(close)"
+        result = autofix(source)
+        self.assertEqual(result.source, source)
+        self.assertFalse(result.clean)
+
+
+if __name__ == "__main__":
+    unittest.main()
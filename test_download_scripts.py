@@ -0,0 +1,65 @@
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import download_scripts
+from download_scripts import Manifest, download_script, script_paths
+
+
+def reply(text: str, status_code: int = 200) -> SimpleNamespace:
+    return SimpleNamespace(status_code=status_code, text=text)
+
+
+class VersionBumpTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)  # script_paths() are relative to the working directory
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_new_version_is_fetched_over_the_mirrored_one(self):
+        script_id_part = "PUB;abc"
+        pine_path, json_path = script_paths("Example", "PUB", "study")
+        os.makedirs(os.path.dirname(pine_path))
+        with open(pine_path, "w", encoding="utf-8") as f:
+            f.write("// version 1")
+        with open(json_path, "w", encoding="utf-8") as f:
+            f.write("{}")
+        manifest = Manifest("manifest.json")
+        manifest.record(script_id_part, "1", download_scripts.manifest_entry(pine_path, "// version 1", "{}"))
+
+        replies = [reply(json.dumps({"source": "// version 2"})), reply('{"v": 2}')]
+        with mock.patch.object(download_scripts.TRANSPORT, "get", side_effect=replies) as get:
+            entry = download_script(
+                script_id_part, "2", "Example", "PUB", "study", None,
+                adopt=script_id_part not in manifest.versions,
+            )
+
+        self.assertEqual(get.call_count, 2)
+        self.assertEqual(entry["sha256"], download_scripts.content_hash("// version 2"))
+        with open(pine_path, encoding="utf-8") as f:
+            self.assertEqual(f.read(), "// version 2")
+
+    def test_unknown_script_adopts_the_local_files(self):
+        pine_path, json_path = script_paths("Example", "PUB", "study")
+        os.makedirs(os.path.dirname(pine_path))
+        with open(pine_path, "w", encoding="utf-8") as f:
+            f.write("// mirrored")
+        with open(json_path, "w", encoding="utf-8") as f:
+            f.write("{}")
+
+        with mock.patch.object(download_scripts.TRANSPORT, "get") as get:
+            entry = download_script("PUB;abc", "1", "Example", "PUB", "study", None, adopt=True)
+
+        get.assert_not_called()
+        self.assertEqual(entry["sha256"], download_scripts.content_hash("// mirrored"))
+
+
+if __name__ == "__main__":
+    unittest.main()
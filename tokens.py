@@ -0,0 +1,26 @@
+import re
+from typing import Dict, List
+
+# Local, approximate token counting for budgeting prompts and sizing exports without a tokenizer download.
+# It follows how BPE vocabularies split code and English: a word with its leading space is one token
+# (long words a few more), every punctuation mark one, and runs of newlines/indentation one each.
+# Close enough for budgets and length buckets; not a substitute for the real tokenizer's exact counts.
+
+PIECE = re.compile(r" ?[A-Za-z]+| ?\d{1,3}|\s+|[^\sA-Za-z\d]")
+LONG_WORD = 8  # letters per token past the first, for long identifiers
+MESSAGE_OVERHEAD = 4  # role and separators per chat message
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of `text`."""
+    count = 0
+    for piece in PIECE.findall(text):
+        count += 1
+        if len(piece) > LONG_WORD and piece[-1].isalpha():
+            count += (len(piece) - 1) // LONG_WORD
+    return count
+
+
+def estimate_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """Approximate prompt tokens of a chat request."""
+    return sum(estimate_tokens(message["content"]) + MESSAGE_OVERHEAD for message in messages) + 2
@@ -0,0 +1,175 @@
+import random
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Shared HTTP layer for the TradingView tools: one pooled keep-alive session,
+# per-call deadlines, retries with jittered exponential backoff, and counters.
+
+# Configuration
+POOL_SIZE = 16  # keep-alive connections kept per host
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 30.0
+DEADLINE = 120.0  # total seconds one call may take, retries included
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """
+    Spaces out calls so they stay under `rate` per second, shared across threads.
+    Halves the rate when the server pushes back (429 / 5xx), and creeps back up on success.
+    """
+
+    def __init__(self, rate: float, min_rate: float = 0.25, max_rate: Optional[float] = None):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate or rate * 4
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+    def throttle(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            # push the next slot out as well, so calls already queued back off too
+            self._next = max(self._next, time.monotonic()) + 1.0 / self.rate
+
+    def relax(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + 0.1)
+
+
+class Transport:
+    """A pooled `requests.Session` with deadlines, retries and traffic counters, safe to share across threads."""
+
+    def __init__(
+        self,
+        pool_size: int = POOL_SIZE,
+        timeout: Tuple[float, float] = (CONNECT_TIMEOUT, READ_TIMEOUT),
+        deadline: float = DEADLINE,
+        retries: int = MAX_RETRIES,
+    ):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.counters: Dict[str, int] = {
+            "requests": 0,
+            "retries": 0,
+            "errors": 0,
+            "bytes_sent": 0,
+            "bytes_received": 0,
+        }
+        self._lock = threading.Lock()
+        self._jitter = random.Random()
+
+    def _count(self, **amounts: int):
+        with self._lock:
+            for name, amount in amounts.items():
+                self.counters[name] += amount
+
+    def stats(self) -> Dict[str, int]:
+        """Returns a copy of the traffic counters."""
+        with self._lock:
+            return dict(self.counters)
+
+    def backoff(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """Full-jitter exponential backoff, never shorter than a server's Retry-After."""
+        delay = self._jitter.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt))
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        return delay
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        limiter: Optional[RateLimiter] = None,
+        deadline: Optional[float] = None,
+        retries: Optional[int] = None,
+        **kwargs: Any,
+    ) -> requests.Response:
+        """
+        Sends a request through the shared pool, retrying connection errors, timeouts and
+        RETRY_STATUSES replies until `retries` or the `deadline` (seconds) runs out.
+        The last response is returned as-is once retries are exhausted; a last network error is raised.
+        """
+        budget = self.deadline if deadline is None else deadline
+        retries = self.retries if retries is None else retries
+        timeout = kwargs.pop("timeout", self.timeout)
+        if timeout is None:  # no timeout of its own: the deadline still bounds each attempt
+            timeout = float("inf")
+        if isinstance(timeout, (int, float)):  # requests takes one number for both
+            timeout = (timeout, timeout)
+        connect_timeout, read_timeout = timeout
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            if limiter:
+                limiter.wait()
+            remaining = max(0.1, budget - (time.monotonic() - started))
+            timeout = (min(connect_timeout, remaining), min(read_timeout, remaining))
+            response, error = None, None
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                error = exc
+            self._count_traffic(response, kwargs.get("stream", False))
+
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                if limiter:
+                    limiter.relax()
+                return response
+            if limiter:
+                limiter.throttle()
+
+            delay = self.backoff(attempt, response)
+            if attempt >= retries or time.monotonic() - started + delay > budget:
+                if response is None:
+                    raise error
+                return response
+            if response is not None:
+                response.close()  # hands a streamed reply's connection back to the pool
+            self._count(retries=1)
+            time.sleep(delay)
+            attempt += 1
+
+    def _count_traffic(self, response: Optional[requests.Response], streamed: bool):
+        if response is None:
+            self._count(requests=1, errors=1)
+            return
+        body = response.request.body or b""
+        sent = len(body.encode("utf-8") if isinstance(body, str) else body)
+        if streamed:
+            # the caller reads the body, so trust the header rather than reading it here
+            received = int(response.headers.get("Content-Length", 0))
+        else:
+            received = len(response.content)
+        self._count(requests=1, bytes_sent=sent, bytes_received=received)
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+
+# the one pool both tools go through
+TRANSPORT = Transport()